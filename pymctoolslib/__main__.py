@@ -0,0 +1,125 @@
+# PyMCToolsLib
+#
+#    Copyright (C) 2014 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Command line tools for Minecraft worlds
+
+Usage: python -m pymctoolslib [--world WORLD] COMMAND [ARGS...]
+"""
+
+import sys
+import logging
+
+from .pymctoolslib import (basic_parser, World, MCError,
+                           _EXPORT_COLUMNS, _EXPORT_WRITERS)
+
+
+log = logging.getLogger(__package__)
+
+
+
+
+def add_area_arguments(parser):
+    """Dimension and area arguments, as in World.map_chunks()"""
+    parser.add_argument('--dimension', '-d', dest='dim', type=int,
+                        help="Dimension to scan. [Default: Player's current]")
+
+    parser.add_argument('-x', type=int,
+                        help="Center X block coordinate. [Default: unbounded]")
+
+    parser.add_argument('-z', type=int,
+                        help="Center Z block coordinate. [Default: unbounded]")
+
+    parser.add_argument('--size', '-s', type=int, default=250,
+                        help="Half-side of the scanned area, in blocks."
+                            " [Default: %(default)s]")
+
+    parser.add_argument('--workers', '-j', type=int,
+                        help="Number of worker processes. [Default: 1]")
+
+
+def export(world, args):
+    world.export(args.path, kinds=args.kinds, fmt=args.fmt, dim=args.dim,
+                 x=args.x, z=args.z, size=args.size,
+                 batch_size=args.batch_size, workers=args.workers,
+                 progress=args.progress)
+
+
+def hotspots(world, args):
+    density = world.entity_density(dim=args.dim, x=args.x, z=args.z,
+                                   size=args.size, ids=args.ids,
+                                   tiles=args.tiles, workers=args.workers,
+                                   progress=args.progress)
+    log.info("%d entities in %d chunks", density.total, len(density))
+    for hotspot in density.hotspots(args.top):
+        types = ", ".join("%s: %d" % _ for _ in hotspot.types.most_common(3))
+        print("%6d  %s  %s" % (hotspot.count, hotspot.pos or hotspot.tile_pos, types))
+
+
+def parse_args(argv=None):
+    parser = basic_parser(description=__doc__.strip().split('\n')[0],
+                          player=False, progress=True)
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    cmd = commands.add_parser('export',
+                              help="Export entities, villager offers, container"
+                                  " items and player inventories")
+    cmd.set_defaults(func=export)
+    cmd.add_argument('path', help="Output directory")
+    cmd.add_argument('--format', '-f', dest='fmt', default='ndjson',
+                     choices=list(_EXPORT_WRITERS),
+                     help="Output format. [Default: %(default)s]")
+    cmd.add_argument('--kind', '-k', dest='kinds', action='append',
+                     choices=list(_EXPORT_COLUMNS),
+                     help="Kind of rows to export, may be repeated."
+                         " [Default: all]")
+    cmd.add_argument('--batch-size', '-b', type=int, default=10000,
+                     help="Rows written per batch. [Default: %(default)s]")
+    add_area_arguments(cmd)
+
+    cmd = commands.add_parser('hotspots',
+                              help="List chunks with most entities and tile"
+                                  " entities, the usual suspects of lag")
+    cmd.set_defaults(func=hotspots)
+    cmd.add_argument('--id', '-i', dest='ids', action='append',
+                     help="Only count entities or tile entities of this ID,"
+                         " such as 'item' or 'hopper'. May be repeated."
+                         " [Default: all]")
+    cmd.add_argument('--top', '-n', type=int, default=10,
+                     help="Number of chunks to list. [Default: %(default)s]")
+    cmd.add_argument('--no-tiles', dest='tiles', action='store_false',
+                     help="Do not count tile entities.")
+    add_area_arguments(cmd)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.loglevel, format='%(levelname)s: %(message)s')
+
+    try:
+        args.func(World(args.world), args)
+    except MCError as e:
+        log.error(e)
+        return 1
+
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -39,6 +39,29 @@ __all__ = [
     "Mob",
     "Villager",
     "BookAndQuill",
+    "Container",
+    "Trade",
+    "TradeIndex",
+    "Surface",
+    "Hotspot",
+    "EntityDensity",
+    "RegionFile",
+    "ChunkMap",
+    "ChunkSelection",
+    "ChunkDiff",
+    "EntityChange",
+    "ChunkCache",
+    "ScanCheckpoint",
+    "TextHit",
+    "TextIndex",
+    "BackupStore",
+    "Progress",
+    "ConsoleProgress",
+    "LogProgress",
+    "FileProgress",
+    "PROGRESS_SINKS",
+    "TransformResult",
+    "PlayerEdit",
     "World",
     "basic_parser",
     "save_world",
@@ -51,19 +74,37 @@ __all__ = [
 ]
 
 
+import os
 import os.path as osp
+import abc
 import argparse
+import binascii
 import logging
+import math
 import time
 import collections
+import functools
+import gzip
+import hashlib
 import json
+import multiprocessing
 import re
-import copy
+import struct
+import tempfile
+import threading
+import traceback
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 import progressbar
 
 # Do NOT import pymclevel here, as it takes a LONG time to import
-# Lazily import inside functions and methods that need it
+# Lazily import inside functions and methods that need it. Same for numpy,
+# so it is only required by the features using it
 
 
 DATADIR = osp.join(osp.dirname(__file__), 'mceditlib', 'blocktypes')
@@ -122,8 +163,223 @@ class ArmorSlot(Enum):
 
 
 
+_NBT_ARRAYS = (NbtTag.BYTE_ARRAY, NbtTag.INT_ARRAY, NbtTag.LONG_ARRAY)
+_NBT_CONTAINERS = (NbtTag.LIST, NbtTag.COMPOUND)
+
+
+def _nbt_shallow_copy(tag):
+    """Copy a single NBT tag. List and Compound copies are created empty"""
+    tagid = tag.tagID
+    if tagid == NbtTag.COMPOUND:
+        return tag.__class__(name=tag.name)
+    if tagid == NbtTag.LIST:
+        return tag.__class__(name=tag.name, list_type=tag.list_type)
+    if tagid in _NBT_ARRAYS:
+        # Arrays are numpy arrays, copied in bulk as a single buffer
+        return tag.__class__(tag.value.copy(), tag.name)
+    return tag.__class__(tag.value, tag.name)
+
+
+def _nbt_copy(tag):
+    """
+    Deep copy of an NBT tag, a faster alternative to copy.deepcopy()
+    Containers are walked iteratively, so there is no recursion limit
+    """
+    root = _nbt_shallow_copy(tag)
+    stack = [(tag, root)] if tag.tagID in _NBT_CONTAINERS else []
+    while stack:
+        src, dst = stack.pop()
+        for child in src.value:
+            new = _nbt_shallow_copy(child)
+            # Append straight to the underlying list: children are already
+            # named and typed, no need for the tag's own checks
+            dst.value.append(new)
+            if child.tagID in _NBT_CONTAINERS:
+                stack.append((child, new))
+    return root
+
+
+def _nbt_equal(tag, other):
+    """
+    Structural comparison of 2 NBT tags. Root tag names are not compared,
+    and Compound tags are compared regardless of their children order
+    """
+    stack = [(tag, other)]
+    while stack:
+        a, b = stack.pop()
+        tagid = a.tagID
+        if tagid != b.tagID:
+            return False
+
+        if tagid == NbtTag.COMPOUND:
+            if len(a.value) != len(b.value):
+                return False
+            children = {_.name: _ for _ in b.value}
+            for child in a.value:
+                if child.name not in children:
+                    return False
+                stack.append((child, children[child.name]))
+
+        elif tagid == NbtTag.LIST:
+            if len(a.value) != len(b.value):
+                return False
+            stack.extend(zip(a.value, b.value))
+
+        elif tagid in _NBT_ARRAYS:
+            if not (len(a.value) == len(b.value) and
+                    (a.value == b.value).all()):
+                return False
+
+        elif a.value != b.value:
+            return False
+
+    return True
+
+
+
+def _nbt_diff(tag, other, path=''):
+    """
+    Yield (path, tag, other tag) for each difference between 2 NBT tags,
+    as in _nbt_equal(), down to the innermost differing tags. Missing
+    tags are None, and paths are '/'-separated names and list indexes
+    """
+    stack = [(path, tag, other)]
+    while stack:
+        path, a, b = stack.pop()
+        if a is None or b is None or a.tagID != b.tagID:
+            yield path, a, b
+            continue
+
+        tagid = a.tagID
+        if tagid == NbtTag.COMPOUND:
+            children = {_.name: _ for _ in b.value}
+            for child in a.value:
+                stack.append(('%s/%s' % (path, child.name), child,
+                              children.pop(child.name, None)))
+            for name, child in children.items():
+                stack.append(('%s/%s' % (path, name), None, child))
+
+        elif tagid == NbtTag.LIST and len(a.value) == len(b.value):
+            stack.extend(('%s/%d' % (path, i), x, y)
+                         for i, (x, y) in enumerate(zip(a.value, b.value)))
+
+        elif not _nbt_equal(a, b):
+            yield path, a, b
+
+
+
+
+class _TagAttr(object):
+    """
+    Descriptor for a schema tag of an NbtObject, see _NbtSchemaMeta
+    Get its value, objectified as in NbtObject.__getattr__(), or None if
+    the tag is absent. Set the value of an existing non-container tag.
+    Setting an absent tag raises AttributeError, as its NBT type is not
+    known: create it first with NbtObject.add_tag()
+
+    The slot holds an (index, tag, cached) binding. The tag index in the
+    compound tells in constant time if the binding is still current, as
+    the tag may be replaced or removed through get_nbt(). `cached` is the
+    objectified value of Compound tags and of Lists of Compounds
+    """
+    __slots__ = ('tag', 'slot')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.slot = '_t_' + tag
+
+    def binding(self, obj):
+        """Current binding of the tag in `obj`, or None if it is absent"""
+        binding = getattr(obj, self.slot)
+        if binding is not None:
+            tags = obj._nbt.value
+            index = binding[0]
+            if index < len(tags) and tags[index] is binding[1]:
+                return binding
+        # Tag may have been added, replaced or removed since bound
+        return obj._bind_tag(self.tag)
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+
+        binding = self.binding(obj)
+        if binding is None:
+            return None
+
+        index, tag, cached = binding
+        tagid = tag.tagID
+        if tagid == NbtTag.COMPOUND:
+            # Cache the wrapper, as it is a view of the same tag
+            if cached is None:
+                cached = NbtObject(tag)
+                setattr(obj, self.slot, (index, tag, cached))
+            return cached
+        if tagid == NbtTag.LIST:
+            # Elements wrappers are views too, so cache them while the
+            # elements are the same. Scalar values are cheap to read again
+            elements = tag.value
+            if cached is not None:
+                snapshot, values = cached
+                if (len(snapshot) == len(elements) and
+                        all(a is b for a, b in zip(snapshot, elements))):
+                    return list(values)
+            values = obj._objectify(tag)
+            if elements and elements[0].tagID == NbtTag.COMPOUND:
+                setattr(obj, self.slot, (index, tag, (list(elements), values)))
+                return list(values)
+            return values
+        return tag.value
+
+    def __set__(self, obj, value):
+        binding = self.binding(obj)
+        if binding is None or binding[1].tagID in _NBT_CONTAINERS:
+            raise AttributeError("Can not set '%s' tag of %r" % (self.tag, obj))
+        binding[1].value = value
+
+
+class _NbtSchemaMeta(abc.ABCMeta):
+    """
+    Metaclass of NBT wrappers, compiling the tags declared in class `_tags`
+
+    Each tag gets a _TagAttr descriptor as its lowercase attribute, bound
+    to the tag object in a `_t_<tag>` slot, so reading it is a descriptor
+    lookup instead of a NbtObject.__getattr__() tag search.
+    Tags of base classes are inherited. Classes also get `_tagslots`, a
+    {tag: slot} dict, and `_tagmap`, a {lowercase name: tag} dict
+    """
+    def __new__(mcs, name, bases, namespace):
+        tags = namespace.get('_tags', ())
+        slots = namespace.get('__slots__')
+        if slots is not None:
+            if isinstance(slots, str):
+                slots = (slots,)
+            namespace['__slots__'] = tuple(slots) + tuple('_t_' + _ for _ in tags)
+        for tag in tags:
+            attr = tag.lower()
+            inherited = any(not isinstance(getattr(_, attr, None), (type(None), _TagAttr))
+                            for _ in bases)
+            if attr in namespace or attr in (slots or ()) or inherited:
+                raise TypeError("%s tag '%s' clashes with attribute '%s'" %
+                                (name, tag, attr))
+            namespace[attr] = _TagAttr(tag)
+
+        cls = super(_NbtSchemaMeta, mcs).__new__(mcs, name, bases, namespace)
+
+        tagslots = dict(getattr(cls, '_tagslots', {}))
+        tagslots.update((_, '_t_' + _) for _ in tags)
+        cls._tagslots = tagslots
+        cls._tagmap = dict((_.lower(), _) for _ in tagslots)
+        return cls
+
+
+
+
 class NbtBase(collections.Sized, collections.Iterable, collections.Container):
     """Base class for NbtObject and NbtListObject"""
+    __metaclass__ = _NbtSchemaMeta
+    __slots__ = ('_nbt',)
+
     def __init__(self, nbt):
         self._nbt = nbt
 
@@ -137,7 +393,17 @@ class NbtBase(collections.Sized, collections.Iterable, collections.Container):
 
     def copy(self):
         """Get a copy of the NBT data"""
-        return copy.deepcopy(self._nbt)
+        return self.fast_copy()
+
+    def fast_copy(self):
+        """Get a copy of the NBT data, without the overhead of copy.deepcopy()"""
+        return _nbt_copy(self._nbt)
+
+    def nbt_equal(self, other):
+        """Check if NBT data is structurally equal to other object's (or tag)"""
+        if isinstance(other, NbtBase):
+            other = other.get_nbt()
+        return _nbt_equal(self._nbt, other)
 
     def clone(self):
         """Return another object using a copy of the NBT data"""
@@ -157,6 +423,7 @@ class NbtListObject(NbtBase, collections.MutableSequence):
     High-level wrapper for NBT List tags.
     Subclasses SHOULD override ElementClass to a specialized element class
     """
+    __slots__ = ('_list',)
     ElementClass = NbtBase
 
     def __init__(self, nbt):
@@ -205,9 +472,6 @@ class NbtListObject(NbtBase, collections.MutableSequence):
 
     def __contains__(self, element):
         """Check existence of element in list, NOT value in elements' .value"""
-        # Optional, as collections.Sequence provides using __getitem__()
-        # However, as __getitem__() is non-trivial by direct access to .value
-        # it's safer to implement __contains__() independently
         return isinstance(element, self.ElementClass) and element in self._list
 
     def __iter__(self):
@@ -223,13 +487,40 @@ class NbtListObject(NbtBase, collections.MutableSequence):
 
 
 class NbtObject(NbtBase, collections.Mapping):
-    """High-level wrapper for NBT Compound tags"""
+    """
+    High-level wrapper for NBT Compound tags
+    Subclasses SHOULD declare their known tags in `_tags`, see _NbtSchemaMeta
+    """
+    __slots__ = ()
+    _tags = ()
 
     def __init__(self, nbt=None):
         if nbt is None:
             from .pymclevel import nbt
             nbt = nbt.TAG_Compound()
         super(NbtObject, self).__init__(nbt)
+        self._bind_tags()
+
+    def _bind_tags(self):
+        """Bind schema tags to their slots in a single pass over the NBT"""
+        tagslots = self._tagslots
+        if not tagslots:
+            return
+        for slot in tagslots.values():
+            setattr(self, slot, None)
+        for index, tag in enumerate(self._nbt.value):
+            if tag.name in tagslots:
+                setattr(self, tagslots[tag.name], (index, tag, None))
+
+    def _bind_tag(self, name):
+        """(Re-)bind a single schema tag. Return its binding, or None if absent"""
+        binding = None
+        for index, tag in enumerate(self._nbt.value):
+            if tag.name == name:
+                binding = (index, tag, None)
+                break
+        setattr(self, self._tagslots[name], binding)
+        return binding
 
     def add_tag(self, name, value, TagClass, overwrite=False):
         """Add a new NBT tag, possibly overwriting an existing one"""
@@ -238,12 +529,17 @@ class NbtObject(NbtBase, collections.Mapping):
         self._nbt[name] = TagClass(value)
 
     def _create_nbt_attrs(self, *tags):
-        """Create attributes for the given NBT tags"""
+        """
+        Create attributes for the given NBT tags
+        Deprecated, declare tags in class `_tags` instead
+        """
 
         assert self._nbt.tagID == NbtTag.COMPOUND, \
             "Can not create attributes from a non-compound NBT tag"
 
         for tag in tags:
+            if tag in self._tagslots:
+                continue
             try:
                 value = self._objectify(self._nbt[tag])
             except KeyError:  # tag not in NBT
@@ -277,6 +573,9 @@ class NbtObject(NbtBase, collections.Mapping):
             return self._objectify(self._nbt[attr])
         except KeyError:
             lowername = attr.lower()
+            tag = self._tagmap.get(lowername)
+            if tag is not None and tag in self._nbt:
+                return self._objectify(self._nbt[tag])
             for tag in self._nbt:
                 if tag.lower() == lowername:
                     return self._objectify(self._nbt[tag])
@@ -300,26 +599,63 @@ class NbtObject(NbtBase, collections.Mapping):
 
     def __contains__(self, k):
         """Check existence of tag in NBT: if k in o ==> if k in o._nbt"""
-        # Optional, as collections.Mapping provides it using __getitem__()
-        # However, as __getitem__() is non-trivial by direct access to .value
-        # it's safer to implement __contains__() independently
         return k in self._nbt
 
 
 
 
+# Snapshot of the ItemTypes collections, never changed once published
+# - items: {(strid, meta): ItemType} OrderedDict, strid with prefix
+# - by_numid: {(numid, meta): ItemType} dict
+# - all_items, armor: lists of ItemType, in the order they were added
+# - min_numid: dummy NumIDs of types without one are below this
+# - resolved: ItemTypes.resolve() cache of raw (id, meta) keys
+_ItemRegistry = collections.namedtuple('_ItemRegistry',
+    'items by_numid all_items armor min_numid resolved')
+
+
+
+
+class _RegistryAttr(object):
+    """Read-only ItemTypes attribute, for both the class and its instances"""
+    __slots__ = ('field',)
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, obj, cls=None):
+        if cls is None:
+            cls = type(obj)
+        return getattr(cls._registry, self.field)
+
+    def __set__(self, obj, value):
+        raise AttributeError("Can not set ItemTypes.%s, use add_items()" % self.field)
+
+
+
+
 class ItemTypes(object):
-    """A singleton collection of ItemType objects"""
-    items = collections.OrderedDict()
-    armor = []
+    """
+    A singleton collection of ItemType objects
+
+    Safe to use from multiple threads: its collections, and the resolve()
+    cache, are never changed in place, but copied and updated while holding
+    a lock, and published in a single assignment of a new registry, so
+    readers need no locking and always see a consistent snapshot
+    """
+    items = _RegistryAttr('items')
+    armor = _RegistryAttr('armor')
 
-    _items_by_numid = collections.OrderedDict()
-    _all_items = []
+    _registry = _ItemRegistry(collections.OrderedDict(), {}, [], [], 0, {})
+    _lock = threading.RLock()
     _re_strid = re.compile(r'\W')  # == r'[^a-zA-Z0-9_]'
 
     _armor_slots =      {_[1]: ArmorSlot.HEAD - (_[0] % 4) for _ in enumerate(range(298, 318))}
     _armor_slots.update({_[1]: ArmorSlot.HEAD - (_[0] % 4) for _ in enumerate(('helmet', 'chestplate', 'leggings', 'boots'))})
 
+    # Unknown IDs already warned about
+    _unknown_ids = set()
+
     def __init__(self):
         if not self.items:
             self._load_default_items()
@@ -329,8 +665,10 @@ class ItemTypes(object):
 
     @classmethod
     def findItem(cls, key, meta=None, prefix='minecraft'):
-        if not cls.items:
+        registry = cls._registry
+        if not registry.items:
             cls._load_default_items()
+            registry = cls._registry
 
         itemid = key
         if isinstance(key, (list, tuple)):
@@ -338,29 +676,103 @@ class ItemTypes(object):
 
         # Check for numeric ID and use the alternate dictionary
         if isinstance(itemid, (int, float)):
-            if (itemid, meta) not in cls._items_by_numid:
+            items = registry.by_numid
+            if (itemid, meta) not in items:
                 meta = None
-            return cls._items_by_numid[(int(itemid), meta)]
+            return items[(int(itemid), meta)]
 
         # Add default prefix if needed, so 'dirt' => 'minecraft:dirt'
         if ':' not in itemid:
             itemid = ':'.join((prefix, itemid))
 
-        if (itemid, meta) not in cls.items:
+        items = registry.items
+        if (itemid, meta) not in items:
             meta = None
 
-        return cls.items[(itemid, meta)]
+        return items[(itemid, meta)]
+
+
+    @classmethod
+    def resolve(cls, itemid, meta=None, count=1):
+        """
+        Cached findItem() for raw NBT item keys, such as (u'minecraft:stone', 0)
+        Unknown keys get an ItemType created once, as in ItemType.from_key(),
+        warning only once per unknown ID. `count` is only used for those
+        """
+        key = (itemid, meta)
+        try:
+            return cls._registry.resolved[key]
+        except KeyError:
+            return cls._resolve_misses([key], count)[0]
+
+
+    @classmethod
+    def resolve_many(cls, keys):
+        """
+        List of ItemTypes of (id, meta) keys, as in resolve(), in one pass
+        Unknown types are all added to the collection at once
+        """
+        resolved = cls._registry.resolved.get
+        result = [resolved(_) for _ in keys]
+        misses = [_ for _, itemtype in enumerate(result) if itemtype is None]
+        if misses:
+            for i, itemtype in zip(misses, cls._resolve_misses([keys[_] for _ in misses])):
+                result[i] = itemtype
+        return result
+
+
+    @classmethod
+    def _resolve_misses(cls, keys, count=1):
+        """
+        List of ItemTypes of keys missing in the resolve() cache. Misses are
+        serialized, so an unknown type is only created once
+
+        Each call copies the cache, and, if there are unknown types, the
+        whole collection, to publish both in a single new registry. So misses
+        should be batched, as resolve_many() does, and not resolved one by one
+        """
+        with cls._lock:
+            if not cls._registry.items:
+                cls._load_default_items()
+            registry = cls._registry
+            resolved = dict(registry.resolved)
+            unknown = collections.OrderedDict()
+            result = []
+            for key in keys:
+                itemtype = resolved.get(key) or unknown.get(key)
+                if itemtype is None:
+                    try:
+                        itemtype = resolved[key] = cls.findItem(*key)
+                    except KeyError:
+                        itemtype = unknown[key] = ItemType.from_key(*key, count=count, add=False)
+                result.append(itemtype)
+
+            if unknown:
+                # Unknown types are for keys no type matched, neither with
+                # their meta nor without, so cached keys still resolve the same
+                registry = cls._extended(registry, unknown.values(), "unknown")
+                resolved.update(unknown)
+            cls._registry = registry._replace(resolved=resolved)
+
+            for key, itemtype in unknown.items():
+                if key[0] not in cls._unknown_ids:
+                    cls._unknown_ids.add(key[0])
+                    log.warning("Unknown item type for %r, created %r", key, itemtype)
+        return result
 
 
     @classmethod
     def searchItems(cls, regex):
-        if not cls.items:
+        if not cls._registry.items:
             cls._load_default_items()
-        return (cls.items[_] for _ in cls.items if re.search(regex, _[0]))
+        items = cls._registry.items
+        return (items[_] for _ in items if re.search(regex, _[0]))
 
 
     @classmethod
     def _load_old_json(cls, path, blocks=False, prefix='minecraft'):
+        """List of ItemTypes from an old-format JSON file"""
+        result = []
         with open(path) as fp:
             data = json.load(fp, object_pairs_hook=collections.OrderedDict)
 
@@ -414,7 +826,8 @@ class ItemTypes(object):
                     stacksize  = item['stacksize'],
                     obtainable = item['obtainable'],
                 )
-                cls.add_item(obj, prefix=prefix)
+                result.append(obj)
+        return result
 
     @classmethod
     def _load_json(cls, path):
@@ -422,47 +835,81 @@ class ItemTypes(object):
 
     @classmethod
     def _load_default_items(cls):
-        cls.add_item(ItemType(0, 'air', None, 'Air', False, True))
-        cls._load_old_json(osp.join(DATADIR, 'tmp_itemblocks.json'), True)
-        cls._load_old_json(osp.join(DATADIR, 'tmp_items.json'))
+        with cls._lock:
+            if cls._registry.items:  # Loaded by another thread meanwhile
+                return
+            # Added all at once, so readers never see a partial collection
+            items = [ItemType(0, 'air', None, 'Air', False, True)]
+            items.extend(cls._load_old_json(osp.join(DATADIR, 'tmp_itemblocks.json'), True))
+            items.extend(cls._load_old_json(osp.join(DATADIR, 'tmp_items.json')))
+            cls.add_items(items)
 
     @classmethod
     def add_item(cls, item, prefix='minecraft', duplicate_prefix='removed'):
-        strid = item.strid
-        numid = item.numid
-        meta  = item.meta  # or 0
+        cls.add_items((item,), prefix, duplicate_prefix)
+
+    @classmethod
+    def add_items(cls, items, prefix='minecraft', duplicate_prefix='removed'):
+        """
+        Add ItemTypes in a single update of copies of the collections,
+        published as a new registry only if all items were added
+        """
+        with cls._lock:
+            cls._registry = cls._extended(cls._registry, items, prefix,
+                                          duplicate_prefix)
+
+    @classmethod
+    def _extended(cls, registry, items, prefix='minecraft', duplicate_prefix='removed'):
+        """
+        New registry with copies of the collections of `registry` and
+        `items` added to them. Its resolve() cache is empty, as new types
+        may change how cached keys resolve
+        """
+        byname    = collections.OrderedDict(registry.items)
+        bynumid   = dict(registry.by_numid)
+        all_items = list(registry.all_items)
+        armor     = list(registry.armor)
+        min_numid = registry.min_numid
+
+        for item in items:
+            strid = item.strid
+            numid = item.numid
+            meta  = item.meta  # or 0
+
+            # If StrID is missing, derive from name
+            if not strid:
+                strid = re.sub(cls._re_strid, '_', item.name).lower()
 
-        # If StrID is missing, derive from name
-        if not strid:
-            strid = re.sub(cls._re_strid, '_', item.name).lower()
+            # Append the default prefix if there is none
+            if ':' not in strid:
+                strid = ':'.join((prefix, strid))
 
-        # Append the default prefix if there is none
-        if ':' not in strid:
-            strid = ':'.join((prefix, strid))
+            # Check for duplicate StrID and add duplicated prefix
+            if (strid, meta) in byname:
+                strid = ':'.join((duplicate_prefix, strid))
+                item.removed = True
 
-        # Check for duplicate StrID and add duplicated prefix
-        if (strid, meta) in cls.items:
-            strid = ':'.join((duplicate_prefix, strid))
-            item.removed = True
+            # Check for missing numID and generate a (negative) dummy one
+            if numid is None:
+                numid = min_numid - 1
+            min_numid = min(min_numid, numid)
 
-        # Check for missing numID and generate a (negative) dummy one
-        if numid is None:
-            numid = min(cls._items_by_numid)[0] - 1
+            # Check for duplicate NumID
+            if (numid, meta) in bynumid:
+                raise KeyError("Item NumID must be unique or None: {0}".format(item))
 
-        # Check for duplicate NumID
-        if (numid, meta) in cls._items_by_numid:
-            raise KeyError("Item NumID must be unique or None: {0}".format(item))
+            # Armor handling
+            item.armorslot = cls._armor_slots.get(numid,
+                             cls._armor_slots.get(strid.split('_')[-1]))
 
-        # Armor handling
-        item.armorslot = cls._armor_slots.get(numid,
-                         cls._armor_slots.get(strid.split('_')[-1]))
+            # Add to collections
+            all_items.append(item)
+            byname[(strid, meta)] = item
+            bynumid[(numid, meta)] = item
+            if item.armorslot:
+                armor.append(item)
 
-        # Add to collections
-        cls._all_items.append(item)
-        cls.items[(strid, meta)] = item
-        cls._items_by_numid[(numid, meta)] = item
-        if item.armorslot:
-            cls.armor.append(item)
+        return _ItemRegistry(byname, bynumid, all_items, armor, min_numid, {})
 
 
 
@@ -560,32 +1007,42 @@ class ItemType(object):
         assert isinstance(item, BaseItem), \
             "Must be BaseItem instance: {0}".format(repr(item))
 
-        if isinstance(item['id'], int):
-            numid = item['id']
+        return cls.from_key(item['id'], item.damage, item['Count'])
+
+
+    @classmethod
+    def from_key(cls, itemid, meta=None, count=1, add=True):
+        """
+        Create an ItemType from an item ID, Damage and Count, as in NBT,
+        and, if `add`, add it to ItemTypes. Useful for unknown types
+        """
+        if isinstance(itemid, int):
+            numid = itemid
             strid = None
             name  = "Unknown Item {0}".format(numid)
             is_block = (numid <= 255)  # Per Minecraft convention
         else:
             numid = None
-            strid = item['id']
+            strid = itemid
             name  = strid.split(':', 1)[-1].replace('_', ' ').title()
             is_block = False  # No way to know for sure
 
         # Set StackSize to the minimum standard to fit Count:
-        if   item['Count'] > 16: stacksize = 64
-        elif item['Count'] > 1:  stacksize = 16
-        else:                    stacksize =  1
+        if   count > 16: stacksize = 64
+        elif count > 1:  stacksize = 16
+        else:            stacksize =  1
 
         obj = cls(
             numid = numid,
             strid = strid,
             name  = name,
-            meta  = item['Damage'],  # Can't tell if Data Value or Durability
+            meta  = meta,  # Can't tell if Data Value or Durability
             is_block  = is_block,
             maxdamage = 0,  # No way to know if it has durability or not
             stacksize = stacksize,  # at least
         )
-        ItemTypes.add_item(obj, "unknown")
+        if add:
+            ItemTypes.add_item(obj, "unknown")
         return obj
 
 
@@ -600,19 +1057,16 @@ class ItemType(object):
 
 class BaseItem(NbtObject):
     """Base Item for Inventory and Entity Items"""
+    __slots__ = ('type',)
+    # "tag" is optional, pre and perhaps post-flattening
+    # After Flattening, "Damage" goes to "tag" as pure durability
+    _tags = ('id', 'Damage', 'Count', 'tag')
 
     def __init__(self, nbt):
         super(BaseItem, self).__init__(nbt)
-        # "tag" is optional, pre and perhaps post-flattening
-        # After Flattening, "Damage" goes to "tag" as pure durability
-        self._create_nbt_attrs("id", "Damage", "Count", "tag")
 
         # Should be a property, but for simplicity and performance it's set here
-        try:
-            self.type = ItemTypes.findItem(*self.key)
-        except KeyError:
-            self.type = ItemType.from_item(self)
-            log.warning("Unknown item type for %r, created %r", self, self.type)
+        self.type = ItemTypes.resolve(self.id, self.damage, self.count)
 
     @property
     def key(self):
@@ -628,6 +1082,15 @@ class BaseItem(NbtObject):
         else:
             return self.type.name
 
+    def same_tag(self, other):
+        """
+        Check if both items have equal 'tag' compounds, or none at all.
+        Items are only similar, and thus stackable, if their tags are equal
+        """
+        if 'tag' not in self or 'tag' not in other:
+            return 'tag' not in self and 'tag' not in other
+        return _nbt_equal(self._nbt['tag'], other.get_nbt()['tag'])
+
     @property
     def fullname(self):
         '''Item name with enchantment count.
@@ -667,9 +1130,8 @@ class BaseItem(NbtObject):
 
 class Item(BaseItem):
     """Item in an inventory slot"""
-    def __init__(self, nbt):
-        super(Item, self).__init__(nbt)
-        self._create_nbt_attrs("Slot")
+    __slots__ = ()
+    _tags = ('Slot',)
 
     def set_slot(self, slot):
         from .pymclevel import nbt
@@ -689,11 +1151,48 @@ class Item(BaseItem):
 
 
 
-class Pos(collections.Sequence):
+class Pos(object):
+    """
+    An (x, y, z) position, as an immutable sequence. Its chunk coordinates
+    are computed on first use and cached
+    """
+    __slots__ = ('_value', '_chunk')
+
     def __init__(self, value):
         self._value = tuple(value)
-        self.x, self.y, self.z = self._value
-        self.cx, self.cz = self.chunkCoords()
+        self._chunk = None
+
+    @classmethod
+    def from_tag(cls, tag):
+        """Pos of a 'Pos' list tag of 3 doubles, such as an Entity's"""
+        x, y, z = tag.value
+        pos = cls.__new__(cls)
+        pos._value = (x.value, y.value, z.value)
+        pos._chunk = None
+        return pos
+
+    def __reduce__(self):
+        return self.__class__, (self._value,)
+
+    @property
+    def x(self):
+        return self._value[0]
+
+    @property
+    def y(self):
+        return self._value[1]
+
+    @property
+    def z(self):
+        return self._value[2]
+
+    @property
+    def cx(self):
+        return self.chunkCoords()[0]
+
+    @property
+    def cz(self):
+        return self.chunkCoords()[1]
 
     def __getitem__(self, index):
         return self._value[index]
@@ -701,6 +1200,21 @@ class Pos(collections.Sequence):
     def __len__(self):
         return len(self._value)
 
+    def __iter__(self):
+        return iter(self._value)
+
+    def __reversed__(self):
+        return reversed(self._value)
+
+    def __contains__(self, value):
+        return value in self._value
+
+    def index(self, value):
+        return self._value.index(value)
+
+    def count(self, value):
+        return self._value.count(value)
+
     def __str__(self):
         strpos = "(%4d, %4d, %4d)" % self._value
         strreg = "(%3d, %3d)" % self.regionCoords()
@@ -718,8 +1232,10 @@ class Pos(collections.Sequence):
 
     def chunkCoords(self):
         '''Return (cx, cz), the coordinates of position's chunk'''
-        return (int(self.x) >> 4,
-                int(self.z) >> 4)
+        if self._chunk is None:
+            self._chunk = (int(self._value[0]) >> 4,
+                           int(self._value[2]) >> 4)
+        return self._chunk
 
     def chunkPos(self):
         '''Return (xc, zc, y), the position in its chunk'''
@@ -739,14 +1255,19 @@ class Pos(collections.Sequence):
         return (cx & 0x1F,
                 cz & 0x1F)
 
+# Slotted, so registered instead of inherited, as ABCs have a __dict__ in Python 2
+collections.Sequence.register(Pos)
+
 
 
 
 class BaseEntity(NbtObject):
     """Base class for all entities and the player"""
+    __slots__ = ('pos',)
+
     def __init__(self, nbt):
         super(BaseEntity, self).__init__(nbt)
-        self.pos = Pos((_.value for _ in self._nbt["Pos"]))
+        self.pos = Pos.from_tag(self._nbt["Pos"])
 
     def __str__(self):
         return "%s, %s" % (self.pos, self.__class__.__name__)
@@ -756,9 +1277,22 @@ class BaseEntity(NbtObject):
 
 class Player(BaseEntity):
     """The Player, an id-less Entity"""
+    __slots__ = ('_inventory',)
+    _tags = ('Dimension',)
+
     def __init__(self, nbt):
         super(Player, self).__init__(nbt)
-        self.inventory = PlayerInventory(self["Inventory"])  # why not get_nbt() ?
+        self._inventory = None
+
+    @property
+    def inventory(self):
+        """PlayerInventory, created on first access"""
+        if self._inventory is None:
+            self._inventory = PlayerInventory(self.get_nbt()["Inventory"])
+        return self._inventory
+    @inventory.setter
+    def inventory(self, value):
+        self._inventory = value
 
     @property
     def name(self):
@@ -769,9 +1303,8 @@ class Player(BaseEntity):
 
 class Entity(BaseEntity):
     """Base for all Entities with id"""
-    def __init__(self, nbt):
-        super(Entity, self).__init__(nbt)
-        self._create_nbt_attrs("id")
+    __slots__ = ()
+    _tags = ('id',)
 
     @property
     def name(self):
@@ -784,18 +1317,21 @@ class Entity(BaseEntity):
 
 
 class XpOrb(Entity):
-    pass
+    __slots__ = ()
 
 
 
 
 class Mob(Entity):
-    pass
+    __slots__ = ()
 
 
 
 
 class Offer(NbtObject):
+    __slots__ = ('buy', 'sell', '_name')
+    _tags = ('uses', 'maxUses')
+
     def __init__(self, nbt):
         super(Offer, self).__init__(nbt)
         self.buy = []
@@ -803,9 +1339,19 @@ class Offer(NbtObject):
             if tag in self:
                 self.buy.append(Item(self.get_nbt()[tag]))
         self.sell = Item(self.get_nbt()['sell'])
-        self.name = "%s for %s" % (self.sell,
-                                   ", ".join([str(_) for _ in self.buy]),
-                                   )
+        self._name = None
+
+    @property
+    def name(self):
+        """Description of the trade, formatted on first access"""
+        if self._name is None:
+            self._name = "%s for %s" % (self.sell,
+                                        ", ".join([str(_) for _ in self.buy]),
+                                        )
+        return self._name
+    @name.setter
+    def name(self, value):
+        self._name = value
 
     def __str__(self):
         return "[%2d/%2d] %s" % (self.uses,
@@ -815,6 +1361,7 @@ class Offer(NbtObject):
 
 
 class Villager(Mob):
+    __slots__ = ('profession', '_offers')
     professions = {0: "Farmer",
                    1: "Librarian",
                    2: "Priest",
@@ -824,10 +1371,20 @@ class Villager(Mob):
     def __init__(self, nbt):
         super(Villager, self).__init__(nbt)
         self.profession = self.professions[self["Profession"]]
-        self.offers = []
-        if "Offers" in self:
-            for offer in self["Offers"]["Recipes"]:
-                self.offers.append(Offer(offer))
+        self._offers = None
+
+    @property
+    def offers(self):
+        """List of Offers, created on first access"""
+        if self._offers is None:
+            self._offers = []
+            if "Offers" in self:
+                for offer in self.get_nbt()["Offers"]["Recipes"]:
+                    self._offers.append(Offer(offer))
+        return self._offers
+    @offers.setter
+    def offers(self, value):
+        self._offers = value
 
     def __str__(self):
         return ("%s: %s\n\t%s"
@@ -839,174 +1396,2603 @@ class Villager(Mob):
 
 
 
-class Inventory(NbtListObject):
-    """Base class for Inventories"""
-    ElementClass = Item
+# A villager trade: `sell` is an ItemType, `count` its amount, `price` a tuple
+# of (ItemType, count) pairs for "buy" and "buyB", `pos` the villager's Pos,
+# and `tag` a copy of the sold item "tag" compound (enchantments, etc), if any
+Trade = collections.namedtuple('Trade', 'sell count price uses maxuses pos tag')
 
-    def item(self, slot):
-        """Return the Item in a Slot"""
-        for item in self:
-            if item['Slot'] == slot:
-                return item
-        else:
-            raise MCError("Slot {0} is empty".format(slot))
 
+class TradeIndex(object):
+    """
+    Index of villager trades in a Dimension, keyed by sold and bought ItemType
 
-    def find(self, ID, meta=None, label=None):
-        """
-        Return an item in Inventory that matches `ID` and `meta` (Damage)
-        `ID` can be int, string, or (ID, meta) iterable. `meta` is ignored if None.
-        """
-        if not isinstance(ID, (int, str, bytes)):
-            ID, meta = ID
+    Only the "Offers" of villagers are read from raw chunk NBT, no Villager,
+    Offer or Item objects are created. The index is refreshed incrementally,
+    re-reading only chunks whose region timestamp changed since last refresh
+    """
+    def __init__(self, world, dim=None, x=None, z=None, size=250):
+        if dim is None:
+            dim = world.player['Dimension']
 
-        for item in self:
-            if item['id'] == ID and (meta is None or item['Damage'] == meta):
-                return item
-        else:
-            if label:
-                msg = "No {0} found in inventory".format(label)
-            else:
-                msg = "Not found in inventory: {0}".format((ID, meta))
-            raise MCError(msg)
+        self.world = world
+        self.dim   = dim
+        self.box   = (x, z, size)
 
+        self._regions = {}  # (rx, rz): region file mtime
+        self._chunks  = {}  # (cx, cz): (timestamp, [Trade, ...])
+        self._sold    = collections.defaultdict(dict)  # ItemType: {(cx, cz): [Trade, ...]}
+        self._bought  = collections.defaultdict(dict)  # ItemType: {(cx, cz): [Trade, ...]}
 
+    def refresh(self, progress=False):
+        """
+        (Re-)Index chunks changed, added or removed since last refresh.
+        Return the number of chunks read
+        """
+        start = time.time()
+        count = 0
+        seen = set()
+        for region in self.world.iter_regions(self.dim, *self.box):
+            key = (region.rx, region.rz)
+            seen.add(key)
+            if self._regions.get(key) == region.mtime:
+                continue
 
+            positions = set(_region_positions(region, *self.box))
+            for pos in [_ for _ in self._chunks
+                        if (_[0] >> 5, _[1] >> 5) == key and _ not in positions]:
+                self._remove_chunk(pos)
 
-class PlayerInventory(Inventory):
-    """A Player's Inventory"""
+            changed = [_ for _ in positions
+                       if self._chunks.get(_, (None,))[0] != region.timestamp(*_)]
+            for cx, cz, tag in region.iter_nbt(changed):
+                self._add_chunk(cx, cz, tag, region.timestamp(cx, cz))
+                count += 1
 
-    def __init__(self, nbt):
-        super(PlayerInventory, self).__init__(nbt)
+            self._regions[key] = region.mtime
 
-        if len(self) == 40:  # shortcut for full inventory
-            self.free_slots = []
-            self.free_armor = []
-        else:
-            slots = set(_["Slot"] for _ in self)
-            self.free_slots = sorted(set(range(36))       - slots)
-            self.free_armor = sorted(set(range(100, 104)) - slots)
+        for key in set(self._regions) - seen:
+            del self._regions[key]
+            for pos in [_ for _ in self._chunks if (_[0] >> 5, _[1] >> 5) == key]:
+                self._remove_chunk(pos)
 
+        log.info("Trades from %d chunks indexed in %.2f seconds",
+                 count, time.time() - start)
+        return count
 
-    def stack_item(self, item, wear_armor=True):
+    def update_chunk(self, chunk):
         """
-        Add an item clone to the inventory, trying to stack it with other items
-        according to item's max stack size. Original item is never changed.
-        Raise ValueError if item count is zero or greater than max stack size.
-        Return a 3-tuple (count_remaining, [slots, ...], [counts, ...])
+        Re-index a (possibly modified and not yet saved) pymclevel chunk.
+        Next refresh() will re-read it from disk
         """
-        item = item.clone()
-
-        size = item.type.stacksize
-        count = item["Count"]  # item.count will not be changed until fully stacked
+        cx, cz = chunk.chunkPosition
+        self._add_chunk(cx, cz, chunk.root_tag, None)
 
-        # Assertions
-        if count == 0:
-            raise ValueError("Item count is zero: %s" % item)
+    def sold(self, key, meta=None):
+        """List of Trades selling an ItemType or item key, as in findItem()"""
+        return self._query(self._sold, key, meta)
 
-        if count > size:
-            raise ValueError(
-                "Item count is greater than max stack size (%d/%d): %s" %
-                (count, size, item))
+    def bought(self, key, meta=None):
+        """List of Trades buying an ItemType or item key, as in findItem()"""
+        return self._query(self._bought, key, meta)
 
-        # Shortcut 1-stack items like tools, armor, weapons, etc
-        if size == 1:
+    def _query(self, index, key, meta):
+        if not isinstance(key, ItemType):
             try:
-                return 0, [(self.add_item(item, wear_armor, clone=True), 1)]
-            except MCError:
-                return count, []
-
-        # Loop each inventory slot, stacking the item onto similar items
-        # that are not maximized until item count is 0
-        slots  = []
-        for stack in self:
-            if (stack.key == item.key and
-                stack.name == item.name and  # avoid stacking named items
-                stack["Count"] < size):
+                key = ItemTypes.findItem(key, meta)
+            except KeyError:
+                return []
+        return [_ for trades in index.get(key, {}).values() for _ in trades]
+
+    def _add_chunk(self, cx, cz, tag, timestamp):
+        self._remove_chunk((cx, cz))
+
+        trades = []
+        level = _chunk_level(tag)
+        for entity in (level['Entities'] if 'Entities' in level else ()):
+            if not ('id' in entity and 'Offers' in entity and
+                    'Recipes' in entity['Offers'] and
+                    entity['id'].value.split(':', 1)[-1].lower() == 'villager'):
+                continue
 
-                total = stack["Count"] + count
-                diff = min(size, total) - stack["Count"]
-                stack["Count"] += diff
-                count          -= diff
+            pos = Pos.from_tag(entity['Pos'])
+            for offer in entity['Offers']['Recipes']:
+                trade = Trade(
+                    sell    = _item_type(offer['sell']),
+                    count   = offer['sell']['Count'].value,
+                    price   = tuple((_item_type(offer[_]), offer[_]['Count'].value)
+                                    for _ in ('buy', 'buyB') if _ in offer),
+                    uses    = offer['uses'].value    if 'uses'    in offer else 0,
+                    maxuses = offer['maxUses'].value if 'maxUses' in offer else 7,
+                    pos     = pos,
+                    tag     = (_nbt_copy(offer['sell']['tag'])
+                               if 'tag' in offer['sell'] else None),
+                )
+                trades.append(trade)
+                self._sold[trade.sell].setdefault((cx, cz), []).append(trade)
+                for itemtype, _ in trade.price:
+                    self._bought[itemtype].setdefault((cx, cz), []).append(trade)
 
-                slots.append((stack["Slot"], diff))
+        self._chunks[(cx, cz)] = (timestamp, trades)
 
-                if count == 0:
-                    break
+    def _remove_chunk(self, pos):
+        if pos not in self._chunks:
+            return
+        for trade in self._chunks.pop(pos)[1]:
+            self._sold[trade.sell].pop(pos, None)
+            for itemtype, _ in trade.price:
+                self._bought[itemtype].pop(pos, None)
 
-        if count > 0:
-            item["Count"] = count
-            try:
-                slots.append((self.add_item(item, wear_armor, clone=False),
-                              count))
-                count = 0
-            except MCError:
-                pass
+    def __iter__(self):
+        return (_ for _, trades in self._chunks.values() for _ in trades)
 
-        return count, slots
+    def __len__(self):
+        return sum(len(_[1]) for _ in self._chunks.values())
 
 
-    def add_item(self, item, wear_armor=True, clone=True):
-        """Add an item (or a clone) to a free inventory slot.
-            Return the used slot space, if any, or raise mc.MCError
-        """
-        e = MCError("No suitable free inventory slot to add %s" %
-                    item.description)
 
-        # shortcut for no free slots
-        if not self.free_slots and not self.free_armor:
-            raise e
 
-        # Get a free slot suitable for the item
-        # For armor, try to wear in its corresponding slot
-        slot = None
-        if wear_armor and item.type.is_armor:
-            slot = item.type.armorslot
-            if slot in self.free_armor:
-                self.free_armor.remove(slot)
-            else:
-                # Corresponding armor slot is not free
-                slot = None
+class Container(NbtObject):
+    """A container Tile Entity, such as a chest, hopper or shulker box"""
+    __slots__ = ('pos', 'inventory')
+    _tags = ('id',)
 
-        if slot is None:
-            if not self.free_slots:
-                raise e
+    def __init__(self, nbt):
+        super(Container, self).__init__(nbt)
+        self.pos = Pos((self["x"], self["y"], self["z"]))
+        self.inventory = Inventory(self.get_nbt()["Items"])
+
+    @property
+    def name(self):
+        return self['id'].split(':', 1)[-1].replace('_', ' ').title()
+
+    def __str__(self):
+        return "%s, %s '%s' with %d items" % (self.pos, self.__class__.__name__,
+                                              self.name, len(self.inventory))
+
+
+
+
+def _full_id(itemid, prefix='minecraft'):
+    """Add default prefix to string IDs if needed, so 'dirt' => 'minecraft:dirt'"""
+    if isinstance(itemid, (int, float)) or ':' in itemid:
+        return itemid
+    return ':'.join((prefix, itemid))
+
+
+def _item_ids(ids):
+    """Normalized set of item IDs from ItemTypes, numeric IDs or StrIDs"""
+    result = set()
+    for key in ids:
+        if isinstance(key, ItemType):
+            if key.numid is not None:
+                result.add(key.numid)
+            if key.strid:
+                result.add(key.fullstrid)
+        else:
+            result.add(_full_id(key))
+    return result
+
+
+def _iter_containers(nbt, ids=None, containers=None):
+    """
+    Yield the Tile Entity compound of each container in a chunk, optionally
+    only the ones with any item in `ids`, a set as in _item_ids(), and
+    whose Tile Entity ID, without prefix and lowercase, is in `containers`
+    """
+    level = _chunk_level(nbt)
+    for tag in ('TileEntities', 'block_entities'):
+        if tag in level:
+            break
+    else:
+        return
+
+    for entity in level[tag]:
+        if 'Items' not in entity:
+            continue
+        if (containers is not None and
+            entity['id'].value.split(':', 1)[-1].lower() not in containers):
+            continue
+        if (ids is not None and
+            not any(_full_id(_['id'].value) in ids for _ in entity['Items'])):
+            continue
+        yield entity
+
+
+def _chunk_item_counts(cx, cz, nbt, ids=None, containers=None):
+    """
+    Total item counts in containers of a chunk, as in _iter_containers(),
+    as a Counter keyed by item (ID, Damage). Damage is None when absent,
+    as in 1.13 onwards. Return None if there are no matching items
+    """
+    counts = collections.Counter()
+    for entity in _iter_containers(nbt, ids, containers):
+        for item in entity['Items']:
+            itemid = _full_id(item['id'].value)
+            if ids is not None and itemid not in ids:
+                continue
+            damage = item['Damage'].value if 'Damage' in item else None
+            counts[(itemid, damage)] += item['Count'].value
+    return counts or None
+
+
+def _chunk_entity_counts(cx, cz, nbt, ids=None, tiles=True):
+    """
+    Entity and, if `tiles`, Tile Entity counts of a chunk, as a Counter
+    keyed by full ID, optionally only the ones with IDs in `ids`, a set of
+    lowercase full IDs, and the (x, y, z, count) sums of the positions of
+    Entities and of Tile Entities, as a pair, as the former are exact and
+    the latter block coordinates. Works on both terrain chunks and, from
+    1.17 on, 'entities' region chunks. Only IDs are read from the raw NBT.
+    Return None if nothing is counted
+    """
+    level = _chunk_level(nbt)
+    counts = collections.Counter()
+    sums = [[0.0, 0.0, 0.0, 0], [0.0, 0.0, 0.0, 0]]
+
+    if 'Entities' in level:
+        total = sums[0]
+        for entity in level['Entities']:
+            if 'id' not in entity:
+                continue
+            entityid = _full_id(entity['id'].value)
+            if ids is not None and entityid.lower() not in ids:
+                continue
+            counts[entityid] += 1
+            x, y, z = entity['Pos']
+            total[0] += x.value
+            total[1] += y.value
+            total[2] += z.value
+            total[3] += 1
+
+    if tiles:
+        total = sums[1]
+        for tag in ('TileEntities', 'block_entities'):
+            if tag not in level:
+                continue
+            for entity in level[tag]:
+                if 'id' not in entity:
+                    continue
+                entityid = _full_id(entity['id'].value)
+                if ids is not None and entityid.lower() not in ids:
+                    continue
+                counts[entityid] += 1
+                total[0] += entity['x'].value
+                total[1] += entity['y'].value
+                total[2] += entity['z'].value
+                total[3] += 1
+
+    if not counts:
+        return None
+    return counts, tuple(tuple(_) for _ in sums)
+
+
+# A chunk in EntityDensity.hotspots(), `pos` the mean position of its
+# Entities and `tile_pos` the one of its Tile Entities, None if it has
+# none of them, and `types` their {ID: count} Counter
+Hotspot = collections.namedtuple('Hotspot', 'count cx cz pos tile_pos types')
+
+
+
+
+class EntityDensity(object):
+    """
+    Entity and Tile Entity counts per chunk of a Dimension, see
+    World.entity_density()
+
+    - grids: {(rx, rz): 32 x 32 array} of counts per chunk of each region,
+    indexed by [cz, cx] relative to the region, as in Surface.
+    - chunks: {(cx, cz): Counter} of counts by ID of each counted chunk.
+    - types: Counter of total counts by ID
+    """
+    def __init__(self, dim):
+        self.dim = dim
+        self.grids = {}
+        self.chunks = {}
+        self.types = collections.Counter()
+        self._sums = {}  # (cx, cz): Entities and Tile Entities position sums
+
+    def add(self, cx, cz, counts, sums):
+        """
+        Add the counts and position sums of a chunk, as from
+        _chunk_entity_counts(), to the ones already added for it, if any,
+        such as its Entities read from a separate 'entities' region
+        """
+        import numpy as np
+
+        key = (cx >> 5, cz >> 5)
+        if key not in self.grids:
+            self.grids[key] = np.zeros((32, 32), dtype=np.uint32)
+        self.grids[key][cz & 0x1F, cx & 0x1F] += sum(counts.values())
+        if (cx, cz) in self.chunks:
+            self.chunks[(cx, cz)].update(counts)
+            sums = tuple(tuple(a + b for a, b in zip(*_))
+                         for _ in zip(self._sums[(cx, cz)], sums))
+        else:
+            self.chunks[(cx, cz)] = collections.Counter(counts)
+        self._sums[(cx, cz)] = sums
+        self.types.update(counts)
+
+    def hotspots(self, top=10):
+        """List of the `top` chunks with most entities, as Hotspots, densest first"""
+        import numpy as np
+
+        if not self.grids or top <= 0:
+            return []
+
+        keys = sorted(self.grids)
+        counts = np.stack([self.grids[_] for _ in keys]).ravel()
+        top = min(top, np.count_nonzero(counts))
+        indexes = np.argpartition(counts, counts.size - top)[counts.size - top:]
+        indexes = indexes[np.argsort(counts[indexes], kind='mergesort')[::-1]]
+
+        hotspots = []
+        for index in indexes:
+            region, offset = divmod(int(index), 1024)
+            rx, rz = keys[region]
+            cx, cz = rx << 5 | offset & 0x1F, rz << 5 | offset >> 5
+            pos, tile_pos = (Pos(_[i] / _[3] for i in range(3)) if _[3] else None
+                             for _ in self._sums[(cx, cz)])
+            hotspots.append(Hotspot(int(counts[index]), cx, cz, pos, tile_pos,
+                                    self.chunks[(cx, cz)]))
+        return hotspots
+
+    @property
+    def total(self):
+        return sum(self.types.values())
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __repr__(self):
+        return "<{0}(dim={1}, {2} entities in {3} chunks)>".format(
+            self.__class__.__name__, self.dim, self.total, len(self))
+
+
+
+
+# Top blocks of a region, see World.surface()
+Surface = collections.namedtuple('Surface', 'heights blocks names')
+Surface.EMPTY = -0x80000000  # Height of empty columns, below any world minimum Y
+
+
+
+
+def _item_type(nbt):
+    """ItemType of a raw item NBT, without creating an Item"""
+    return ItemTypes.resolve(nbt['id'].value,
+                             nbt['Damage'].value if 'Damage' in nbt else None,
+                             nbt['Count'].value if 'Count' in nbt else 1)
+
+
+def _chunk_level(nbt):
+    """The chunk data compound, either 'Level' (until 1.17) or chunk root"""
+    return nbt['Level'] if 'Level' in nbt else nbt
+
+
+def _nibbles(array):
+    """Unpack a nibble array (such as section 'Data') into one byte per value"""
+    import numpy as np
+
+    array = np.asarray(array, dtype=np.uint8)
+    values = np.empty(2 * len(array), dtype=np.uint8)
+    values[0::2] = array & 0x0F
+    values[1::2] = array >> 4
+    return values
+
+
+def _unpack_longs(longs, bits, count):
+    """
+    Unpack `count` values of `bits` width from a packed long array, such as
+    section 'BlockStates' or 'Heightmaps'. Handles both the layout where
+    values span across longs (until 1.15) and the padded one (1.16 onwards)
+    """
+    import numpy as np
+
+    words = np.asarray(longs).astype(np.uint64)
+    index = np.arange(count, dtype=np.uint64)
+    mask = np.uint64((1 << bits) - 1)
+    per_word = 64 // bits
+
+    # Less longs than the padded layout needs means values span across them
+    if len(words) < -(-count // per_word):
+        bits = np.uint64(bits)
+        offset = index * bits
+        word = (offset >> np.uint64(6)).astype(np.intp)
+        shift = offset & np.uint64(63)
+        values = words[word] >> shift
+        spans = shift + bits > np.uint64(64)
+        upper = words[np.minimum(word + 1, len(words) - 1)] << ((np.uint64(64) - shift)
+                                                                & np.uint64(63))
+        values |= np.where(spans, upper, np.uint64(0))
+    else:
+        # Each long holds as many whole values as it can fit, the rest is padding
+        per_word, bits = np.uint64(per_word), np.uint64(bits)
+        word = (index // per_word).astype(np.intp)
+        shift = (index % per_word) * bits
+        values = words[word] >> shift
+
+    return (values & mask).astype(np.uint16)
+
+
+def _chunk_sections(nbt, decode=True):
+    """
+    Yield (Y, blocks, data, palette) for each chunk section with blocks, as
+    in _section_blocks(). If not `decode`, yield (Y, section tag) instead
+    """
+    level = _chunk_level(nbt)
+    for tag in ('Sections', 'sections'):
+        if tag in level:
+            break
+    else:
+        return
+
+    for section in level[tag]:
+        if not decode:
+            yield section['Y'].value, section
+            continue
+        blocks = _section_blocks(section)
+        if blocks is not None:
+            yield blocks
+
+
+def _section_blocks(section):
+    """
+    Return (Y, blocks, data, palette) of a chunk section, None if no blocks
+    `blocks` is a 4096 array in YZX order (index = y * 256 + z * 16 + x) with
+    either numeric block IDs or, for palette-based sections (1.13 onwards),
+    indexes in `palette`, a list of block names. `data` is an array of block
+    data values for numeric sections, and None for palette-based ones
+    """
+    import numpy as np
+
+    y = section['Y'].value
+
+    # Numeric IDs, until 1.12
+    if 'Blocks' in section:
+        blocks = np.asarray(section['Blocks'].value, dtype=np.uint8).astype(np.uint16)
+        if 'Add' in section:
+            blocks |= _nibbles(section['Add'].value).astype(np.uint16) << 8
+        if 'Data' in section:
+            data = _nibbles(section['Data'].value)
+        else:
+            data = np.zeros(4096, dtype=np.uint8)
+        return y, blocks, data, None
+
+    # Palette-based, 1.13 to 1.17 in section, 1.18 onwards in 'block_states'
+    if 'Palette' in section:
+        palette, states = section['Palette'], section
+        packed = 'BlockStates'
+    elif 'block_states' in section:
+        palette, states = section['block_states']['palette'], section['block_states']
+        packed = 'data'
+    else:
+        return None  # Section with only light data
+
+    names = [_['Name'].value for _ in palette]
+    if packed in states:
+        bits = max(4, (len(names) - 1).bit_length())
+        blocks = _unpack_longs(states[packed].value, bits, 4096)
+    else:  # single block type in palette
+        blocks = np.zeros(4096, dtype=np.uint16)
+    return y, blocks, None, names
+
+
+def _block_name(numid, meta=None):
+    """Block type name from a numeric ID and (optionally) data value"""
+    try:
+        return ItemTypes.findItem((numid, meta)).name
+    except KeyError:
+        pass
+
+    if meta is None:
+        # Multi-data blocks have no meta-less type, derive name from StrID
+        try:
+            return ItemTypes.findItem((numid, 0)).strid.replace('_', ' ').title()
+        except KeyError:
+            return "Unknown Block %d" % numid
+
+    return "Unknown Block %d:%d" % (numid, meta)
+
+
+def _palette_name(name):
+    """Block type name from a palette block name, such as 'minecraft:stone'"""
+    try:
+        return ItemTypes.findItem(name).name
+    except KeyError:
+        return name
+
+
+def _chunk_block_counts(cx, cz, nbt, data=False):
+    """
+    Block counts of a chunk, as a 2-tuple: a sparse (keys, counts) pair of
+    numpy arrays, keys being the numeric block IDs (or `ID << 4 | data`,
+    if `data`) found in numeric sections, and a Counter of block names for
+    palette-based sections. Either may be None.
+    Sparse counts keep results small to send from workers and to cache
+    """
+    import numpy as np
+
+    counts = None
+    named = None
+    for _, blocks, values, palette in _chunk_sections(nbt):
+        if palette is None:
+            keys = (blocks << 4 | values) if data else blocks
+            section = np.bincount(keys, minlength=_block_keys(data))
+            if counts is None:
+                counts = section
+            else:
+                counts += section
+        else:
+            if named is None:
+                named = collections.Counter()
+            for name, count in zip(palette, np.bincount(blocks, minlength=len(palette))):
+                if count:
+                    named[name] += int(count)
+    if counts is not None:
+        keys = np.flatnonzero(counts)
+        counts = (keys.astype(np.uint32), counts[keys])
+    return counts, named
+
+
+def _block_keys(data=False):
+    """Number of numeric block keys, as in _chunk_block_counts()"""
+    return 4096 << 4 if data else 4096
+
+
+def _chunk_find_blocks(cx, cz, nbt, numids=(), numkeys=(), names=(), data=False):
+    """
+    Coordinates of blocks in a chunk matching any of the numeric IDs in
+    `numids`, `ID << 4 | data` keys in `numkeys` or palette `names`, as a
+    N x 3 (x, y, z) int32 array, or N x 4 (x, y, z, data) if `data`.
+    Return None if there are no matches
+    """
+    import numpy as np
+
+    found = []
+    for y, blocks, values, palette in _chunk_sections(nbt):
+        if palette is None:
+            mask = np.in1d(blocks, numids)
+            if len(numkeys):
+                mask |= np.in1d(blocks << 4 | values, numkeys)
+        else:
+            matches = np.array([_ in names for _ in palette], dtype=bool)
+            if not matches.any():
+                continue
+            mask = matches[blocks]
+
+        index = np.flatnonzero(mask).astype(np.int32)
+        if not len(index):
+            continue
+
+        coords = [(index & 0x0F) + cx * 16,
+                  (index >> 8)   + y  * 16,
+                  (index >> 4 & 0x0F) + cz * 16]
+        if data:
+            if values is None:
+                coords.append(np.full(len(index), -1, dtype=np.int32))
+            else:
+                coords.append(values[index].astype(np.int32))
+        found.append(np.column_stack(coords))
+
+    if not found:
+        return None
+    return np.concatenate(found)
+
+
+_AIR_BLOCKS = frozenset(('minecraft:air', 'minecraft:cave_air', 'minecraft:void_air'))
+
+
+def _chunk_surface(cx, cz, nbt, heightmap=True):
+    """
+    Surface of a chunk, as (heights, blocks, names), the first two being
+    256 arrays indexed by `z * 16 + x`: the Y of each column's top block,
+    Surface.EMPTY for empty columns, and its numeric block ID, or, for
+    palette-based sections, 4096 + its index in `names`, a list of block names.
+
+    If `heightmap`, use the chunk stored heightmap when it is valid, and
+    only decode the sections its top blocks are in. Until 1.12 it is the
+    'HeightMap' of light-blocking blocks, so it skips glass and the like
+    """
+    import numpy as np
+
+    level = _chunk_level(nbt)
+    sections = dict(_chunk_sections(nbt, decode=False))
+
+    heights = None
+    miny = 0
+    if heightmap:
+        if ('HeightMap' in level and len(level['HeightMap'].value) == 256 and
+                'LightPopulated' in level and level['LightPopulated'].value):
+            heights = np.asarray(level['HeightMap'].value, dtype=np.int32) - 1
+        elif ('Heightmaps' in level and 'WORLD_SURFACE' in level['Heightmaps'] and
+                'Status' in level and
+                level['Status'].value.split(':', 1)[-1] == 'full'):
+            miny = level['yPos'].value * 16 if 'yPos' in level else 0
+            heights = _unpack_longs(level['Heightmaps']['WORLD_SURFACE'].value,
+                                    9, 256).astype(np.int32) + (miny - 1)
+        if heights is not None:
+            # Heights may be negative from 1.18 on, so filter on miny instead
+            heights[heights < miny] = Surface.EMPTY
+            if not set(np.unique(heights[heights >= miny] >> 4)) <= set(sections):
+                heights = None  # Heightmap points to missing sections
+
+    names = []
+    blocks = np.zeros(256, dtype=np.uint16)
+    columns = np.arange(256)
+
+    def top_blocks(ids, palette, columns, ys):
+        ids = ids[ys, columns]
+        if palette is None:
+            return ids
+        offset = 4096 + len(names)
+        names.extend(palette)
+        return ids + offset
+
+    if heights is not None:
+        for sy in np.unique(heights[heights >= miny] >> 4):
+            found = (heights >= miny) & (heights >> 4 == sy)
+            section = _section_blocks(sections[sy])
+            if section is None:
+                heights = None  # Heightmap points to a section with no blocks
+                break
+            _, ids, _, palette = section
+            blocks[found] = top_blocks(ids.reshape(16, 256), palette,
+                                       columns[found], heights[found] & 0x0F)
+        else:
+            return heights, blocks, names
+        blocks[:] = 0
+        del names[:]
+
+    # Search top-down, section by section, until all columns are found
+    heights = np.full(256, Surface.EMPTY, dtype=np.int32)
+    empty = np.ones(256, dtype=bool)
+    for sy in sorted(sections, reverse=True):
+        section = _section_blocks(sections[sy])
+        if section is None:
+            continue
+        _, ids, _, palette = section
+        ids = ids.reshape(16, 256)
+        if palette is None:
+            solid = ids != 0
+        else:
+            solid = ~np.array([_ in _AIR_BLOCKS for _ in palette], dtype=bool)[ids]
+
+        found = empty & solid.any(axis=0)
+        if not found.any():
+            continue
+        ys = 15 - np.argmax(solid[::-1, found], axis=0)
+        heights[found] = sy * 16 + ys
+        blocks[found] = top_blocks(ids, palette, columns[found], ys)
+        empty &= ~found
+        if not empty.any():
+            break
+
+    return heights, blocks, names
+
+
+def _merge_block_counts(total, counts, data=False):
+    """
+    Add a _chunk_block_counts() 2-tuple to `total`, an [array, Counter]
+    pair, in place, the array indexed by numeric block key. Either may be
+    None until needed. Return `total`, a new one if None
+    """
+    import numpy as np
+
+    if total is None:
+        total = [None, None]
+    sparse, named = counts
+    if sparse is not None:
+        if total[0] is None:
+            total[0] = np.zeros(_block_keys(data), dtype=np.int64)
+        keys, values = sparse
+        total[0][keys] += values  # keys are unique, so no need for np.add.at()
+    if named is not None:
+        if total[1] is None:
+            total[1] = collections.Counter()
+        total[1].update(named)
+    return total
+
+
+
+
+# Columns of each World.export() record kind, as (name, type) pairs, type being
+# 'i' (integer), 'f' (float) or 's' (text). Missing values are None, or -1,
+# NaN and '' in formats without nulls, such as .npz
+_EXPORT_COLUMNS = collections.OrderedDict((
+    ('entities', (('dim', 'i'), ('cx', 'i'), ('cz', 'i'), ('id', 's'), ('uuid', 's'),
+                  ('x', 'f'), ('y', 'f'), ('z', 'f'),
+                  ('health', 'f'), ('custom_name', 's'))),
+    ('offers',   (('dim', 'i'), ('cx', 'i'), ('cz', 'i'), ('villager', 's'),
+                  ('x', 'f'), ('y', 'f'), ('z', 'f'),
+                  ('sell_id', 's'), ('sell_damage', 'i'), ('sell_count', 'i'),
+                  ('buy_id', 's'), ('buy_damage', 'i'), ('buy_count', 'i'),
+                  ('buyb_id', 's'), ('buyb_damage', 'i'), ('buyb_count', 'i'),
+                  ('uses', 'i'), ('max_uses', 'i'))),
+    ('items',    (('dim', 'i'), ('cx', 'i'), ('cz', 'i'), ('container', 's'),
+                  ('x', 'i'), ('y', 'i'), ('z', 'i'),
+                  ('slot', 'i'), ('id', 's'), ('damage', 'i'), ('count', 'i'),
+                  ('tagged', 'i'))),
+    ('players',  (('player', 's'), ('dim', 'i'), ('x', 'f'), ('y', 'f'), ('z', 'f'),
+                  ('inventory', 's'),
+                  ('slot', 'i'), ('id', 's'), ('damage', 'i'), ('count', 'i'),
+                  ('tagged', 'i'))),
+))
+
+
+def _tag_value(nbt, name):
+    """Value of a tag in a compound, or None if absent"""
+    return nbt[name].value if name in nbt else None
+
+
+def _nbt_uuid(nbt):
+    """Canonical UUID string of an entity compound, or None if it has none"""
+    import numpy as np
+
+    if 'UUID' in nbt:  # 1.16 onwards, 4 ints
+        value = np.asarray(nbt['UUID'].value, dtype='>u4').tostring()
+    elif 'UUIDMost' in nbt:
+        value = struct.pack('>qq', nbt['UUIDMost'].value, nbt['UUIDLeast'].value)
+    else:
+        return None
+    h = binascii.hexlify(value).decode('ascii')
+    return '-'.join((h[:8], h[8:12], h[12:16], h[16:20], h[20:]))
+
+
+def _item_columns(nbt):
+    """(id, damage, count) export columns of a raw item NBT, Nones if absent"""
+    if nbt is None or 'id' not in nbt:
+        return None, None, None
+    damage = _tag_value(nbt, 'Damage')
+    if damage is None and 'tag' in nbt:  # 1.13 onwards
+        damage = _tag_value(nbt['tag'], 'Damage')
+    return u'%s' % nbt['id'].value, damage, _tag_value(nbt, 'Count')
+
+
+def _item_rows(items, *columns):
+    """Export rows of raw item NBTs, each prefixed with `columns`"""
+    return [columns + (_tag_value(_, 'Slot'),) + _item_columns(_) + (int('tag' in _),)
+            for _ in items]
+
+
+def _chunk_export_rows(cx, cz, nbt, dim=0, kinds=('entities', 'offers', 'items')):
+    """
+    World.export() rows of a chunk, as a {kind: [row tuples]} dict
+    with columns as in _EXPORT_COLUMNS. Return None if there are no rows
+    """
+    level = _chunk_level(nbt)
+    rows = collections.defaultdict(list)
+
+    if 'Entities' in level and ('entities' in kinds or 'offers' in kinds):
+        for entity in level['Entities']:
+            pos = tuple(_.value for _ in entity['Pos'])
+            uuid = _nbt_uuid(entity)
+            if 'entities' in kinds:
+                rows['entities'].append((dim, cx, cz, u'%s' % entity['id'].value, uuid)
+                                        + pos
+                                        + (_tag_value(entity, 'Health'),
+                                           _tag_value(entity, 'CustomName')))
+            if 'offers' in kinds and 'Offers' in entity:
+                for offer in entity['Offers']['Recipes']:
+                    rows['offers'].append((dim, cx, cz, uuid) + pos
+                                          + _item_columns(offer['sell'])
+                                          + _item_columns(offer['buy'])
+                                          + _item_columns(offer['buyB']
+                                                          if 'buyB' in offer else None)
+                                          + (_tag_value(offer, 'uses'),
+                                             _tag_value(offer, 'maxUses')))
+
+    if 'items' in kinds:
+        for entity in _iter_containers(nbt):
+            rows['items'].extend(_item_rows(entity['Items'], dim, cx, cz,
+                                            u'%s' % entity['id'].value,
+                                            entity['x'].value,
+                                            entity['y'].value,
+                                            entity['z'].value))
+
+    return dict(rows) or None
+
+
+def _player_export_rows(name, nbt):
+    """World.export() 'players' rows of a player NBT, one per inventory item"""
+    # Players saved before Dimension existed are in the Overworld
+    dim = nbt['Dimension'].value if 'Dimension' in nbt else 0
+    columns = (name, dim) + tuple(_.value for _ in nbt['Pos'])
+    rows = []
+    for inventory in ('Inventory', 'EnderItems'):
+        if inventory in nbt:
+            rows.extend(_item_rows(nbt[inventory], *(columns + (inventory,))))
+    return rows
+
+
+
+
+class _ExportWriter(object):
+    """Base for World.export() writers of row batches to a file per kind"""
+    extension = None
+
+    def __init__(self, path, columns):
+        self.path = '.'.join((path, self.extension))
+        self.names = [_[0] for _ in columns]
+        self.types = [_[1] for _ in columns]
+
+    def write(self, rows):
+        """Write a batch of row tuples. Must not keep a reference to `rows`"""
+        raise NotImplementedError
+
+    def columns(self, rows):
+        """
+        Typed numpy arrays of each column of `rows`, for formats without
+        nulls, so missing values are replaced by -1, NaN or ''
+        """
+        import numpy as np
+
+        fills = {'i': -1, 'f': np.nan, 's': u''}
+        dtypes = {'i': np.int64, 'f': np.float64, 's': np.unicode_}
+        arrays = []
+        for kind, values in zip(self.types, zip(*rows)):
+            fill = fills[kind]
+            arrays.append(np.array([fill if _ is None else _ for _ in values],
+                                   dtype=dtypes[kind]))
+        return arrays
+
+    def close(self):
+        pass
+
+
+class _NdjsonWriter(_ExportWriter):
+    extension = 'ndjson'
+
+    def __init__(self, path, columns):
+        super(_NdjsonWriter, self).__init__(path, columns)
+        self.fp = open(self.path, 'w')
+
+    def write(self, rows):
+        names = self.names
+        self.fp.write(''.join(json.dumps(collections.OrderedDict(zip(names, _))) + '\n'
+                              for _ in rows))
+
+    def close(self):
+        self.fp.close()
+
+
+class _CsvWriter(_ExportWriter):
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        import csv
+        super(_CsvWriter, self).__init__(path, columns)
+        self.fp = open(self.path, 'wb')
+        self.writer = csv.writer(self.fp)
+        self.writer.writerow(self.names)
+
+    def write(self, rows):
+        text = [i for i, _ in enumerate(self.types) if _ == 's']
+        for row in rows:
+            row = list(row)
+            for i in text:
+                if row[i] is not None:
+                    row[i] = row[i].encode('utf-8')
+            self.writer.writerow(row)
+
+    def close(self):
+        self.fp.close()
+
+
+class _NpzWriter(_ExportWriter):
+    """Write each batch to a numbered .npz file, `<kind>.00000.npz` onwards"""
+    extension = 'npz'
+
+    def __init__(self, path, columns):
+        super(_NpzWriter, self).__init__(path, columns)
+        self.basepath = path
+        self.parts = 0
+
+    def write(self, rows):
+        import numpy as np
+
+        np.savez('%s.%05d.npz' % (self.basepath, self.parts),
+                 **dict(zip(self.names, self.columns(rows))))
+        self.parts += 1
+
+
+class _ParquetWriter(_ExportWriter):
+    """Write each batch as a Parquet row group. Requires pyarrow"""
+    extension = 'parquet'
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise MCError("Parquet export requires pyarrow")
+        super(_ParquetWriter, self).__init__(path, columns)
+        self.pa = pyarrow
+        types = {'i': pyarrow.int64(), 'f': pyarrow.float64(), 's': pyarrow.string()}
+        self.schema = pyarrow.schema([(name, types[_])
+                                      for name, _ in zip(self.names, self.types)])
+        self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+
+    def write(self, rows):
+        arrays = [self.pa.array(list(_), type=field.type)
+                  for _, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+_EXPORT_WRITERS = collections.OrderedDict((_.extension, _) for _ in (
+    _NdjsonWriter, _CsvWriter, _NpzWriter, _ParquetWriter))
+
+
+
+
+class Inventory(NbtListObject):
+    """Base class for Inventories"""
+    __slots__ = ()
+    ElementClass = Item
+
+    def item(self, slot):
+        """Return the Item in a Slot"""
+        for item in self:
+            if item['Slot'] == slot:
+                return item
+        else:
+            raise MCError("Slot {0} is empty".format(slot))
+
+
+    def find(self, ID, meta=None, label=None):
+        """
+        Return an item in Inventory that matches `ID` and `meta` (Damage)
+        `ID` can be int, string, or (ID, meta) iterable. `meta` is ignored if None.
+        """
+        if not isinstance(ID, (int, str, bytes)):
+            ID, meta = ID
+
+        for item in self:
+            if item['id'] == ID and (meta is None or item['Damage'] == meta):
+                return item
+        else:
+            if label:
+                msg = "No {0} found in inventory".format(label)
+            else:
+                msg = "Not found in inventory: {0}".format((ID, meta))
+            raise MCError(msg)
+
+
+
+
+class PlayerInventory(Inventory):
+    """A Player's Inventory"""
+    __slots__ = ('free_slots', 'free_armor')
+
+    def __init__(self, nbt):
+        super(PlayerInventory, self).__init__(nbt)
+
+        if len(self) == 40:  # shortcut for full inventory
+            self.free_slots = []
+            self.free_armor = []
+        else:
+            slots = set(_["Slot"] for _ in self)
+            self.free_slots = sorted(set(range(36))       - slots)
+            self.free_armor = sorted(set(range(100, 104)) - slots)
+
+
+    def stack_item(self, item, wear_armor=True):
+        """
+        Add an item clone to the inventory, trying to stack it with other items
+        according to item's max stack size. Original item is never changed.
+        Raise ValueError if item count is zero or greater than max stack size.
+        Return a 3-tuple (count_remaining, [slots, ...], [counts, ...])
+        """
+        item = item.clone()
+
+        size = item.type.stacksize
+        count = item["Count"]  # item.count will not be changed until fully stacked
+
+        # Assertions
+        if count == 0:
+            raise ValueError("Item count is zero: %s" % item)
+
+        if count > size:
+            raise ValueError(
+                "Item count is greater than max stack size (%d/%d): %s" %
+                (count, size, item))
+
+        # Shortcut 1-stack items like tools, armor, weapons, etc
+        if size == 1:
+            try:
+                return 0, [(self.add_item(item, wear_armor, clone=True), 1)]
+            except MCError:
+                return count, []
+
+        # Loop each inventory slot, stacking the item onto similar items
+        # that are not maximized until item count is 0
+        slots  = []
+        for stack in self:
+            if (stack.key == item.key and
+                stack["Count"] < size and
+                stack.same_tag(item)):  # avoid stacking named items, etc
+
+                total = stack["Count"] + count
+                diff = min(size, total) - stack["Count"]
+                stack["Count"] += diff
+                count          -= diff
+
+                slots.append((stack["Slot"], diff))
+
+                if count == 0:
+                    break
+
+        if count > 0:
+            item["Count"] = count
+            try:
+                slots.append((self.add_item(item, wear_armor, clone=False),
+                              count))
+                count = 0
+            except MCError:
+                pass
+
+        return count, slots
+
+
+    def add_item(self, item, wear_armor=True, clone=True):
+        """Add an item (or a clone) to a free inventory slot.
+            Return the used slot space, if any, or raise mc.MCError
+        """
+        e = MCError("No suitable free inventory slot to add %s" %
+                    item.description)
+
+        # shortcut for no free slots
+        if not self.free_slots and not self.free_armor:
+            raise e
+
+        # Get a free slot suitable for the item
+        # For armor, try to wear in its corresponding slot
+        slot = None
+        if wear_armor and item.type.is_armor:
+            slot = item.type.armorslot
+            if slot in self.free_armor:
+                self.free_armor.remove(slot)
+            else:
+                # Corresponding armor slot is not free
+                slot = None
+
+        if slot is None:
+            if not self.free_slots:
+                raise e
 
             slot = self.free_slots.pop(0)
 
-        # Add the item
-        if clone:
-            item = item.clone()
-        item.set_slot(slot)
-        self.append(item)
+        # Add the item
+        if clone:
+            item = item.clone()
+        item.set_slot(slot)
+        self.append(item)
+
+        return slot
+
+
+
+
+class BookAndQuill(Item):
+    __slots__ = ()
+
+    @property
+    def pages(self):
+        if 'tag' not in self:
+            return []
+            #self.get_nbt().append(self._blank_tag())
+        return self['tag']['pages']
+    @pages.setter
+    def pages(self, value):
+        if 'tag' not in self:
+            self.get_nbt().append(self._blank_tag())
+        self['tag']['pages'] = value
+
+    def _blank_tag(self):
+        """
+        Books that were never written or opened contain no 'tag' key
+        Return such key as the game does for a book that was just opened for the
+        first time: with a "pages" list containing an empty string as 1st page
+        """
+        from .pymclevel import nbt
+        return nbt.TAG_Compound([nbt.TAG_List([nbt.TAG_String()], 'pages')], 'tag')
+
+
+
+
+class RegionFile(object):
+    """
+    Access to an Anvil region file: its chunk location and timestamp tables,
+    and raw chunk data. Unlike pymclevel's MCRegionFile, it never creates or
+    modifies the file in place, and is cheap enough to be used on thousands
+    of regions just to read their headers. Changes are saved to a new file
+    that atomically replaces the original one
+    """
+    SECTOR_BYTES = 4096
+    CHUNKS = 1024  # 32 x 32
+
+    COMPRESSION_GZIP = 1
+    COMPRESSION_ZLIB = 2
+    COMPRESSION_NONE = 3
+    COMPRESSION_EXTERNAL = 128  # payload is in a separate .mcc file
+
+    _re_filename = re.compile(r'^r\.(-?\d+)\.(-?\d+)\.mca$')
+
+    def __init__(self, path):
+        self.path = path
+        self.rx, self.rz = self.coords(path)
+
+        stat = os.stat(path)
+        self.mtime = stat.st_mtime
+        self.size  = stat.st_size
+
+        with open(path, 'rb') as fp:
+            header = fp.read(2 * self.SECTOR_BYTES)
+
+        # Empty or truncated headers are regions with no chunks
+        header = header.ljust(2 * self.SECTOR_BYTES, b'\0')
+        self.locations  = struct.unpack('>1024I', header[:self.SECTOR_BYTES])
+        self.timestamps = struct.unpack('>1024I', header[self.SECTOR_BYTES:])
+
+    @classmethod
+    def coords(cls, path):
+        """Return (rx, rz) region coordinates from a region file path"""
+        match = cls._re_filename.match(osp.basename(path))
+        if not match:
+            raise MCError("Not a region file: %s" % path)
+        return int(match.group(1)), int(match.group(2))
+
+    @staticmethod
+    def index(cx, cz):
+        """Index of a chunk in the region header tables"""
+        return (cx & 0x1F) + (cz & 0x1F) * 32
+
+    def position(self, index):
+        """Return (cx, cz), the (absolute) chunk coordinates of an index"""
+        return (self.rx * 32 + (index & 0x1F),
+                self.rz * 32 + (index >> 5))
+
+    def timestamp(self, cx, cz):
+        """Chunk last modification time, in seconds since epoch. 0 if absent"""
+        return self.timestamps[self.index(cx, cz)]
+
+    def __contains__(self, pos):
+        return self.locations[self.index(*pos)] != 0
+
+    def __iter__(self):
+        """Iterate on (cx, cz) positions of existing chunks"""
+        return (self.position(_) for _ in range(self.CHUNKS) if self.locations[_])
+
+    def __len__(self):
+        return self.CHUNKS - self.locations.count(0)
+
+    @property
+    def bitmap(self):
+        """Chunk presence bitmap, as an int with bits set at existing indexes"""
+        bitmap = 0
+        for index, location in enumerate(self.locations):
+            if location:
+                bitmap |= 1 << index
+        return bitmap
+
+    def iter_raw(self, positions=None):
+        """
+        Yield (cx, cz, compression, data) for each existing chunk, optionally
+        only in `positions`, a (cx, cz) iterable. Data is read in file order
+        """
+        if positions is None:
+            indexes = [_ for _ in range(self.CHUNKS) if self.locations[_]]
+        else:
+            indexes = [self.index(*_) for _ in positions if _ in self]
+        indexes.sort(key=lambda _: self.locations[_])
+
+        with open(self.path, 'rb') as fp:
+            for index in indexes:
+                offset, sectors = self.locations[index] >> 8, self.locations[index] & 0xFF
+                fp.seek(offset * self.SECTOR_BYTES)
+                data = fp.read(sectors * self.SECTOR_BYTES)
+                if len(data) < 5:
+                    log.warning("Truncated chunk %d in %s", index, self.path)
+                    continue
+                length, compression = struct.unpack('>IB', data[:5])
+                data = data[5:length + 4]
+                cx, cz = self.position(index)
+                if compression & self.COMPRESSION_EXTERNAL:
+                    with open(self.external_path(cx, cz), 'rb') as ext:
+                        data = ext.read()
+                yield cx, cz, compression & ~self.COMPRESSION_EXTERNAL, data
+
+    def external_path(self, cx, cz):
+        """Path of the separate .mcc file of a chunk too big for the region"""
+        return osp.join(osp.dirname(self.path), 'c.%d.%d.mcc' % (cx, cz))
+
+    def iter_nbt(self, positions=None):
+        """Yield (cx, cz, chunk root tag) for each existing chunk, as iter_raw()"""
+        from .pymclevel import nbt
+        for cx, cz, compression, data in self.iter_raw(positions):
+            yield cx, cz, nbt.load(buf=self.decompress(compression, data))
+
+    def save(self, changes, timestamp=None):
+        """
+        Atomically replace the region file with one where chunks in `changes`,
+        a {(cx, cz): (compression, data)} dict of raw chunk data as from
+        iter_raw() or compress(), are added or replaced, or deleted if None
+        Their timestamp is set to `timestamp`, by default current time, or
+        taken from a {(cx, cz): timestamp} dict, if given one. Separate .mcc
+        files of changed chunks no longer stored in them are deleted
+        """
+        now = int(time.time())
+        if isinstance(timestamp, dict):
+            stamps = {self.index(*_): timestamp[_] for _ in timestamp}
+        else:
+            stamps = {}
+            if timestamp is not None:
+                now = timestamp
+
+        changes = {self.index(*_): changes[_] for _ in changes}
+        locations  = [0] * self.CHUNKS
+        timestamps = list(self.timestamps)
+        for index in changes:
+            timestamps[index] = 0 if changes[index] is None else stamps.get(index, now)
+
+        external = set()  # indexes of chunks written to a .mcc file
+
+        def payloads():
+            for cx, cz, compression, data in self.iter_raw():
+                index = self.index(cx, cz)
+                if index not in changes:
+                    yield index, compression, data
+            for index, change in changes.items():
+                if change is not None:
+                    yield (index,) + tuple(change)
+
+        def write(fp):
+            fp.seek(2 * self.SECTOR_BYTES)
+            sector = 2
+            for index, compression, data in payloads():
+                payload = struct.pack('>IB', len(data) + 1, compression) + data
+                sectors = -(-len(payload) // self.SECTOR_BYTES)
+                if sectors > 0xFF:
+                    # Too big for the location table, store in a .mcc file
+                    _atomic_write(self.external_path(*self.position(index)),
+                                  lambda _: _.write(data))
+                    external.add(index)
+                    payload = struct.pack('>IB', 1, compression |
+                                          self.COMPRESSION_EXTERNAL)
+                    sectors = 1
+                fp.write(payload.ljust(sectors * self.SECTOR_BYTES, b'\0'))
+                locations[index] = sector << 8 | sectors
+                sector += sectors
+            fp.seek(0)
+            fp.write(struct.pack('>1024I', *locations))
+            fp.write(struct.pack('>1024I', *timestamps))
+
+        _atomic_write(self.path, write)
+        self.__init__(self.path)
+
+        for index in changes:
+            path = self.external_path(*self.position(index))
+            if index not in external and osp.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def compress(cls, nbt):
+        """Return (compression, data), the raw chunk data of a chunk root tag"""
+        return cls.COMPRESSION_ZLIB, zlib.compress(nbt.save(compressed=False))
+
+    @classmethod
+    def decompress(cls, compression, data):
+        if compression == cls.COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        if compression == cls.COMPRESSION_GZIP:
+            return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        if compression == cls.COMPRESSION_NONE:
+            return data
+        raise MCError("Unknown chunk compression type: %d" % compression)
+
+    def __repr__(self):
+        return "<{0}({1}, {2}, {3} chunks)>".format(self.__class__.__name__,
+                                                    self.rx, self.rz, len(self))
+
+
+
+
+class ChunkMap(object):
+    """
+    Chunk presence bitmap of a Dimension, one 1024-bit int per region, built
+    from region files location tables. If a `cache` sidecar file path is
+    given, the bitmap is saved to it, and loaded back on next use, only
+    re-reading headers of region files whose modification time or size
+    changed since. So sizing, bounding and checking chunks of even a huge
+    world does not require reading all its regions. Only Anvil '.mca'
+    region files are read, see World._level_chunk_positions()
+    """
+    _magic = b'PMCTCMAP'
+    _version = 1
+    _record = struct.Struct('>iiqd128s')  # rx, rz, size, mtime, bitmap
+
+    def __init__(self, path, cache=None):
+        self.path  = path   # Region directory
+        self.cache = cache
+        self.regions = {}   # (rx, rz): bitmap
+        self._counts = {}   # (rx, rz): number of chunks
+        self._stats  = {}   # (rx, rz): (size, mtime)
+        self._filenames = {}  # (rx, rz): region file name, as listed
+        if cache:
+            self._load()
+        self.refresh()
+
+    def refresh(self):
+        """Re-read headers of added or changed regions. Return True on changes"""
+        try:
+            filenames = os.listdir(self.path)
+        except OSError:  # Dimension not yet generated
+            filenames = []
+
+        changed = False
+        seen = set()
+        for filename in filenames:
+            try:
+                key = RegionFile.coords(filename)
+            except MCError:
+                continue
+            seen.add(key)
+            self._filenames[key] = filename
 
-        return slot
+            path = osp.join(self.path, filename)
+            stat = os.stat(path)
+            if self._stats.get(key) == (stat.st_size, stat.st_mtime):
+                continue
 
+            region = RegionFile(path)
+            self._set(key, region.bitmap, (region.size, region.mtime))
+            changed = True
 
+        for key in set(self.regions) - seen:
+            self._set(key, None, None)
+            self._filenames.pop(key, None)
+            changed = True
 
+        if changed and self.cache:
+            self._save()
+        return changed
 
-class BookAndQuill(Item):
+    def _set(self, key, bitmap, stat):
+        if bitmap is None:
+            del self.regions[key], self._counts[key], self._stats[key]
+            return
+        self.regions[key] = bitmap
+        self._counts[key] = bin(bitmap).count('1')
+        self._stats[key] = stat
+
+    def _load(self):
+        try:
+            with open(self.cache, 'rb') as fp:
+                data = fp.read()
+        except IOError:
+            return
+
+        header = len(self._magic) + 1
+        if (data[:len(self._magic)] != self._magic or
+            struct.unpack('>B', data[len(self._magic):header])[0] != self._version or
+            (len(data) - header) % self._record.size):
+            log.warning("Ignoring invalid chunk map cache: %s", self.cache)
+            return
+
+        for offset in range(header, len(data), self._record.size):
+            rx, rz, size, mtime, bitmap = self._record.unpack_from(data, offset)
+            self._set((rx, rz), int(binascii.hexlify(bitmap), 16), (size, mtime))
+
+    def _save(self):
+        def write(fp):
+            fp.write(self._magic + struct.pack('>B', self._version))
+            for (rx, rz), bitmap in sorted(self.regions.items()):
+                size, mtime = self._stats[(rx, rz)]
+                fp.write(self._record.pack(rx, rz, size, mtime, binascii.unhexlify(
+                    '%0256x' % bitmap)))
+        try:
+            if not osp.isdir(osp.dirname(self.cache)):
+                os.makedirs(osp.dirname(self.cache))
+            _atomic_write(self.cache, write)
+        except (IOError, OSError) as e:
+            log.debug("Could not save chunk map cache %s: %s", self.cache, e)
+
+    def region_path(self, rx, rz):
+        """Path of the (rx, rz) region file, as found in the region directory"""
+        return osp.join(self.path, self._filenames.get((rx, rz), 'r.%d.%d.mca' % (rx, rz)))
+
+    def __contains__(self, pos):
+        cx, cz = pos
+        return bool(self.regions.get((cx >> 5, cz >> 5), 0) >> RegionFile.index(cx, cz) & 1)
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def __iter__(self):
+        """Iterate on (cx, cz) positions of existing chunks, region by region"""
+        for (rx, rz), bitmap in sorted(self.regions.items()):
+            index = 0
+            while bitmap:
+                if bitmap & 1:
+                    yield rx * 32 + (index & 0x1F), rz * 32 + (index >> 5)
+                bitmap >>= 1
+                index += 1
 
     @property
-    def pages(self):
-        if 'tag' not in self:
-            return []
-            #self.get_nbt().append(self._blank_tag())
-        return self['tag']['pages']
-    @pages.setter
-    def pages(self, value):
-        if 'tag' not in self:
-            self.get_nbt().append(self._blank_tag())
-        self['tag']['pages'] = value
+    def bounds(self):
+        """
+        Return ((cx_min, cx_max), (cz_min, cz_max)), inclusive chunk
+        coordinates bounds of existing chunks, or None if there are none
+        """
+        if not self.regions:
+            return None
+
+        # Only regions on the edges matter, and within them only their
+        # outermost rows and columns of chunks
+        def edge(axis, reverse):
+            coord = (min, max)[reverse](_[axis] for _ in self.regions)
+            bitmap = 0
+            for key in self.regions:
+                if key[axis] == coord:
+                    bitmap |= self.regions[key]
+            lines = range(32)
+            for line in (reversed(lines) if reverse else lines):
+                mask = _REGION_LINE_MASKS[axis][line]
+                if bitmap & mask:
+                    return coord * 32 + line
+
+        return ((edge(0, False), edge(0, True)),
+                (edge(1, False), edge(1, True)))
 
-    def _blank_tag(self):
+    def __repr__(self):
+        return "<{0}({1!r}, {2} regions, {3} chunks)>".format(
+            self.__class__.__name__, self.path, len(self.regions), len(self))
+
+
+# Bitmap masks of each column (same cx) and row (same cz) of chunks in a region
+_REGION_LINE_MASKS = (
+    [sum(1 << (x + 32 * z) for z in range(32)) for x in range(32)],
+    [sum(1 << (x + 32 * z) for x in range(32)) for z in range(32)],
+)
+
+
+
+
+class ChunkSelection(object):
+    """
+    Set of chunk positions, as a 1024-bit int bitmap per region like
+    ChunkMap, built from shapes in block coordinates, such as box(),
+    circle() or polygon(), and combined with set operators |, &, - and ^.
+    A ChunkMap can be an operand, so `selection & world.chunk_map(dim)`
+    are the selected chunks that exist.
+
+    Scans such as World.iter_chunk_tags() and map_chunks() accept one as
+    `selection`, reading each selected chunk only once even if covered by
+    several overlapping shapes
+    """
+    def __init__(self, regions=None):
+        self.regions = {}  # (rx, rz): bitmap
+        for key, bitmap in (regions or {}).items():
+            if bitmap:
+                self.regions[key] = bitmap
+
+    @classmethod
+    def chunks(cls, positions):
+        """Selection of (cx, cz) chunk positions"""
+        regions = collections.defaultdict(int)
+        for cx, cz in positions:
+            regions[(cx >> 5, cz >> 5)] |= 1 << RegionFile.index(cx, cz)
+        return cls(regions)
+
+    @classmethod
+    def from_regions(cls, regions):
+        """Selection of all chunks in (rx, rz) regions"""
+        return cls(dict((tuple(_), _REGION_FULL_MASK) for _ in regions))
+
+    @classmethod
+    def present(cls, chunks):
+        """Selection of all existing chunks in a ChunkMap"""
+        return cls(chunks.regions)
+
+    @classmethod
+    def box(cls, x, z, size=250):
+        """Square box of `size` half-side centered on X, Z, as in get_chunk_positions()"""
+        (cx0, cx1), (cz0, cz1) = _chunk_box(x, z, size)
+        return cls._from_rows((cz, cx0, cx1) for cz in range(cz0, cz1 + 1))
+
+    @classmethod
+    def boxes(cls, boxes):
+        """Union of box()es, from (x, z, size) triples"""
+        selection = cls()
+        for x, z, size in boxes:
+            selection |= cls.box(x, z, size)
+        return selection
+
+    @classmethod
+    def circle(cls, x, z, radius=250):
+        """Chunks touching a circle of `radius` centered on X, Z"""
+        rows = []
+        for cz in range(int(math.floor(z - radius)) >> 4,
+                        (int(math.floor(z + radius)) >> 4) + 1):
+            dz = max(cz * 16 - z, z - (cz * 16 + 16), 0)
+            if dz > radius:
+                continue
+            half = math.sqrt(radius ** 2 - dz ** 2)
+            rows.append((cz, int(math.floor(x - half)) >> 4,
+                             int(math.floor(x + half)) >> 4))
+        return cls._from_rows(rows)
+
+    @classmethod
+    def circles(cls, circles):
+        """Union of circle()s, from (x, z, radius) triples"""
+        selection = cls()
+        for x, z, radius in circles:
+            selection |= cls.circle(x, z, radius)
+        return selection
+
+    @classmethod
+    def polygon(cls, points):
         """
-        Books that were never written or opened contain no 'tag' key
-        Return such key as the game does for a book that was just opened for the
-        first time: with a "pages" list containing an empty string as 1st page
+        Chunks whose center is inside a polygon of (x, z) vertices,
+        using the even-odd rule for self-intersecting ones
+        """
+        points = [(float(x), float(z)) for x, z in points]
+        if len(points) < 3:
+            raise ValueError("A polygon needs at least 3 points: %r" % points)
+        edges = list(zip(points, points[1:] + points[:1]))
+
+        rows = []
+        zs = [_[1] for _ in points]
+        for cz in range(int(math.floor(min(zs))) >> 4,
+                        (int(math.floor(max(zs))) >> 4) + 1):
+            zc = cz * 16 + 8
+            xs = sorted(x0 + (zc - z0) * (x1 - x0) / (z1 - z0)
+                        for (x0, z0), (x1, z1) in edges
+                        if (z0 <= zc) != (z1 <= zc))
+            for xa, xb in zip(xs[::2], xs[1::2]):
+                cx0 = int(math.ceil((xa - 8) / 16))
+                cx1 = int(math.floor((xb - 8) / 16))
+                if cx0 <= cx1:
+                    rows.append((cz, cx0, cx1))
+        return cls._from_rows(rows)
+
+    @classmethod
+    def _from_rows(cls, rows):
+        """Selection of (cz, cx_min, cx_max) inclusive chunk row intervals"""
+        regions = collections.defaultdict(int)
+        for cz, cx0, cx1 in rows:
+            offset = (cz & 0x1F) * 32
+            for rx in range(cx0 >> 5, (cx1 >> 5) + 1):
+                lo = max(cx0 - rx * 32, 0)
+                hi = min(cx1 - rx * 32, 31)
+                regions[(rx, cz >> 5)] |= ((1 << (hi - lo + 1)) - 1) << (offset + lo)
+        return cls(regions)
+
+    def region_positions(self, rx, rz):
+        """Selected (cx, cz) positions in a region, in index order"""
+        bitmap = self.regions.get((rx, rz), 0)
+        index = 0
+        while bitmap:
+            if bitmap & 1:
+                yield rx * 32 + (index & 0x1F), rz * 32 + (index >> 5)
+            bitmap >>= 1
+            index += 1
+
+    def _combine(self, other, op):
+        keys = set(self.regions) | set(other.regions)
+        return self.__class__(dict(
+            (_, op(self.regions.get(_, 0), other.regions.get(_, 0))) for _ in keys))
+
+    def __or__(self, other):
+        return self._combine(other, lambda a, b: a | b)
+
+    def __and__(self, other):
+        return self.__class__(dict(
+            (_, self.regions[_] & other.regions[_])
+            for _ in set(self.regions) & set(other.regions)))
+
+    def __sub__(self, other):
+        return self.__class__(dict(
+            (_, self.regions[_] & ~other.regions.get(_, 0)) for _ in self.regions))
+
+    def __xor__(self, other):
+        return self._combine(other, lambda a, b: a ^ b)
+
+    union        = __or__
+    intersection = __and__
+    difference   = __sub__
+
+    def __eq__(self, other):
+        return isinstance(other, ChunkSelection) and self.regions == other.regions
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __contains__(self, pos):
+        cx, cz = pos
+        return bool(self.regions.get((cx >> 5, cz >> 5), 0) >> RegionFile.index(cx, cz) & 1)
+
+    def __len__(self):
+        return sum(bin(_).count('1') for _ in self.regions.values())
+
+    def __nonzero__(self):
+        return bool(self.regions)
+    __bool__ = __nonzero__
+
+    def __iter__(self):
+        """Iterate on selected (cx, cz) positions, region by region"""
+        for rx, rz in sorted(self.regions):
+            for pos in self.region_positions(rx, rz):
+                yield pos
+
+    bounds = ChunkMap.bounds
+
+    def __repr__(self):
+        return "<{0}({1} regions, {2} chunks)>".format(
+            self.__class__.__name__, len(self.regions), len(self))
+
+
+_REGION_FULL_MASK = (1 << RegionFile.CHUNKS) - 1
+
+
+
+
+# An Entity or Tile Entity difference in ChunkDiff, `key` its UUID, or
+# (x, y, z) for Tile Entities, `status` 'added', 'removed' or 'changed',
+# and `old`, `new` its compound tags in each chunk, None if absent
+EntityChange = collections.namedtuple('EntityChange', 'key status old new')
+
+
+class ChunkDiff(collections.namedtuple('ChunkDiff', 'cx cz status old new')):
+    """
+    A chunk difference from World.diff(), `status` 'added', 'removed' or
+    'changed', and `old`, `new` its root tags in each world, None if absent
+    """
+    __slots__ = ()
+
+    def changes(self):
+        """List of (path, old tag, new tag) of all tag differences"""
+        return list(_nbt_diff(self.old, self.new))
+
+    def entities(self):
+        """List of EntityChanges of Entities, matched by UUID"""
+        def key(entity):
+            uuid = _nbt_uuid(entity)
+            if uuid is None:  # Should never happen, but Pos is next best
+                return (_tag_value(entity, 'id'),
+                        tuple(_.value for _ in entity['Pos']) if 'Pos' in entity else None)
+            return uuid
+        return self._entity_changes(('Entities',), key)
+
+    def tile_entities(self):
+        """List of EntityChanges of Tile Entities, matched by position"""
+        return self._entity_changes(('TileEntities', 'block_entities'),
+                                    lambda _: (_['x'].value, _['y'].value, _['z'].value))
+
+    def _entity_changes(self, tags, key):
+        entities = []
+        for nbt in (self.old, self.new):
+            entities.append(collections.OrderedDict())
+            if nbt is None:
+                continue
+            level = _chunk_level(nbt)
+            for tag in tags:
+                if tag in level:
+                    entities[-1].update((key(_), _) for _ in level[tag])
+        old, new = entities
+
+        changes = []
+        for k, entity in old.items():
+            if k not in new:
+                changes.append(EntityChange(k, 'removed', entity, None))
+            elif not _nbt_equal(entity, new[k]):
+                changes.append(EntityChange(k, 'changed', entity, new[k]))
+        changes.extend(EntityChange(k, 'added', None, entity)
+                       for k, entity in new.items() if k not in old)
+        return changes
+
+
+
+
+class ChunkCache(object):
+    """
+    Persistent store of per-chunk analysis results, in a SQLite database file
+
+    Results are keyed by dimension, chunk coordinates and analysis name and
+    version, and are only valid for the chunk timestamp they were computed
+    for, so a chunk modified since is computed again. When there are more
+    than `max_entries` results, the least recently used ones are evicted
+
+    Results are stored pickled and zlib-compressed, but should still be
+    compact, such as sparse counts instead of dense arrays, as there may be
+    one per chunk of a world
+    """
+    # Bumped on storage format changes, discarding results of older ones
+    FORMAT = 1
+
+    def __init__(self, path, max_entries=1000000):
+        import sqlite3
+        self.path = path
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.FORMAT:
+            self.db.executescript("""
+                DROP TABLE IF EXISTS results;
+                PRAGMA user_version = %d;
+            """ % self.FORMAT)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                analysis  TEXT,
+                version   INTEGER,
+                dim       INTEGER,
+                cx        INTEGER,
+                cz        INTEGER,
+                timestamp INTEGER,
+                atime     REAL,
+                value     BLOB,
+                PRIMARY KEY (analysis, version, dim, cx, cz)
+            );
+            CREATE INDEX IF NOT EXISTS results_atime ON results (atime);
+        """)
+        self._count = len(self)
+
+    def get_many(self, dim, analysis, timestamps):
+        """
+        Return a {(cx, cz): result} dict of valid results of an `analysis`,
+        a (name, version) pair, for chunks in `timestamps`, a
+        {(cx, cz): timestamp} dict, usually of a single region
+        """
+        if not timestamps:
+            return {}
+
+        name, version = analysis
+        cxs = [_[0] for _ in timestamps]
+        czs = [_[1] for _ in timestamps]
+        rows = self.db.execute(
+            "SELECT cx, cz, timestamp, value FROM results"
+            " WHERE analysis = ? AND version = ? AND dim = ?"
+            " AND cx BETWEEN ? AND ? AND cz BETWEEN ? AND ?",
+            (name, version, dim, min(cxs), max(cxs), min(czs), max(czs)))
+
+        hits = {}
+        for cx, cz, timestamp, value in rows:
+            if timestamps.get((cx, cz)) == timestamp:
+                hits[(cx, cz)] = pickle.loads(zlib.decompress(bytes(value)))
+
+        if hits:
+            atime = time.time()
+            self.db.executemany(
+                "UPDATE results SET atime = ?"
+                " WHERE analysis = ? AND version = ? AND dim = ? AND cx = ? AND cz = ?",
+                ((atime, name, version, dim, cx, cz) for cx, cz in hits))
+            self.db.commit()
+        return hits
+
+    def put_many(self, dim, analysis, results):
+        """Store `results`, an iterable of (cx, cz, timestamp, result)"""
+        import sqlite3
+        name, version = analysis
+        atime = time.time()
+        rows = [(name, version, dim, cx, cz, timestamp, atime,
+                 sqlite3.Binary(zlib.compress(pickle.dumps(result,
+                                                           pickle.HIGHEST_PROTOCOL))))
+                for cx, cz, timestamp, result in results]
+        self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            rows)
+        self.db.commit()
+
+        # Replaced rows are also counted, so this is only an upper bound
+        self._count += len(rows)
+        if self._count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used results, down to 90% of max_entries"""
+        self._count = len(self)
+        excess = self._count - int(0.9 * self.max_entries)
+        if self._count <= self.max_entries or excess <= 0:
+            return
+        self.db.execute("DELETE FROM results WHERE rowid IN"
+                        " (SELECT rowid FROM results ORDER BY atime LIMIT ?)",
+                        (excess,))
+        self.db.commit()
+        self._count -= excess
+        log.debug("Evicted %d results from chunk cache %s", excess, self.path)
+
+    def clear(self, name=None):
+        """Delete all results, or only the ones of an analysis name"""
+        if name is None:
+            self.db.execute("DELETE FROM results")
+        else:
+            self.db.execute("DELETE FROM results WHERE analysis = ?", (name,))
+        self.db.commit()
+        self._count = len(self)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __repr__(self):
+        return "<{0}({1!r}, {2} results)>".format(self.__class__.__name__,
+                                                  self.path, len(self))
+
+
+
+
+class ScanCheckpoint(object):
+    """
+    Resumable progress of a long chunk scan, saved to a file
+
+    Holds the set of completed regions of a scan and `state`, a picklable
+    accumulator of its results, saved together atomically at most every
+    `interval` seconds. A scan given a checkpoint, such as map_chunks(),
+    resumes it, skipping completed regions, if the scan selection matches
+    the saved one, or starts over otherwise.
+
+    Results must be accumulated in `checkpoint.state`, as a resumed scan
+    replaces it by the saved state, so when a region is marked completed
+    all its results are already in it
+    """
+    def __init__(self, path, state=None, interval=60):
+        self.path = path
+        self.interval = interval
+        self.state = state
+        # Pickled, as a scan may have changed `state` in place when reset
+        self._initial = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        self.regions = set()
+        self.key = None
+        self.complete = False
+        self._saved = time.time()
+        self._load()
+
+    def _load(self):
+        if not osp.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as fp:
+                data = pickle.load(fp)
+        except Exception as e:
+            log.warn("Ignoring unreadable checkpoint '%s': %s", self.path, e)
+            return
+        self.key      = data['key']
+        self.regions  = data['regions']
+        self.state    = data['state']
+        self.complete = data['complete']
+
+    def begin(self, key):
+        """
+        Start or resume a scan of a selection `key`, or start over if the
+        saved scan was complete. Return the set of completed regions, as
+        (rx, rz) coordinates
+        """
+        if self.key is not None and self.key != key:
+            log.warn("Checkpoint '%s' is for another scan selection, starting over",
+                     self.path)
+            self.reset()
+        elif self.complete:
+            log.info("Checkpoint '%s' is of a complete scan, starting over",
+                     self.path)
+            self.reset()
+        elif self.regions:
+            log.info("Resuming scan from checkpoint '%s', %d regions done",
+                     self.path, len(self.regions))
+        self.key = key
+        return set(self.regions)
+
+    def reset(self):
+        """Discard completed regions and state, for a scan to start over"""
+        self.state = pickle.loads(self._initial)
+        self.regions = set()
+        self.complete = False
+
+    def done(self, region):
+        """Mark a region as completed, saving if `interval` has passed"""
+        self.regions.add(region)
+        if time.time() - self._saved >= self.interval:
+            self.save()
+
+    def finish(self):
+        """Mark the scan as complete and save"""
+        self.complete = True
+        self.save()
+
+    def save(self):
+        data = pickle.dumps(dict(key=self.key, regions=self.regions,
+                                 state=self.state, complete=self.complete),
+                            pickle.HIGHEST_PROTOCOL)
+        _atomic_write(self.path, lambda fp: fp.write(data))
+        self._saved = time.time()
+
+    def remove(self):
+        """Delete the checkpoint file, if any"""
+        if osp.isfile(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return "<{0}({1!r}, {2} regions{3})>".format(
+            self.__class__.__name__, self.path, len(self.regions),
+            ", complete" if self.complete else "")
+
+
+
+
+# A TextIndex search hit: `field` is 'pages', 'title' or 'name', `text` its
+# plain text, `item` the item ID, `owner` the player name or None, `dim` and
+# `pos` (a Pos) the player, container or entity position, `container` the
+# inventory or container ID, and `slot` the (outermost) item slot, if any
+TextHit = collections.namedtuple('TextHit', 'field text item owner dim pos container slot')
+
+_RE_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def _text_terms(text):
+    """Lowercase words of a text, in order, as indexed by TextIndex"""
+    return _RE_TERM.findall(text.lower())
+
+
+def _json_text(value):
+    """Plain text of a JSON text component, such as 1.14+ book pages and names"""
+    if not value or value[0] not in '{["':
+        return value
+    try:
+        node = json.loads(value)
+    except ValueError:
+        return value
+
+    parts = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            parts.append(node.get('text', u''))
+            stack.extend(reversed(node.get('extra', ())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+        else:
+            parts.append(u'%s' % node)
+    return u''.join(parts)
+
+
+def _item_texts(items):
+    """
+    Yield (field, text, item ID, slot) for book pages, book titles and custom
+    names of raw item NBTs, including items nested in them, such as in shulker
+    boxes, which get the slot of their outermost item
+    """
+    stack = [(_, None) for _ in reversed(list(items))]
+    while stack:
+        item, slot = stack.pop()
+        if 'tag' not in item or 'id' not in item:
+            continue
+        if slot is None:
+            slot = _tag_value(item, 'Slot')
+        tag = item['tag']
+        itemid = u'%s' % item['id'].value
+
+        if 'display' in tag and 'Name' in tag['display']:
+            yield 'name', _json_text(tag['display']['Name'].value), itemid, slot
+        if 'title' in tag:
+            yield 'title', tag['title'].value, itemid, slot
+        if 'pages' in tag:
+            yield ('pages', u'\n\n'.join(_json_text(_.value) for _ in tag['pages']),
+                   itemid, slot)
+        if 'BlockEntityTag' in tag and 'Items' in tag['BlockEntityTag']:
+            stack.extend((_, slot) for _ in reversed(list(tag['BlockEntityTag']['Items'])))
+
+
+def _chunk_texts(nbt):
+    """
+    Yield (field, text, item ID, slot, container ID, x, y, z) as in
+    _item_texts() for items in a chunk's containers and entities
+    """
+    for entity in _iter_containers(nbt):
+        pos = (entity['x'].value, entity['y'].value, entity['z'].value)
+        for text in _item_texts(entity['Items']):
+            yield text + (u'%s' % entity['id'].value,) + pos
+
+    level = _chunk_level(nbt)
+    if 'Entities' not in level:
+        return
+    for entity in level['Entities']:
+        items = []
+        for tag in ('Item', 'Items', 'Inventory', 'HandItems', 'ArmorItems'):
+            if tag in entity:
+                if entity[tag].tagID == NbtTag.COMPOUND:
+                    items.append(entity[tag])
+                else:
+                    items.extend(entity[tag])
+        if items:
+            pos = tuple(_.value for _ in entity['Pos'])
+            for text in _item_texts(items):
+                yield text + (u'%s' % entity['id'].value,) + pos
+
+
+
+
+class TextIndex(object):
+    """
+    Full-text inverted index of book pages, book titles and custom item names
+    in containers, entities and player inventories, in a SQLite database file
+
+    Updated incrementally by update(), re-reading only chunks and player
+    files changed since, according to region chunk timestamps and player
+    file mtimes. Searches only query the index, not the world
+    """
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                stamp  REAL
+            );
+            CREATE TABLE IF NOT EXISTS docs (
+                id        INTEGER PRIMARY KEY,
+                source    TEXT,
+                field     TEXT,
+                text      TEXT,
+                item      TEXT,
+                owner     TEXT,
+                dim       INTEGER,
+                x         REAL,
+                y         REAL,
+                z         REAL,
+                container TEXT,
+                slot      INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS docs_source ON docs (source);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT,
+                doc  INTEGER,
+                PRIMARY KEY (term, doc)
+            );
+            CREATE INDEX IF NOT EXISTS terms_doc ON terms (doc);
+        """)
+
+    def update(self, world, dims=None, progress=True):
+        """
+        Index changes in a World since last update, in `dims` dimensions,
+        by default all of them, and in player files.
+        Return the number of chunks and players re-indexed
         """
+        if dims is None:
+            dims = [_ for _ in (0, -1, 1) if osp.isdir(world.region_dir(_))]
+        start = time.time()
+        count = 0
+
+        for dim in dims:
+            stamps = self._stamps('%d/' % dim)
+            changes = []
+            for region in world.iter_regions(dim):
+                changed = []
+                for cx, cz in region:
+                    source = '%d/%d/%d' % (dim, cx, cz)
+                    if stamps.pop(source, None) != region.timestamp(cx, cz):
+                        changed.append((cx, cz))
+                if changed:
+                    changes.append((region, changed))
+
+            # Chunks no longer in the world
+            for source in stamps:
+                self._remove(source)
+
+            pbar = _progress(progress).start(sum(len(_[1]) for _ in changes))
+            for region, changed in changes:
+                tags = dict(((cx, cz), tag) for cx, cz, tag in region.iter_nbt(changed))
+                for cx, cz in changed:
+                    source = '%d/%d/%d' % (dim, cx, cz)
+                    self._remove(source)
+                    if (cx, cz) in tags:
+                        self._add(source, region.timestamp(cx, cz),
+                                  ((field, text, item, None, dim, x, y, z, container, slot)
+                                   for field, text, item, slot, container, x, y, z
+                                   in _chunk_texts(tags[(cx, cz)])))
+                    pbar.update()
+                self.db.commit()
+                count += len(changed)
+            pbar.finish()
+
+        count += self._update_players(world)
+        self.db.commit()
+        log.info("Text index updated with %d changed chunks and players in %.2f seconds",
+                 count, time.time()-start)
+        return count
+
+    def _update_players(self, world):
         from .pymclevel import nbt
-        return nbt.TAG_Compound([nbt.TAG_List([nbt.TAG_String()], 'pages')], 'tag')
+
+        worlddir = osp.dirname(world.filename)
+        stamps = self._stamps('player/')
+        files = [('Player', world.filename)] + _player_files(worlddir)
+
+        count = 0
+        for name, path in files:
+            source = 'player/%s' % name
+            mtime = os.stat(path).st_mtime
+            if stamps.pop(source, None) == mtime:
+                continue
+            self._remove(source)
+            tag = nbt.load(path)
+            if name == 'Player':
+                tag = tag['Data']['Player'] if 'Player' in tag['Data'] else None
+            if tag is not None:
+                pos = tuple(_.value for _ in tag['Pos'])
+                dim = _tag_value(tag, 'Dimension')
+                docs = []
+                for inventory in ('Inventory', 'EnderItems'):
+                    if inventory in tag:
+                        docs.extend((field, text, item, name, dim) + pos + (inventory, slot)
+                                    for field, text, item, slot in _item_texts(tag[inventory]))
+                self._add(source, mtime, docs)
+            count += 1
+
+        for source in stamps:
+            self._remove(source)
+        return count
+
+    def _stamps(self, prefix):
+        """{source: stamp} of indexed sources starting with `prefix`"""
+        return dict(self.db.execute("SELECT source, stamp FROM sources"
+                                    " WHERE substr(source, 1, ?) = ?",
+                                    (len(prefix), prefix)))
+
+    def _add(self, source, stamp, docs):
+        """Index `docs`, (field, text, item, owner, dim, x, y, z, container, slot)"""
+        for doc in docs:
+            cursor = self.db.execute("INSERT INTO docs (source, field, text, item, owner,"
+                                     " dim, x, y, z, container, slot)"
+                                     " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (source,) + tuple(doc))
+            docid = cursor.lastrowid
+            self.db.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?)",
+                                ((_, docid) for _ in set(_text_terms(doc[1]))))
+        self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, stamp))
+
+    def _remove(self, source):
+        self.db.execute("DELETE FROM terms WHERE doc IN"
+                        " (SELECT id FROM docs WHERE source = ?)", (source,))
+        self.db.execute("DELETE FROM docs WHERE source = ?", (source,))
+        self.db.execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def search(self, query, phrase=True, fields=None, limit=None):
+        """
+        List of TextHits for texts containing all words in `query`, case
+        insensitive, and with `phrase`, containing them in that order.
+        `fields` optionally restricts hits to some of 'pages', 'title', 'name'
+        """
+        words = _text_terms(query)
+        terms = sorted(set(words))
+        if not terms:
+            return []
+
+        sql = ("SELECT field, text, item, owner, dim, x, y, z, container, slot"
+               " FROM docs WHERE id IN (SELECT doc FROM terms WHERE term IN (%s)"
+               " GROUP BY doc HAVING COUNT(*) = ?)" % ", ".join('?' * len(terms)))
+        args = terms + [len(terms)]
+        if fields:
+            sql += " AND field IN (%s)" % ", ".join('?' * len(fields))
+            args.extend(fields)
+        sql += " ORDER BY id"
+
+        needle = u' %s ' % u' '.join(words)
+        hits = []
+        for field, text, item, owner, dim, x, y, z, container, slot in self.db.execute(sql, args):
+            if phrase and needle not in u' %s ' % u' '.join(_text_terms(text)):
+                continue
+            hits.append(TextHit(field, text, item, owner, dim,
+                                None if x is None else Pos((x, y, z)),
+                                container, slot))
+            if limit and len(hits) >= limit:
+                break
+        return hits
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def __repr__(self):
+        return "<{0}({1!r}, {2} texts)>".format(self.__class__.__name__,
+                                                self.path, len(self))
+
+
+
+
+class BackupStore(object):
+    """
+    Content-addressed incremental backups of worlds in a directory
+
+    Each chunk's compressed payload, and each level.dat and player file,
+    is stored once in `objects`, named after its SHA-1 hash, and each
+    backup is a snapshot manifest in `snapshots` mapping world files and
+    region chunks to their objects. A backup only reads regions changed
+    since the last snapshot, and in them only chunks whose timestamp
+    changed, so unchanged chunks cost neither I/O nor disk space
+    """
+    _version = 1
+
+    def __init__(self, path):
+        self.path = path
+        for folder in ('objects', 'snapshots'):
+            if not osp.isdir(osp.join(path, folder)):
+                os.makedirs(osp.join(path, folder))
+
+    def snapshots(self):
+        """
+        List of snapshot names, oldest first, by the modification time of
+        their manifest files, so manifests are not read just to sort them
+        """
+        folder = osp.join(self.path, 'snapshots')
+        names = [_[:-len('.json.gz')] for _ in os.listdir(folder)
+                 if _.endswith('.json.gz')]
+        return sorted(names, key=lambda _: (os.stat(self._manifest_path(_)).st_mtime, _))
+
+    def manifest(self, name):
+        """
+        Snapshot manifest, a dict with its `time`, `files` as {path: hash}
+        and `regions` as {path: {'stat': [size, mtime], 'chunks': [[index,
+        compression, timestamp, hash], ...]}}, paths relative to the world
+        """
+        path = self._manifest_path(name)
+        if not osp.isfile(path):
+            raise MCError("Backup snapshot '%s' not found in %s" % (name, self.path))
+        with gzip.open(path, 'rb') as fp:
+            return json.loads(fp.read().decode('utf-8'))
+
+    def _manifest_path(self, name):
+        return osp.join(self.path, 'snapshots', '%s.json.gz' % name)
+
+    def object_path(self, digest):
+        return _backup_object_path(self.path, digest)
+
+    def read(self, digest):
+        with open(self.object_path(digest), 'rb') as fp:
+            return fp.read()
+
+    def backup(self, world, name=None, workers=None, progress=True):
+        """
+        Back up a World, its level.dat, player files and region files of all
+        dimensions, as a new snapshot named `name`, by default after the
+        current time. Regions are backed up in parallel by `workers`
+        processes. Return the snapshot name
+        """
+        if name is None:
+            name = time.strftime('%Y%m%d-%H%M%S')
+        if osp.exists(self._manifest_path(name)):
+            raise MCError("Backup snapshot '%s' already exists" % name)
+
+        snapshots = self.snapshots()
+        previous = self.manifest(snapshots[-1])['regions'] if snapshots else {}
+        worlddir = osp.dirname(world.filename)
+        manifest = dict(version=self._version, time=time.time(),
+                        files={}, regions={})
+        start = time.time()
+
+        files = ['level.dat'] + [osp.relpath(path, worlddir)
+                                 for _, path in _player_files(worlddir)]
+        for path in files:
+            with open(osp.join(worlddir, path), 'rb') as fp:
+                data = fp.read()
+            manifest['files'][path.replace(os.sep, '/')] = _backup_object(self.path, data)
+
+        # Regions not changed at all since previous snapshot are not even read
+        tasks = []
+        chunk_max = 0
+        for dim in _world_dimensions(worlddir):
+            folder = osp.relpath(world.region_dir(dim), worlddir).replace(os.sep, '/')
+            for region in world.iter_regions(dim):
+                key = '/'.join((folder, osp.basename(region.path)))
+                entry = previous.get(key)
+                if entry and entry['stat'] == [region.size, region.mtime]:
+                    manifest['regions'][key] = entry
+                    continue
+                tasks.append((self.path, region.path, key, entry and entry['chunks']))
+                chunk_max += len(region)
+        tasks.sort(key=lambda _: osp.getsize(_[1]), reverse=True)
+
+        progress = _progress(progress).start(chunk_max)
+        stored = 0
+        for key, entry, count in _imap_regions(_backup_region, tasks, workers, progress):
+            manifest['regions'][key] = entry
+            stored += count
+        progress.finish()
+
+        data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        def write(fp):
+            with gzip.GzipFile(fileobj=fp, mode='wb') as gz:
+                gz.write(data)
+        _atomic_write(self._manifest_path(name), write)
+
+        log.info("Backup '%s' of %d files and %d regions (%d changed, %d new chunks)"
+                 " done in %.2f seconds", name, len(manifest['files']),
+                 len(manifest['regions']), len(tasks), stored, time.time()-start)
+        return name
+
+    def restore(self, name, path, dim=None, selection=None, files=None):
+        """
+        Restore a snapshot to `path` world directory, either a whole world,
+        or only the chunks of a ChunkSelection `selection` in Dimension `dim`,
+        into an existing one. Without a selection, all dimensions are
+        restored, or only `dim` if set. Restored chunks not in the snapshot
+        are deleted. `files`, by default True only when restoring a whole
+        world, also restores level.dat and player files
+        """
+        if selection is not None and dim is None:
+            raise ValueError("A dimension is required to restore a selection")
+        manifest = self.manifest(name)
+        if files is None:
+            files = selection is None and dim is None
+        start = time.time()
+
+        if files:
+            for key, digest in manifest['files'].items():
+                target = osp.join(path, *key.split('/'))
+                if not osp.isdir(osp.dirname(target)):
+                    os.makedirs(osp.dirname(target))
+                data = self.read(digest)
+                _atomic_write(target, lambda fp: fp.write(data))
+
+        regions = {}  # region folder: {filename: chunks}
+        if dim is not None:
+            regions[_region_folder(dim)] = {}
+        for key, entry in manifest['regions'].items():
+            folder, filename = key.rsplit('/', 1)
+            if dim is None or folder in regions:
+                regions.setdefault(folder, {})[filename] = entry['chunks']
+
+        count = 0
+        for folder, entries in regions.items():
+            regiondir = osp.join(path, *folder.split('/'))
+            if not osp.isdir(regiondir):
+                os.makedirs(regiondir)
+            filenames = set(entries)
+            if selection is None:
+                # Regions created after the snapshot
+                filenames.update(_ for _ in os.listdir(regiondir)
+                                 if RegionFile._re_filename.match(_))
+            else:
+                filenames.update('r.%d.%d.mca' % _ for _ in selection.regions)
+
+            for filename in sorted(filenames):
+                target = osp.join(regiondir, filename)
+                mask = (_REGION_FULL_MASK if selection is None else
+                        selection.regions.get(RegionFile.coords(filename), 0))
+                chunks = [_ for _ in entries.get(filename, ()) if mask >> _[0] & 1]
+                if not osp.exists(target):
+                    if not chunks:
+                        continue
+                    open(target, 'ab').close()
+                elif selection is None and not chunks:
+                    region = RegionFile(target)
+                    for pos in region:
+                        if osp.exists(region.external_path(*pos)):
+                            os.remove(region.external_path(*pos))
+                    os.remove(target)
+                    continue
+
+                region = RegionFile(target)
+                changes = {}
+                timestamps = {}
+                for index, compression, timestamp, digest in chunks:
+                    pos = region.position(index)
+                    changes[pos] = (compression, self.read(digest))
+                    timestamps[pos] = timestamp
+                for pos in region:
+                    if mask >> RegionFile.index(*pos) & 1 and pos not in changes:
+                        changes[pos] = None
+                if changes:
+                    region.save(changes, timestamps)
+                    count += len(changes)
+
+        log.info("Restored %d chunks of backup '%s' to '%s' in %.2f seconds",
+                 count, name, path, time.time()-start)
+
+    def remove(self, name):
+        """Remove a snapshot. Its objects are only deleted by gc()"""
+        os.remove(self._manifest_path(name))
+
+    def gc(self):
+        """Delete objects not used by any snapshot. Return their number"""
+        used = set()
+        for name in self.snapshots():
+            manifest = self.manifest(name)
+            used.update(manifest['files'].values())
+            used.update(_[3] for entry in manifest['regions'].values()
+                        for _ in entry['chunks'])
+
+        count = 0
+        objects = osp.join(self.path, 'objects')
+        for folder in os.listdir(objects):
+            for filename in os.listdir(osp.join(objects, folder)):
+                if folder + filename not in used:
+                    os.remove(osp.join(objects, folder, filename))
+                    count += 1
+        return count
+
+    def __repr__(self):
+        return "<{0}({1!r})>".format(self.__class__.__name__, self.path)
+
+
+def _world_dimensions(path):
+    """Dimensions of a world directory with a region directory"""
+    dims = []
+    for filename in sorted(os.listdir(path)):
+        match = re.match(r'^DIM(-?\d+)$', filename)
+        if match and osp.isdir(osp.join(path, filename, 'region')):
+            dims.append(int(match.group(1)))
+    if osp.isdir(osp.join(path, 'region')):
+        dims.insert(0, 0)
+    return dims
+
+
+def _region_folder(dim):
+    """Region directory of a Dimension, relative to the world directory"""
+    return 'region' if dim == 0 else 'DIM%d/region' % dim
+
+
+def _backup_object_path(store, digest):
+    return osp.join(store, 'objects', digest[:2], digest[2:])
+
+
+def _backup_object(store, data):
+    """Store `data` in a BackupStore directory, if not already. Return its hash"""
+    digest = hashlib.sha1(data).hexdigest()
+    path = _backup_object_path(store, digest)
+    if not osp.exists(path):
+        try:
+            os.makedirs(osp.dirname(path))
+        except OSError:  # Already exists, possibly created by another worker
+            pass
+        _atomic_write(path, lambda fp: fp.write(data))
+    return digest
+
+
+
+
+class Progress(object):
+    """
+    Base progress sink of chunk scans, reporting nothing
+
+    Subclasses implement report(), which is throttled to at most once per
+    `interval` seconds no matter how often counts are updated, so sinks
+    are cheap to call for every chunk. Counts of worker processes are
+    aggregated by the scan in the main process, see set()
+    """
+    interval = 0.5
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        self.maxval = 0
+        self.count = 0
+        self.start_time = None
+        self._last = 0
+
+    def start(self, maxval):
+        """Start reporting a scan of `maxval` chunks"""
+        self.maxval = maxval
+        self.count = 0
+        self.start_time = self._last = time.time()
+        self.report()
+        return self
+
+    def update(self, count=1):
+        """Add `count` processed chunks"""
+        self.set(self.count + count)
+
+    def set(self, count):
+        """Set the number of processed chunks, such as a total of all workers"""
+        self.count = count
+        now = time.time()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.report()
+
+    def finish(self):
+        """Report the scan as complete"""
+        self.count = self.maxval
+        self.report(final=True)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time if self.start_time else 0
+
+    @property
+    def rate(self):
+        """Processed chunks per second"""
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def report(self, final=False):
+        pass
+
+
+
+
+class ConsoleProgress(Progress):
+    """Console progressbar, the default sink"""
+    interval = 0.2
+
+    def start(self, maxval):
+        self.pbar = _progressbar(maxval)
+        return super(ConsoleProgress, self).start(maxval)
+
+    def report(self, final=False):
+        if final:
+            self.pbar.finish()
+        else:
+            self.pbar.update(min(self.count, self.maxval))
+
+
+
+
+class LogProgress(Progress):
+    """Periodic log messages, suitable for non-interactive jobs"""
+    interval = 10
+
+    def report(self, final=False):
+        if not self.count and not final:
+            return
+        rate = self.rate
+        eta = (self.maxval - self.count) / rate if rate and not final else 0
+        log.info("%s %d of %d chunks (%.0f%%), %.0f chunks/s, %s %d seconds",
+                 "Processed" if final else "Processing",
+                 self.count, self.maxval,
+                 100.0 * self.count / self.maxval if self.maxval else 100,
+                 rate, "elapsed" if final else "ETA",
+                 self.elapsed if final else eta)
+
+
+
+
+class FileProgress(Progress):
+    """
+    Metrics in Prometheus text exposition format, atomically rewritten to a
+    file such as for node_exporter textfile collector, labeled with `job`
+    """
+    interval = 5
+
+    def __init__(self, path, job='pymctoolslib', interval=None):
+        super(FileProgress, self).__init__(interval)
+        self.path = path
+        self.job = job
+
+    def report(self, final=False):
+        labels = '{job="%s"}' % self.job
+        metrics = (
+            ('chunks_processed', "Chunks processed by the current scan", self.count),
+            ('chunks_total', "Chunks to be processed by the current scan", self.maxval),
+            ('chunks_per_second', "Chunk processing rate", self.rate),
+            ('scan_start_time_seconds', "Scan start time, in seconds since epoch",
+             self.start_time),
+            ('scan_done', "Whether the scan has completed", int(final)),
+        )
+        lines = []
+        for name, text, value in metrics:
+            name = 'pymctoolslib_' + name
+            lines.append("# HELP %s %s\n# TYPE %s gauge\n%s%s %r\n" %
+                         (name, text, name, name, labels, value))
+        data = ''.join(lines).encode('utf-8')
+        _atomic_write(self.path, lambda fp: fp.write(data))
+
+
+
+
+# Progress sinks by name, for progress arguments and basic_parser() --progress
+PROGRESS_SINKS = collections.OrderedDict((
+    ('console', ConsoleProgress),
+    ('log', LogProgress),
+    ('file', FileProgress),
+    ('none', Progress),
+))
 
 
 
@@ -1038,6 +4024,9 @@ class World(NbtObject):
         # Default player
         self.player = Player(self.level.root_tag['Data']['Player'])
 
+        # ChunkMap for each Dimension
+        self._chunk_maps = {}
+
 
     @property
     def name(self):
@@ -1071,10 +4060,39 @@ class World(NbtObject):
         if dim is None:
             dim = self.player['Dimension']
 
-        if dim == 0:
-            return self.level
+        if dim == 0:
+            return self.level
+        else:
+            return self.level.getDimension(dim)
+
+
+    def sidecar_path(self, name):
+        """Path of a library data file, such as a cache, in the world directory"""
+        return osp.join(osp.dirname(self.filename), '.pymctoolslib', name)
+
+
+    def chunk_map(self, dim=None, cache=False):
+        """
+        Return the ChunkMap of a Dimension, by default the Player's current,
+        refreshed from any region changes since last call
+
+        If `cache`, the map is also saved to a sidecar file in the world
+        directory, and loaded back by later calls, even from other processes,
+        so only regions changed since are read again. Once requested, this
+        World keeps using and updating the cached map for that Dimension.
+        Otherwise nothing is written to the world directory
+        """
+        if dim is None:
+            dim = self.player['Dimension']
+
+        chunks = self._chunk_maps.get(dim)
+        if chunks is not None and (chunks.cache or not cache):
+            chunks.refresh()
         else:
-            return self.level.getDimension(dim)
+            chunks = self._chunk_maps[dim] = ChunkMap(
+                self.region_dir(dim),
+                self.sidecar_path('chunkmap.DIM%d' % dim) if cache else None)
+        return chunks
 
 
     def get_chunk_positions(self, dim=None, x=None, z=None, size=250):
@@ -1087,6 +4105,45 @@ class World(NbtObject):
         """
         from .pymclevel import box
 
+        chunks = self.chunk_map(dim)
+        if not chunks.regions:
+            return self._level_chunk_positions(dim, x, z, size)
+
+        if x is None and z is None:
+            return len(chunks), chunks
+
+        if x is None or z is None:
+            if not chunks.regions:
+                return 0, []
+            (cx0, cx1), (cz0, cz1) = chunks.bounds
+
+        if x is None:
+            ox = cx0 * 16
+            sx = (cx1 + 1) * 16 - ox
+        else:
+            ox = x - size
+            sx = 2 * size
+
+        if z is None:
+            oz = cz0 * 16
+            sz = (cz1 + 1) * 16 - oz
+        else:
+            oz = z - size
+            sz = 2 * size
+
+        bounds = box.BoundingBox((ox, 0, oz), (sx, self.get_dimension(dim).Height, sz))
+
+        return bounds.chunkCount, bounds.chunkPositions
+
+
+    def _level_chunk_positions(self, dim=None, x=None, z=None, size=250):
+        """
+        get_chunk_positions() using pymclevel chunk lookup instead of a
+        ChunkMap, for MCRegion worlds, not yet converted to Anvil, whose
+        .mcr region files ChunkMap does not read
+        """
+        from .pymclevel import box
+
         world = self.get_dimension(dim)
 
         if x is None and z is None:
@@ -1111,44 +4168,68 @@ class World(NbtObject):
         return bounds.chunkCount, bounds.chunkPositions
 
 
-    def iter_chunks(self, dim=None, x=None, z=None, size=250, progress=True):
+    def iter_chunks(self, dim=None, x=None, z=None, size=250, progress=True,
+                    since=None, watermark=None, selection=None, dims=None):
         """
-        Return a chunk iterator, optionally with console progressbar
+        Return a chunk iterator, optionally reporting progress
+
+        `progress` is a progress sink, by default a console progressbar, as
+        a Progress instance or a PROGRESS_SINKS name. See _progress()
+
+        If `since` is set, only chunks modified after that time (in seconds
+        since epoch) are yielded, according to region files chunk timestamps.
+        If `watermark` is set, `since` defaults to the watermark of that name,
+        and when iteration completes it is updated to the scan start time,
+        so next scans with the same watermark only yield chunks changed
+        since this one. See get_watermark()
+
+        If `selection` is set, a ChunkSelection, only its chunks are read,
+        instead of the box-bounded area of `x`, `z` and `size`
+
+        With `dims`, a list of Dimensions such as [0, -1, 1], all of them are
+        read, one after the other, instead of `dim`, yielding (dim, chunk),
+        with a single progress over all their chunks
         Other parameters are same as get_chunks()
         """
-        chunk_max, chunk_range = self.get_chunk_positions(dim, x, z, size)
+        multi = dims is not None
+        if not multi:
+            dims = [dim]
+
+        scans = [self._chunk_scan(dim, x, z, size, since, watermark, selection)
+                 for dim in dims]
+        chunk_max = sum(_[4] for _ in scans)
 
         if chunk_max <= 0:
-            log.warn("No chunks found in range %d of (%d, %d)",
+            log.warn("No chunks found in range %d of (%s, %s)",
                      size, x, z)
             return
 
-        world = self.get_dimension(dim)
-
-        if progress:
-            pbar = progressbar.ProgressBar(widgets=[' ', progressbar.Percentage(),
-                                                    ' Chunk ',
-                                                         progressbar.SimpleProgress(),
-                                                    ' ', progressbar.Bar('.'),
-                                                    ' ', progressbar.ETA(), ' '],
-                                           maxval=chunk_max).start()
+        progress = _progress(progress).start(chunk_max)
         start = time.clock()
         chunk_count = 0
 
-        for cx, cz in chunk_range:
-            if not world.containsChunk(cx, cz):
-                continue
+        for dim, (world, chunks, contains, since, _, chunk_range, _) in zip(dims, scans):
+            timestamps = {}  # (rx, rz): region chunk timestamps tuple
+            for cx, cz in chunk_range:
+                if not contains((cx, cz)):
+                    continue
 
-            chunk = world.getChunk(cx, cz)
-            chunk_count += 1
+                if since is not None:
+                    key = (cx >> 5, cz >> 5)
+                    if key not in timestamps:
+                        timestamps[key] = RegionFile(chunks.region_path(*key)).timestamps
+                    if timestamps[key][RegionFile.index(cx, cz)] <= since:
+                        progress.update()
+                        continue
 
-            yield chunk
+                chunk = world.getChunk(cx, cz)
+                chunk_count += 1
 
-            if progress:
-                pbar.update(pbar.currval+1)
+                yield (dim, chunk) if multi else chunk
 
-        if progress:
-            pbar.finish()
+                progress.update()
+
+        progress.finish()
 
         log.info("Data from %d chunks%s extracted in %.2f seconds",
                  chunk_count,
@@ -1156,6 +4237,947 @@ class World(NbtObject):
                     if chunk_max > chunk_count else "",
                  time.clock()-start)
 
+        if watermark is not None:
+            for dim, scan in zip(dims, scans):
+                self.set_watermark(watermark, scan[6], dim)
+
+
+    def _chunk_scan(self, dim, x, z, size, since, watermark, selection):
+        """
+        Return (pymclevel dimension, ChunkMap, chunk presence check, since,
+        number of chunks, chunks iterable, new watermark) of a Dimension
+        for iter_chunks()
+        """
+        since, new_watermark = self._scan_since(dim, since, watermark)
+
+        world = self.get_dimension(dim)
+        chunks = self.chunk_map(dim)
+        if chunks.regions:
+            contains = chunks.__contains__
+        else:
+            # MCRegion world, see _level_chunk_positions()
+            contains = lambda pos: world.containsChunk(*pos)
+            if since is not None:
+                log.warn("Chunk timestamps are only read from Anvil regions,"
+                         " reading all chunks")
+                since = None
+
+        if selection is None:
+            chunk_max, chunk_range = self.get_chunk_positions(dim, x, z, size)
+        elif chunks.regions:
+            chunk_range = selection & chunks
+            chunk_max = len(chunk_range)
+        else:
+            chunk_range = [_ for _ in selection if contains(_)]
+            chunk_max = len(chunk_range)
+
+        return (world, chunks, contains, since, max(chunk_max, 0), chunk_range,
+                new_watermark)
+
+
+    def region_dir(self, dim=None, folder='region'):
+        """
+        Path of a Dimension's region directory, by default Player's current.
+        `folder` is 'region' for terrain chunks, or 'entities' for the
+        separate region files Entities are stored in from 1.17 on
+        """
+        if dim is None:
+            dim = self.player['Dimension']
+
+        path = osp.dirname(self.filename)
+        if dim != 0:
+            path = osp.join(path, 'DIM%d' % dim)
+        return osp.join(path, folder)
+
+
+    def iter_regions(self, dim=None, x=None, z=None, size=250, since=None,
+                     selection=None, folder='region'):
+        """
+        Yield a RegionFile for each region in a Dimension, by default the
+        Player's current, optionally only the ones intersecting the
+        box-bounded area as in get_chunk_positions(), or, if set, a
+        ChunkSelection `selection`, and, if `since` is set, only the ones
+        modified after that time, in seconds since epoch.
+        `folder` is the region directory, as in region_dir()
+        """
+        path = self.region_dir(dim, folder)
+        try:
+            filenames = sorted(os.listdir(path))
+        except OSError:  # Dimension not yet generated
+            return
+
+        (cx0, cx1), (cz0, cz1) = _chunk_box(x, z, size)
+        for filename in filenames:
+            try:
+                rx, rz = RegionFile.coords(filename)
+            except MCError:
+                continue
+            if selection is not None:
+                if (rx, rz) not in selection.regions:
+                    continue
+            elif ((cx0 is not None and not cx0 >> 5 <= rx <= cx1 >> 5) or
+                  (cz0 is not None and not cz0 >> 5 <= rz <= cz1 >> 5)):
+                continue
+            # Chunk timestamps are never newer than their region file
+            if since is not None and os.stat(osp.join(path, filename)).st_mtime <= since:
+                continue
+            yield RegionFile(osp.join(path, filename))
+
+
+    def iter_chunk_tags(self, dim=None, x=None, z=None, size=250, progress=True,
+                        since=None, watermark=None, selection=None, dims=None):
+        """
+        Yield (cx, cz, chunk root tag) for each chunk, read directly from
+        region files instead of pymclevel chunks. Faster and lighter than
+        iter_chunks() for read-only scans, as only the NBT is loaded.
+        With `dims`, a list of Dimensions, all of them are read instead
+        of `dim`, yielding (dim, cx, cz, chunk root tag)
+        Other parameters are same as iter_chunks()
+        """
+        multi = dims is not None
+        if not multi:
+            dims = [dim]
+
+        sinces = {}  # dim: (since, new watermark)
+        regions = []
+        for dim in dims:
+            sinces[dim] = self._scan_since(dim, since, watermark)
+            regions.extend((dim, _, list(_region_positions(_, x, z, size,
+                                                           sinces[dim][0], selection)))
+                           for _ in self.iter_regions(dim, x, z, size,
+                                                      sinces[dim][0], selection))
+        chunk_max = sum(len(_[2]) for _ in regions)
+
+        if chunk_max <= 0:
+            if all(_[0] is None for _ in sinces.values()):
+                log.warn("No chunks found in range %d of (%s, %s)",
+                         size, x, z)
+            elif watermark is not None:
+                for dim in dims:
+                    self.set_watermark(watermark, sinces[dim][1], dim)
+            return
+
+        progress = _progress(progress).start(chunk_max)
+        start = time.time()
+
+        for dim, region, positions in regions:
+            for cx, cz, tag in region.iter_nbt(positions):
+                yield (dim, cx, cz, tag) if multi else (cx, cz, tag)
+                progress.update()
+
+        progress.finish()
+
+        log.info("Data from %d chunks extracted in %.2f seconds",
+                 chunk_max, time.time()-start)
+
+        if watermark is not None:
+            for dim in dims:
+                self.set_watermark(watermark, sinces[dim][1], dim)
+
+
+    def diff(self, other, dim=None, selection=None, progress=True):
+        """
+        Yield a ChunkDiff for each chunk added, removed or changed from this
+        World to `other`, such as an older and a newer backup of a world, in
+        a Dimension, by default the Player's current, optionally only in a
+        ChunkSelection `selection`.
+
+        Work is proportional to the changes: chunks with same location and
+        timestamp in both region headers are deemed unchanged, and for the
+        others the raw payloads are compared before parsing, so only chunks
+        really changed are loaded. Use ChunkDiff.entities() and
+        tile_entities() to drill down into their differences
+        """
+        from .pymclevel import nbt
+
+        if dim is None:
+            dim = self.player['Dimension']
+
+        paths = (self.region_dir(dim), other.region_dir(dim))
+        keys = set()
+        for path in paths:
+            try:
+                filenames = os.listdir(path)
+            except OSError:  # Dimension not yet generated
+                continue
+            for filename in filenames:
+                try:
+                    keys.add(RegionFile.coords(filename))
+                except MCError:
+                    continue
+        if selection is not None:
+            keys &= set(selection.regions)
+
+        # Compare region headers first, to count candidate chunks for progress
+        tasks = []
+        for key in sorted(keys):
+            regions = []
+            for path in paths:
+                path = osp.join(path, 'r.%d.%d.mca' % key)
+                regions.append(RegionFile(path) if osp.isfile(path) else None)
+            old, new = regions
+
+            mask = _REGION_FULL_MASK if selection is None else selection.regions[key]
+            indexes = []
+            for index in range(RegionFile.CHUNKS):
+                if not mask >> index & 1:
+                    continue
+                location = (old.locations[index] if old else 0,
+                            new.locations[index] if new else 0)
+                timestamp = (old.timestamps[index] if old else 0,
+                             new.timestamps[index] if new else 0)
+                if not any(location):
+                    continue
+                if location[0] != location[1] or timestamp[0] != timestamp[1]:
+                    indexes.append(index)
+            if indexes:
+                tasks.append((old, new, [(old or new).position(_) for _ in indexes]))
+
+        progress = _progress(progress).start(sum(len(_[2]) for _ in tasks))
+        start = time.time()
+        counts = collections.Counter()
+
+        for old, new, positions in tasks:
+            raws = [dict(((cx, cz), (compression, data))
+                         for cx, cz, compression, data in region.iter_raw(positions))
+                    if region else {} for region in (old, new)]
+
+            for pos in positions:
+                progress.update()
+                data = [None if pos not in _ else _[pos] for _ in raws]
+                if None not in data and data[0] == data[1]:
+                    continue
+                data = [None if _ is None else RegionFile.decompress(*_) for _ in data]
+                if None not in data and data[0] == data[1]:  # Only recompressed
+                    continue
+
+                tags = [None if _ is None else nbt.load(buf=_) for _ in data]
+                if tags[0] is None:
+                    status = 'added'
+                elif tags[1] is None:
+                    status = 'removed'
+                elif _nbt_equal(*tags):
+                    continue
+                else:
+                    status = 'changed'
+                counts[status] += 1
+                yield ChunkDiff(pos[0], pos[1], status, *tags)
+
+        progress.finish()
+
+        log.info("%d chunks compared in %.2f seconds: %s",
+                 progress.maxval, time.time()-start,
+                 ", ".join("%d %s" % (counts[_], _)
+                           for _ in ('added', 'removed', 'changed')))
+
+
+    def get_watermark(self, name, dim=None):
+        """
+        Return a named scan watermark of a Dimension, the time (in seconds
+        since epoch) its last scan with that watermark started, or None
+        """
+        return self._watermarks().get(self._watermark_key(name, dim))
+
+
+    def set_watermark(self, name, value, dim=None):
+        """Set or, if `value` is None, delete a named scan watermark"""
+        watermarks = self._watermarks()
+        key = self._watermark_key(name, dim)
+        if value is None:
+            watermarks.pop(key, None)
+        else:
+            watermarks[key] = value
+
+        path = self.sidecar_path('watermarks.json')
+        if not osp.isdir(osp.dirname(path)):
+            os.makedirs(osp.dirname(path))
+        _atomic_write(path, lambda fp: fp.write(
+            json.dumps(watermarks, indent=2, sort_keys=True).encode('utf-8')))
+
+
+    def _watermarks(self):
+        try:
+            with open(self.sidecar_path('watermarks.json')) as fp:
+                return json.load(fp)
+        except IOError:
+            return {}
+
+
+    def _watermark_key(self, name, dim=None):
+        if dim is None:
+            dim = self.player['Dimension']
+        return "%s/DIM%d" % (name, dim)
+
+
+    def _scan_since(self, dim, since=None, watermark=None):
+        """
+        Return (since, new watermark) for a scan, `since` defaulting to the
+        named watermark, if any. The new one is one second before current
+        time, as chunk timestamps are in whole seconds
+        """
+        if since is None and watermark is not None:
+            since = self.get_watermark(watermark, dim)
+        return since, int(time.time()) - 1
+
+
+    def map_chunks(self, func, dim=None, x=None, z=None, size=250,
+                   workers=None, progress=True, since=None, watermark=None,
+                   cache=None, analysis=None, checkpoint=None, selection=None,
+                   dims=None, folder='region'):
+        """
+        Apply `func(cx, cz, tag)` to the root tag of each chunk, read as in
+        iter_chunk_tags(), and yield (cx, cz, result) for non-None results
+
+        With `workers` > 1, chunks are processed in that many worker processes,
+        each reading a whole region at a time, and results are yielded in no
+        particular order. In this case `func` and its results must be picklable,
+        so it must be a module-level function or a functools.partial() of one.
+
+        With a ChunkCache `cache`, results are stored in it and reused for
+        chunks not modified since, keyed by `analysis`, a (name, version)
+        pair that must uniquely identify `func` and its arguments. Results
+        must then be picklable even without `workers`.
+
+        With a ScanCheckpoint `checkpoint`, each region is marked completed
+        once all its results were yielded and consumed, and an interrupted
+        scan with the same selection resumes from the last saved checkpoint,
+        skipping completed regions. See ScanCheckpoint.
+
+        With `dims`, a list of Dimensions such as [0, -1, 1], all of them are
+        scanned at once instead of `dim`, their regions sharing the same
+        workers, and (dim, cx, cz, result) are yielded instead
+
+        `folder` is the region directory chunks are read from, as in
+        region_dir(), such as 'entities' for the Entities of 1.17 onwards.
+        Cached results of each folder need a distinct `analysis`
+        Other parameters are same as iter_chunks()
+        """
+        if cache is not None and analysis is None:
+            raise ValueError("An analysis (name, version) is required to use a cache")
+
+        if (dims is None and (not workers or workers <= 1) and
+            cache is None and checkpoint is None and folder == 'region'):
+            for cx, cz, tag in self.iter_chunk_tags(dim, x, z, size, progress,
+                                                    since, watermark, selection):
+                result = func(cx, cz, tag)
+                if result is not None:
+                    yield cx, cz, result
+            return
+
+        multi = dims is not None
+        if not multi:
+            dims = [self.player['Dimension'] if dim is None else dim]
+
+        # Completed regions are (rx, rz) for a single Dimension, as before
+        # dims were supported, so existing checkpoints can still be resumed
+        def key(dim, rx, rz):
+            return (dim, rx, rz) if multi else (rx, rz)
+
+        def output(dim, cx, cz, result):
+            return (dim, cx, cz, result) if multi else (cx, cz, result)
+
+        sinces = {}  # dim: (since, new watermark)
+        regions = []
+        for dim in dims:
+            sinces[dim] = self._scan_since(dim, since, watermark)
+            regions.extend((dim, _, list(_region_positions(_, x, z, size,
+                                                           sinces[dim][0], selection)))
+                           for _ in self.iter_regions(dim, x, z, size,
+                                                      sinces[dim][0], selection,
+                                                      folder))
+        chunk_max = sum(len(_[2]) for _ in regions)
+
+        if chunk_max <= 0:
+            if all(_[0] is None for _ in sinces.values()):
+                if folder == 'region':
+                    log.warn("No chunks found in range %d of (%s, %s)",
+                             size, x, z)
+            elif watermark is not None:
+                for dim in dims:
+                    self.set_watermark(watermark, sinces[dim][1], dim)
+            return
+
+        progress = _progress(progress).start(chunk_max)
+        start = time.time()
+
+        done = set()
+        if checkpoint is not None:
+            if multi:
+                scan = (tuple(dims), x, z, size,
+                        tuple(sinces[_][0] for _ in dims), analysis, selection)
+            else:
+                scan = (dims[0], x, z, size, sinces[dims[0]][0], analysis, selection)
+            if folder != 'region':
+                scan += (folder,)
+            done = checkpoint.begin(scan)
+
+        # Fetch cached results, leaving only stale chunks to process. Results
+        # of a region are all yielded together, so it can be marked completed
+        tasks = []
+        hits = {}        # path: {(cx, cz): result}, for partially cached regions
+        timestamps = {}  # (dim, cx, cz): timestamp, for stale chunks
+        paths = {}       # path: dim
+        cached = 0
+        for dim, region, positions in regions:
+            if key(dim, region.rx, region.rz) in done:
+                progress.update(len(positions))
+                continue
+
+            if cache is not None:
+                stamps = {_: region.timestamp(*_) for _ in positions}
+                hits[region.path] = cache.get_many(dim, analysis, stamps)
+                progress.update(len(hits[region.path]))
+                cached += len(hits[region.path])
+                positions = [_ for _ in positions if _ not in hits[region.path]]
+                timestamps.update(((dim,) + _, stamps[_]) for _ in positions)
+
+            if positions:
+                tasks.append((func, region.path, positions))
+                paths[region.path] = dim
+                continue
+
+            for (cx, cz), result in hits.pop(region.path, {}).items():
+                if result is not None:
+                    yield output(dim, cx, cz, result)
+            if checkpoint is not None:
+                checkpoint.done(key(dim, region.rx, region.rz))
+
+        # Largest regions first, of any Dimension, so a big one is not left
+        # alone at the end
+        tasks.sort(key=lambda _: len(_[2]), reverse=True)
+
+        for path, results in _imap_regions(_map_region, tasks, workers, progress):
+            dim = paths[path]
+            for (cx, cz), result in hits.pop(path, {}).items():
+                if result is not None:
+                    yield output(dim, cx, cz, result)
+            if cache is not None:
+                cache.put_many(dim, analysis, [(cx, cz, timestamps.pop((dim, cx, cz)), _)
+                                               for cx, cz, _ in results])
+            for cx, cz, result in results:
+                if result is not None:
+                    yield output(dim, cx, cz, result)
+            if checkpoint is not None:
+                checkpoint.done(key(dim, *RegionFile.coords(path)))
+
+        progress.finish()
+
+        if checkpoint is not None:
+            checkpoint.finish()
+
+        log.info("Data from %d chunks (%d cached) processed by %d workers in %.2f seconds",
+                 chunk_max, cached, workers or 1, time.time()-start)
+
+        if watermark is not None:
+            for dim in dims:
+                self.set_watermark(watermark, sinces[dim][1], dim)
+
+
+    def checkpoint(self, name, state=None, interval=60):
+        """Return a named ScanCheckpoint stored in the world directory"""
+        path = self.sidecar_path('checkpoint.%s' % name)
+        if not osp.isdir(osp.dirname(path)):
+            os.makedirs(osp.dirname(path))
+        return ScanCheckpoint(path, state, interval)
+
+
+    def text_index(self, update=True, dims=None, progress=True):
+        """
+        Return the TextIndex stored in the world directory, by default
+        updated with changes since its last update. See TextIndex.update()
+        """
+        path = self.sidecar_path('textindex.sqlite')
+        if not osp.isdir(osp.dirname(path)):
+            os.makedirs(osp.dirname(path))
+        index = TextIndex(path)
+        if update:
+            index.update(self, dims, progress)
+        return index
+
+
+    def chunk_cache(self, max_entries=1000000):
+        """Return a ChunkCache stored in the world directory"""
+        path = self.sidecar_path('chunkcache.sqlite')
+        if not osp.isdir(osp.dirname(path)):
+            os.makedirs(osp.dirname(path))
+        return ChunkCache(path, max_entries)
+
+
+    def block_histogram(self, dim=None, x=None, z=None, size=250, per='total',
+                        data=False, names=True, workers=None, progress=True,
+                        cache=None, selection=None):
+        """
+        Count blocks by type in a Dimension, `per` 'chunk', 'region' or 'total'
+
+        With `names`, a histogram is a {block name: count} dict, block names
+        taken from ItemTypes. Otherwise it is a numpy array indexed by numeric
+        block ID, or by `ID << 4 | data` if `data`, for pre-1.13 worlds, and a
+        {palette block name: count} Counter for newer, palette-based ones.
+        Air in sections not stored in chunks is not counted.
+
+        For 'total', return a single histogram. For 'chunk' and 'region',
+        return a dict of histograms keyed by (cx, cz) or (rx, rz) coordinates
+        Other parameters are same as map_chunks()
+        """
+        import numpy as np
+
+        if per not in ('chunk', 'region', 'total'):
+            raise ValueError("per must be 'chunk', 'region' or 'total': %r" % per)
+
+        totals = {}
+        for cx, cz, counts in self.map_chunks(
+                functools.partial(_chunk_block_counts, data=data),
+                dim, x, z, size, workers=workers, progress=progress,
+                cache=cache, analysis=("block_histogram(data=%r)" % data, 2),
+                selection=selection):
+            if per == 'chunk':
+                key = (cx, cz)
+            elif per == 'region':
+                key = (cx >> 5, cz >> 5)
+            else:
+                key = None
+            totals[key] = _merge_block_counts(totals.get(key), counts, data)
+
+        def histogram(counts):
+            array, named = counts
+            if not names:
+                if named is None:
+                    return array
+                if array is not None:
+                    named.update({_: int(array[_]) for _ in np.flatnonzero(array)})
+                return named
+
+            result = collections.Counter()
+            if array is not None:
+                for key in np.flatnonzero(array):
+                    if data:
+                        name = _block_name(key >> 4, key & 0x0F)
+                    else:
+                        name = _block_name(key)
+                    result[name] += int(array[key])
+            if named is not None:
+                for key, count in named.items():
+                    result[_palette_name(key)] += count
+            return dict(result)
+
+        if per == 'total':
+            if None not in totals:
+                return {} if names else None
+            return histogram(totals[None])
+
+        return {_: histogram(totals[_]) for _ in totals}
+
+
+    def find_blocks(self, ids, dim=None, x=None, z=None, size=250, data=False,
+                    workers=None, progress=True, cache=None, selection=None):
+        """
+        Find blocks by type in a Dimension, yielding for each chunk with any
+        match a numpy int32 array of their (x, y, z) world coordinates, N x 3,
+        or N x 4 with (x, y, z, data) if `data`. Data is -1 for blocks in
+        palette-based sections (1.13 onwards), which have no data values.
+
+        `ids` is an iterable of block types, each either a numeric ID, a
+        StrID or palette name such as 'diamond_ore' or 'minecraft:spawner',
+        or a (numeric ID or StrID, data) pair to match only that data value.
+        Other parameters are same as map_chunks()
+        """
+        import numpy as np
+
+        numids, numkeys, names = set(), set(), set()
+        for key in ids:
+            meta = None
+            if isinstance(key, (list, tuple)):
+                key, meta = key
+
+            if not isinstance(key, (int, float)):
+                name = key if ':' in key else ':'.join(('minecraft', key))
+                names.add(name)
+                try:
+                    itemtype = ItemTypes.findItem(name, meta)
+                except KeyError:
+                    # Multi-data blocks such as wool have no meta-less type,
+                    # so match all data values of the NumID of any of them
+                    if meta is not None:
+                        continue
+                    itemtype = next((v for k, v in ItemTypes.items.iteritems()
+                                     if k[0] == name and v.is_block
+                                     and v.numid is not None), None)
+                    if itemtype is None:
+                        continue
+                    meta = None
+                else:
+                    if meta is None:
+                        meta = itemtype.meta
+                if itemtype.numid is None or not itemtype.is_block:
+                    continue
+                key = itemtype.numid
+
+            if meta is None:
+                numids.add(int(key))
+            else:
+                numkeys.add(int(key) << 4 | meta)
+
+        func = functools.partial(_chunk_find_blocks,
+                                 numids=np.array(sorted(numids), dtype=np.uint16),
+                                 numkeys=np.array(sorted(numkeys), dtype=np.uint16),
+                                 names=frozenset(names),
+                                 data=data)
+        analysis = ("find_blocks(%r, %r, %r, data=%r)" % (
+            sorted(numids), sorted(numkeys), sorted(names), data), 1)
+        for _, _, coords in self.map_chunks(func, dim, x, z, size,
+                                            workers=workers, progress=progress,
+                                            cache=cache, analysis=analysis,
+                                            selection=selection):
+            yield coords
+
+
+    def iter_containers(self, dim=None, x=None, z=None, size=250, ids=None,
+                        containers=None, progress=True, selection=None):
+        """
+        Yield a Container for each container Tile Entity (any with "Items")
+        in a Dimension. `ids` optionally restricts to containers holding any
+        item of those types, either ItemTypes, numeric IDs or StrIDs, and
+        `containers` to those Tile Entity IDs, such as 'chest' or 'hopper'.
+        Filtering is done on the raw NBT, before creating any object
+        Other parameters are same as iter_chunk_tags()
+        """
+        if ids is not None:
+            ids = _item_ids(ids)
+        if containers is not None:
+            containers = set(_.split(':', 1)[-1].lower() for _ in containers)
+
+        for _, _, tag in self.iter_chunk_tags(dim, x, z, size, progress,
+                                              selection=selection):
+            for entity in _iter_containers(tag, ids, containers):
+                yield Container(entity)
+
+
+    def count_items(self, dim=None, x=None, z=None, size=250, per='total',
+                    ids=None, containers=None, workers=None, progress=True,
+                    cache=None, selection=None):
+        """
+        Total item counts in containers of a Dimension, as a {ItemType: count}
+        Counter, `per` 'chunk', 'region', 'total', or a function that maps
+        chunk (cx, cz) coordinates to a key, such as its owner, or None to
+        skip the chunk. Only items of `ids` types are counted, if given.
+
+        For 'total', return a single Counter, otherwise a dict of Counters
+        Other parameters are same as iter_containers() and map_chunks()
+        """
+        if not (callable(per) or per in ('chunk', 'region', 'total')):
+            raise ValueError("per must be 'chunk', 'region', 'total' "
+                             "or a function: %r" % per)
+
+        if ids is not None:
+            ids = _item_ids(ids)
+        if containers is not None:
+            containers = set(_.split(':', 1)[-1].lower() for _ in containers)
+
+        totals = collections.defaultdict(collections.Counter)
+        func = functools.partial(_chunk_item_counts, ids=ids, containers=containers)
+        analysis = ("count_items(%r, %r)" % (
+            ids and sorted(ids, key=repr), containers and sorted(containers)), 1)
+        for cx, cz, counts in self.map_chunks(func, dim, x, z, size,
+                                              workers=workers, progress=progress,
+                                              cache=cache, analysis=analysis,
+                                              selection=selection):
+            if per == 'chunk':
+                key = (cx, cz)
+            elif per == 'region':
+                key = (cx >> 5, cz >> 5)
+            elif per == 'total':
+                key = None
+            else:
+                key = per(cx, cz)
+                if key is None:
+                    continue
+            totals[key].update(counts)
+
+        def by_type(counts):
+            result = collections.Counter()
+            keys = list(counts)
+            for itemtype, key in zip(ItemTypes.resolve_many(keys), keys):
+                result[itemtype] += counts[key]
+            return result
+
+        if per == 'total':
+            return by_type(totals[None])
+        return {_: by_type(totals[_]) for _ in totals}
+
+
+    def entity_density(self, dim=None, x=None, z=None, size=250, ids=None,
+                       tiles=True, workers=None, progress=True, cache=None,
+                       selection=None):
+        """
+        Count Entities and, if `tiles`, Tile Entities by ID in each chunk of
+        a Dimension, optionally only the ones of `ids` types, such as
+        'item', 'experience_orb' or 'minecraft:hopper', case insensitive,
+        and return an EntityDensity, whose hotspots() are the chunks most
+        likely to lag. Filtering is done on the raw NBT, before creating
+        any object. Entities of 1.17 onwards, stored in separate 'entities'
+        region files, are read from those, in a second scan
+        Other parameters are same as map_chunks()
+        """
+        if dim is None:
+            dim = self.player['Dimension']
+        if ids is not None:
+            ids = set(_full_id(_).lower() for _ in ids)
+
+        density = EntityDensity(dim)
+        for folder in ('region', 'entities'):
+            if folder != 'region' and not osp.isdir(self.region_dir(dim, folder)):
+                continue
+            func = functools.partial(_chunk_entity_counts, ids=ids,
+                                     tiles=tiles and folder == 'region')
+            analysis = ("entity_density(%r, tiles=%r, folder=%r)" % (
+                ids and sorted(ids), tiles, folder), 2)
+            for cx, cz, (counts, sums) in self.map_chunks(func, dim, x, z, size,
+                                                          workers=workers,
+                                                          progress=progress,
+                                                          cache=cache,
+                                                          analysis=analysis,
+                                                          selection=selection,
+                                                          folder=folder):
+                density.add(cx, cz, counts, sums)
+        return density
+
+
+    def surface(self, dim=None, x=None, z=None, size=250, heightmap=True,
+                workers=None, progress=True, cache=None, selection=None):
+        """
+        Top block of every column in a Dimension, as a {(rx, rz): Surface}
+        dict, one per region, each with contiguous 512 x 512 arrays indexed
+        by [z, x] relative to the region, as in a map image:
+
+        - heights: Y of the column top block, Surface.EMPTY if empty or no
+        chunk, as from 1.18 on Y may be negative.
+        - blocks: top block numeric ID or, for palette-based chunks (1.13
+        onwards), 4096 + its index in `names`, the list of block names
+
+        If `heightmap`, chunks' stored heightmaps are used when valid, see
+        _chunk_surface(). Other parameters are same as map_chunks()
+        """
+        import numpy as np
+
+        surfaces = {}
+        indexes = {}  # (rx, rz): {block name: index in names}
+        for cx, cz, (heights, blocks, names) in self.map_chunks(
+                functools.partial(_chunk_surface, heightmap=heightmap),
+                dim, x, z, size, workers=workers, progress=progress,
+                cache=cache, analysis=("surface(heightmap=%r)" % heightmap, 2),
+                selection=selection):
+            key = (cx >> 5, cz >> 5)
+            if key not in surfaces:
+                surfaces[key] = Surface(
+                    heights = np.full((512, 512), Surface.EMPTY, dtype=np.int32),
+                    blocks  = np.zeros((512, 512), dtype=np.uint16),
+                    names   = [],
+                )
+                indexes[key] = {}
+            surface = surfaces[key]
+
+            if names:
+                # Remap chunk palette indexes to region names ones
+                index = indexes[key]
+                remap = np.arange(4096 + len(names), dtype=np.uint16)
+                for i, name in enumerate(names):
+                    if name not in index:
+                        index[name] = len(surface.names)
+                        surface.names.append(name)
+                    remap[4096 + i] = 4096 + index[name]
+                blocks = remap[blocks]
+
+            ox, oz = (cx & 0x1F) * 16, (cz & 0x1F) * 16
+            surface.heights[oz:oz+16, ox:ox+16] = heights.reshape(16, 16)
+            surface.blocks[oz:oz+16, ox:ox+16]  = blocks.reshape(16, 16)
+
+        return surfaces
+
+
+    def transform_chunks(self, func, dim=None, x=None, z=None, size=250,
+                         workers=None, progress=True, selection=None):
+        """
+        Apply `func(cx, cz, tag)` to the root tag of each chunk, which should
+        change it in place and return True if it did so, and save changes.
+
+        Each region is processed and saved independently, with changed
+        region files written to a temporary file and atomically renamed, so
+        a failure leaves each region either fully transformed or untouched.
+        With `workers` > 1, that many worker processes handle one region at
+        a time, so `func` must be picklable as in map_chunks().
+
+        Regions are changed directly on disk, so this should not be mixed
+        with unsaved changes to chunks from iter_chunks(), and the World
+        should be loaded again to see the changes in its pymclevel level.
+
+        Return a {(rx, rz): TransformResult} dict, one for each region
+        Other parameters are same as map_chunks()
+        """
+        tasks = [(func, _.path, list(_region_positions(_, x, z, size, None, selection)))
+                 for _ in self.iter_regions(dim, x, z, size, None, selection)]
+        tasks = [_ for _ in tasks if _[2]]
+        tasks.sort(key=lambda _: len(_[2]), reverse=True)
+        chunk_max = sum(len(_[2]) for _ in tasks)
+
+        if chunk_max <= 0:
+            log.warn("No chunks found in range %d of (%s, %s)",
+                     size, x, z)
+            return {}
+
+        progress = _progress(progress).start(chunk_max)
+        start = time.time()
+
+        results = {}
+        for path, result in _imap_regions(_transform_region, tasks, workers, progress):
+            results[RegionFile.coords(path)] = result
+            if result.error:
+                log.error("Failed to transform region %s: %s",
+                          path, result.error.splitlines()[-1])
+
+        progress.finish()
+
+        log.info("%d chunks modified in %d regions (%d failed) in %.2f seconds",
+                 sum(_.modified for _ in results.values()),
+                 sum(1 for _ in results.values() if _.modified),
+                 sum(1 for _ in results.values() if _.error),
+                 time.time()-start)
+        return results
+
+
+    def edit_players(self, func, workers=None, filter=None, progress=True):
+        """
+        Apply `func(player)` to each Player of a player file, such as
+        'playerdata/<UUID>.dat', which may change it in place, optionally
+        only to the ones for which `filter(player)` is true, and save the
+        ones actually changed, compared to a copy of their NBT before.
+
+        Each player file is loaded, edited and atomically saved on its own,
+        so a failure leaves it untouched, and with `workers` > 1, players
+        are processed in that many worker processes, so `func` and `filter`
+        must be picklable as in map_chunks(), as must their return values.
+
+        The world default 'Player' in level.dat is not included, and as
+        files are changed directly on disk, the World should be loaded again
+        to see the changes in its players.
+
+        Return a {player name: PlayerEdit} dict, names being file names
+        without '.dat', such as UUIDs
+        """
+        names = {}
+        tasks = []
+        for name, path in _player_files(osp.dirname(self.filename)):
+            names[path] = name
+            tasks.append((func, filter, path))
+
+        progress = _progress(progress).start(len(tasks))
+        start = time.time()
+
+        results = {}
+        for path, result in _imap_regions(_edit_player, tasks, workers, progress):
+            results[names[path]] = result
+            if result.error:
+                log.error("Failed to edit player %s: %s",
+                          names[path], result.error.splitlines()[-1])
+
+        progress.finish()
+
+        counts = collections.Counter(_.status for _ in results.values())
+        log.info("%d players changed, %d unchanged, %d skipped, %d failed in %.2f seconds",
+                 counts['changed'], counts['unchanged'], counts['skipped'],
+                 counts['failed'], time.time()-start)
+        return results
+
+
+    def iter_players(self):
+        """Yield (name, Player) for each player, the world default 'Player' first"""
+        yield 'Player', self.player
+        for name in self.level.players:
+            if name != 'Player':
+                yield name, self.get_player(name)
+
+
+    def export(self, path, kinds=None, fmt='ndjson', dim=None, x=None, z=None,
+               size=250, batch_size=10000, workers=None, progress=True,
+               selection=None):
+        """
+        Export entities, villager offers, container items and player
+        inventories to `path` directory, one file per kind, named after it.
+        `kinds` is a subset of those, by default all. `fmt` is one of 'ndjson',
+        'csv', 'npz' (one file per batch) or 'parquet' (requires pyarrow).
+
+        Rows have typed columns read straight from chunk NBT, without creating
+        Entity or Item objects, and are written in batches of `batch_size`.
+        Return a {kind: row count} dict.
+        Other parameters are same as map_chunks()
+        """
+        if fmt not in _EXPORT_WRITERS:
+            raise MCError("Invalid export format '%s', must be one of: %s" %
+                          (fmt, ", ".join(_EXPORT_WRITERS)))
+        kinds = list(_EXPORT_COLUMNS if kinds is None else kinds)
+        for kind in kinds:
+            if kind not in _EXPORT_COLUMNS:
+                raise MCError("Invalid export kind '%s', must be one of: %s" %
+                              (kind, ", ".join(_EXPORT_COLUMNS)))
+        if dim is None:
+            dim = self.player['Dimension']
+        if not osp.isdir(path):
+            os.makedirs(path)
+
+        start = time.time()
+        writers = {}
+        buffers = dict((_, []) for _ in kinds)
+        counts = dict((_, 0) for _ in kinds)
+
+        def flush(kind, force=False):
+            # Write full batches only, keeping the remainder until forced
+            rows = buffers[kind]
+            while len(rows) >= batch_size:
+                writers[kind].write(rows[:batch_size])
+                counts[kind] += batch_size
+                del rows[:batch_size]
+            if rows and force:
+                writers[kind].write(rows)
+                counts[kind] += len(rows)
+                del rows[:]
+
+        try:
+            for kind in kinds:
+                writers[kind] = _EXPORT_WRITERS[fmt](osp.join(path, kind),
+                                                     _EXPORT_COLUMNS[kind])
+
+            if 'players' in kinds:
+                for name, player in self.iter_players():
+                    buffers['players'].extend(_player_export_rows(name, player.get_nbt()))
+                    flush('players')
+
+            chunk_kinds = frozenset(kinds) - set(['players'])
+            if chunk_kinds:
+                func = functools.partial(_chunk_export_rows, dim=dim, kinds=chunk_kinds)
+                for _, _, rows in self.map_chunks(func, dim, x, z, size,
+                                                  workers=workers, progress=progress,
+                                                  selection=selection):
+                    for kind, batch in rows.items():
+                        buffers[kind].extend(batch)
+                        flush(kind)
+
+            for kind in kinds:
+                flush(kind, force=True)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        log.info("Exported %s to '%s' in %.2f seconds",
+                 ", ".join("%d %s" % (counts[_], _) for _ in kinds),
+                 path, time.time()-start)
+        return counts
+
+
+    def trade_index(self, dim=None, x=None, z=None, size=250):
+        """Return a TradeIndex for the villagers in a Dimension, already built"""
+        index = TradeIndex(self, dim, x, z, size)
+        index.refresh()
+        return index
+
 
     def save(self):
         self.level.saveInPlace()
@@ -1178,10 +5200,274 @@ class World(NbtObject):
 
 
 
+def _chunk_box(x=None, z=None, size=250):
+    """
+    Chunk coordinates bounds of a box-bounded area, as in get_chunk_positions()
+    Return ((cx_min, cx_max), (cz_min, cz_max)), inclusive, each None if
+    its block coordinate is None, meaning that axis is unbounded
+    """
+    return tuple((None, None) if _ is None else ((_ - size) >> 4,
+                                                 (_ + size - 1) >> 4)
+                 for _ in (x, z))
+
+
+def _map_region(args):
+    """
+    World.map_chunks() worker: apply a function to chunks of a region file
+    Return its path and a list of (cx, cz, result), even if None
+    """
+    func, path, positions = args
+    results = []
+    for cx, cz, tag in RegionFile(path).iter_nbt(positions):
+        results.append((cx, cz, func(cx, cz, tag)))
+        if _chunk_progress:
+            _chunk_progress()
+    return path, results
+
+
+def _backup_region(args):
+    """
+    BackupStore.backup() worker: store the changed chunks of a region file
+    Return its manifest key, entry, and number of chunks read
+    """
+    store, path, key, previous = args
+    region = RegionFile(path)
+    previous = dict((_[0], _) for _ in previous or ())
+
+    chunks = []
+    changed = []
+    for pos in region:
+        index = region.index(*pos)
+        if index in previous and previous[index][2] == region.timestamps[index]:
+            chunks.append(previous[index])
+        else:
+            changed.append(pos)
+    if _chunk_progress:
+        _chunk_progress(len(chunks))
+
+    for cx, cz, compression, data in region.iter_raw(changed):
+        chunks.append([region.index(cx, cz), compression,
+                       region.timestamp(cx, cz), _backup_object(store, data)])
+        if _chunk_progress:
+            _chunk_progress()
+    chunks.sort()
+    return key, dict(stat=[region.size, region.mtime], chunks=chunks), len(changed)
+
+
+# Outcome of World.transform_chunks() for a region: number of chunks read and
+# modified, and the error traceback if the region failed and was not saved
+TransformResult = collections.namedtuple('TransformResult', 'chunks modified error')
+
+
+def _transform_region(args):
+    """World.transform_chunks() worker: transform and save a region file"""
+    func, path, positions = args
+    changes = {}
+    try:
+        region = RegionFile(path)
+        for cx, cz, tag in region.iter_nbt(positions):
+            if func(cx, cz, tag):
+                changes[(cx, cz)] = RegionFile.compress(tag)
+            if _chunk_progress:
+                _chunk_progress()
+        if changes:
+            region.save(changes)
+    except Exception:
+        return path, TransformResult(len(positions), 0, traceback.format_exc())
+    return path, TransformResult(len(positions), len(changes), None)
+
+
+# Outcome of World.edit_players() for a player: 'changed', 'unchanged',
+# 'skipped' by the filter or 'failed', the edit function return value,
+# and the error traceback if it failed and the player was not saved
+PlayerEdit = collections.namedtuple('PlayerEdit', 'status result error')
+
+
+def _edit_player(args):
+    """World.edit_players() worker: edit and save a player file"""
+    from .pymclevel import nbt
+
+    func, filter, path = args
+    try:
+        tag = nbt.load(path)
+        player = Player(tag)
+        if filter is not None and not filter(player):
+            outcome = PlayerEdit('skipped', None, None)
+        else:
+            original = _nbt_copy(tag)
+            result = func(player)
+            if _nbt_equal(original, tag):
+                outcome = PlayerEdit('unchanged', result, None)
+            else:
+                data = tag.save(compressed=True)
+                _atomic_write(path, lambda fp: fp.write(data))
+                outcome = PlayerEdit('changed', result, None)
+    except Exception:
+        outcome = PlayerEdit('failed', None, traceback.format_exc())
+    if _chunk_progress:
+        _chunk_progress()
+    return path, outcome
+
+
+def _player_files(path):
+    """(name, path) of each player file in a world directory, as in players/ or playerdata/"""
+    files = []
+    for folder in ('players', 'playerdata'):
+        folder = osp.join(path, folder)
+        if osp.isdir(folder):
+            files.extend((_[:-4], osp.join(folder, _))
+                         for _ in sorted(os.listdir(folder)) if _.endswith('.dat'))
+    return files
+
+
+def _atomic_write(path, write):
+    """
+    Call `write(fp)` on a temporary file in the same directory as `path`,
+    then rename it to `path`, atomically replacing any existing file
+    """
+    fd, temp = tempfile.mkstemp(prefix='.%s.' % osp.basename(path), suffix='.tmp',
+                                dir=osp.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            write(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if osp.exists(path):
+            os.chmod(temp, os.stat(path).st_mode & 0o7777)
+        if hasattr(os, 'replace'):
+            os.replace(temp, path)
+        else:
+            if os.name == 'nt' and osp.exists(path):
+                os.remove(path)  # Not atomic, but rename() can't overwrite
+            os.rename(temp, path)
+    except BaseException:
+        if osp.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _region_positions(region, x=None, z=None, size=250, since=None, selection=None):
+    """
+    Existing chunk positions in a RegionFile, inside the box as in
+    _chunk_box() or, if set, in a ChunkSelection `selection`, and
+    modified after `since`, if set
+    """
+    if selection is not None:
+        positions = ChunkSelection({(region.rx, region.rz): region.bitmap}) & selection
+        x = z = None
+    else:
+        positions = region
+    (cx0, cx1), (cz0, cz1) = _chunk_box(x, z, size)
+    for cx, cz in positions:
+        if ((cx0 is None or cx0 <= cx <= cx1) and
+            (cz0 is None or cz0 <= cz <= cz1) and
+            (since is None or region.timestamp(cx, cz) > since)):
+            yield cx, cz
+
+
+def _progressbar(maxval):
+    """Return a started console chunk progressbar"""
+    return progressbar.ProgressBar(widgets=[' ', progressbar.Percentage(),
+                                            ' Chunk ',
+                                                 progressbar.SimpleProgress(),
+                                            ' ', progressbar.Bar('.'),
+                                            ' ', progressbar.ETA(), ' '],
+                                   maxval=maxval).start()
+
+
+def _progress(progress):
+    """
+    Progress sink of a `progress` argument: a Progress instance, True for
+    console, False or None for none, or a PROGRESS_SINKS name followed by
+    a colon and the output path for 'file', such as 'file:/path/scan.prom',
+    or optionally by the report interval in seconds for the others
+    """
+    if isinstance(progress, Progress):
+        return progress
+    if progress is True:
+        return ConsoleProgress()
+    if not progress:
+        return Progress()
+
+    name, _, arg = progress.partition(':')
+    if name not in PROGRESS_SINKS:
+        raise MCError("Invalid progress sink '%s', must be one of: %s" %
+                      (progress, ", ".join(PROGRESS_SINKS)))
+    sink = PROGRESS_SINKS[name]
+    if issubclass(sink, FileProgress):
+        if not arg:
+            raise MCError("Progress sink '%s' requires a path, as in '%s:PATH'" %
+                          (name, name))
+        return sink(arg)
+    try:
+        return sink(float(arg)) if arg else sink()
+    except ValueError:
+        raise MCError("Invalid progress interval in '%s'" % progress)
+
+
+# Chunk progress callback of region workers, see _imap_regions(): Progress.update()
+# when running in the main process, or a shared counter increment in pool workers
+_chunk_progress = None
+
+
+def _pool_init(counter):
+    """Pool initializer: count chunks processed by workers in a shared Value"""
+    global _chunk_progress
+    def update(count=1):
+        with counter.get_lock():
+            counter.value += count
+    _chunk_progress = update
+
+
+def _imap_regions(func, tasks, workers, progress):
+    """
+    Yield func(task) for each region task, in no particular order if in
+    `workers` > 1 processes. Chunks processed by workers, as reported via
+    _chunk_progress, are added up and set to `progress` periodically
+    """
+    global _chunk_progress
+
+    if not workers or workers <= 1:
+        # Only set while func() runs, not while suspended at yield, so
+        # interleaved or nested scans report to their own `progress`
+        for task in tasks:
+            previous, _chunk_progress = _chunk_progress, progress.update
+            try:
+                outcome = func(task)
+            finally:
+                _chunk_progress = previous
+            yield outcome
+        return
+
+    counter = multiprocessing.Value('l', 0)
+    base = progress.count
+    timeout = max(progress.interval, 0.1)
+    pool = multiprocessing.Pool(workers, _pool_init, (counter,))
+    try:
+        outcomes = pool.imap_unordered(func, tasks)
+        while True:
+            try:
+                outcome = outcomes.next(timeout)
+            except multiprocessing.TimeoutError:
+                progress.set(base + counter.value)
+                continue
+            except StopIteration:
+                break
+            progress.set(base + counter.value)
+            yield outcome
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+
+
 def basic_parser(description=None,
                  player=True,
                  default_world="New World",
                  default_player="Player",
+                 progress=False,
                  **kw_argparser):
     parser = argparse.ArgumentParser(description=description, **kw_argparser)
 
@@ -1209,6 +5495,14 @@ def basic_parser(description=None,
                         default=False, action="store_true",
                         help="Apply changes and save the world.")
 
+    if progress:
+        parser.add_argument('--progress', '-P', default='console',
+                            metavar='SINK',
+                            help="Progress report of chunk scans: %s. The 'file'"
+                                " sink writes metrics to a path given as"
+                                " 'file:PATH'. [Default: '%%(default)s']" %
+                                ", ".join(PROGRESS_SINKS))
+
     return parser
 
 
@@ -1307,13 +5601,7 @@ def iter_chunks(world, x=None, z=None, radius=250, progress=True):
                  radius, x, z)
         return
 
-    if progress:
-        pbar = progressbar.ProgressBar(widgets=[' ', progressbar.Percentage(),
-                                                ' Chunk ',
-                                                     progressbar.SimpleProgress(),
-                                                ' ', progressbar.Bar('.'),
-                                                ' ', progressbar.ETA(), ' '],
-                                       maxval=chunk_max).start()
+    progress = _progress(progress).start(chunk_max)
     start = time.clock()
     chunk_count = 0
 
@@ -1326,11 +5614,9 @@ def iter_chunks(world, x=None, z=None, radius=250, progress=True):
 
         yield chunk
 
-        if progress:
-            pbar.update(pbar.currval+1)
+        progress.update()
 
-    if progress:
-        pbar.finish()
+    progress.finish()
 
     log.info("Data from %d chunks%s extracted in %.2f seconds",
              chunk_count,
@@ -0,0 +1,1710 @@
+# PyMCToolsLib tests
+#
+#    Copyright (C) 2014 Rodrigo Silva (MestreLion) <linux@rodrigosilva.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. See <http://www.gnu.org/licenses/gpl.html>
+
+"""
+Tests for pymctoolslib, using small worlds written to a temporary directory
+
+Region files and NBT are written by the minimal encoder below, so features
+working on raw region data are tested without pymclevel. Only the tests
+reading chunk or level NBT need it, and are skipped if it is not available
+"""
+
+import collections
+import csv
+import gzip
+import json
+import logging
+import os
+import pickle
+import os.path as osp
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+import zlib
+
+from pymctoolslib import pymctoolslib as mc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from pymctoolslib.pymclevel import nbt
+except ImportError:
+    nbt = None
+
+requires_numpy = unittest.skipIf(np is None, "numpy is required")
+requires_pymclevel = unittest.skipIf(nbt is None, "pymclevel is required")
+requires_item_data = unittest.skipIf(
+    not osp.isfile(osp.join(mc.DATADIR, 'tmp_itemblocks.json')),
+    "mceditlib item data is required")
+
+
+
+
+# Minimal NBT writer: a Tag is a (type, value) pair, Compound values being
+# (name, Tag) pairs, and List values an (element type, Tags) pair
+Tag = collections.namedtuple('Tag', 'type value')
+
+(BYTE, SHORT, INT, LONG, FLOAT, DOUBLE, BYTE_ARRAY, STRING, LIST, COMPOUND,
+ INT_ARRAY, LONG_ARRAY) = range(1, 13)
+
+_SCALARS = {BYTE: 'b', SHORT: 'h', INT: 'i', LONG: 'q', FLOAT: 'f', DOUBLE: 'd'}
+_ARRAYS = {BYTE_ARRAY: 'B', INT_ARRAY: 'i', LONG_ARRAY: 'q'}
+
+
+def Byte(value):
+    return Tag(BYTE, value)
+
+
+def Short(value):
+    return Tag(SHORT, value)
+
+
+def Int(value):
+    return Tag(INT, value)
+
+
+def Long(value):
+    return Tag(LONG, value)
+
+
+def Double(value):
+    return Tag(DOUBLE, value)
+
+
+def String(value):
+    return Tag(STRING, value)
+
+
+def ByteArray(values):
+    return Tag(BYTE_ARRAY, values)
+
+
+def IntArray(values):
+    return Tag(INT_ARRAY, values)
+
+
+def LongArray(values):
+    return Tag(LONG_ARRAY, values)
+
+
+def List(element_type, *tags):
+    return Tag(LIST, (element_type, tags))
+
+
+def Compound(*items):
+    return Tag(COMPOUND, items)
+
+
+def _payload(tag):
+    tagtype, value = tag
+    if tagtype in _SCALARS:
+        return struct.pack('>' + _SCALARS[tagtype], value)
+    if tagtype in _ARRAYS:
+        value = [int(_) for _ in value]
+        return struct.pack('>i%d%s' % (len(value), _ARRAYS[tagtype]), len(value), *value)
+    if tagtype == STRING:
+        value = value.encode('utf-8')
+        return struct.pack('>H', len(value)) + value
+    if tagtype == LIST:
+        element_type, tags = value
+        return (struct.pack('>bi', element_type, len(tags)) +
+                b''.join(_payload(_) for _ in tags))
+    if tagtype == COMPOUND:
+        return b''.join(_named(*_) for _ in value) + b'\0'
+    raise ValueError("Unknown tag type: %r" % (tagtype,))
+
+
+def _named(name, tag):
+    name = name.encode('utf-8')
+    return struct.pack('>bH', tag.type, len(name)) + name + _payload(tag)
+
+
+def dumps(tag):
+    """Uncompressed NBT of a root tag"""
+    return _named('', tag)
+
+
+
+
+def block_index(x, y, z):
+    """Index of a block in its section arrays, from coordinates in its chunk"""
+    return (y & 0x0F) << 8 | z << 4 | x
+
+
+def section(y, blocks=(), data=()):
+    """
+    Pre-1.13 chunk section, with the numeric block IDs and data values
+    in `blocks` and `data`, {block_index(): value} dicts, all others air
+    """
+    ids, values = [0] * 4096, [0] * 4096
+    for index, value in dict(blocks).items():
+        ids[index] = value
+    for index, value in dict(data).items():
+        values[index] = value
+    return Compound(('Y', Byte(y)),
+                    ('Blocks', ByteArray(ids)),
+                    ('Data', ByteArray(values[i] | values[i + 1] << 4
+                                       for i in range(0, 4096, 2))))
+
+
+def item(itemid, count=1, damage=0, slot=None, tag=None):
+    tags = [('id', String(itemid)), ('Count', Byte(count)), ('Damage', Short(damage))]
+    if slot is not None:
+        tags.append(('Slot', Byte(slot)))
+    if tag is not None:
+        tags.append(('tag', tag))
+    return Compound(*tags)
+
+
+def entity(entityid, x, y, z, *tags):
+    return Compound(('id', String(entityid)),
+                    ('Pos', List(DOUBLE, Double(x), Double(y), Double(z))),
+                    *tags)
+
+
+def villager(x, y, z, *offers):
+    """Villager entity with `offers`, each a (sell, buy[, buyB]) tuple of items"""
+    recipes = [Compound(*([('sell', _[0]), ('buy', _[1]),
+                           ('uses', Int(0)), ('maxUses', Int(7))] +
+                          [('buyB', _) for _ in _[2:]]))
+               for _ in offers]
+    return entity('minecraft:villager', x, y, z,
+                  ('Offers', Compound(('Recipes', List(COMPOUND, *recipes)))))
+
+
+def tile(tileid, x, y, z, *tags):
+    return Compound(('id', String(tileid)),
+                    ('x', Int(x)), ('y', Int(y)), ('z', Int(z)),
+                    *tags)
+
+
+def chunk(cx, cz, sections=(), entities=(), tiles=(), *tags):
+    """Chunk root tag, with optional extra `tags` in its 'Level'"""
+    return Compound(('Level', Compound(
+        ('xPos', Int(cx)),
+        ('zPos', Int(cz)),
+        ('Sections', List(COMPOUND, *sections)),
+        ('Entities', List(COMPOUND, *entities)),
+        ('TileEntities', List(COMPOUND, *tiles)),
+        *tags)))
+
+
+def write_region(path, chunks):
+    """
+    Write an Anvil region file from a {(cx, cz): (chunk, timestamp)} dict,
+    each chunk either a root Tag or its uncompressed NBT
+    """
+    locations, timestamps, body = [0] * 1024, [0] * 1024, []
+    sector = 2
+    for (cx, cz), (tag, timestamp) in sorted(chunks.items()):
+        data = zlib.compress(tag if isinstance(tag, bytes) else dumps(tag))
+        payload = struct.pack('>IB', len(data) + 1, 2) + data
+        sectors = (len(payload) + 4095) // 4096
+        i = (cx & 31) + (cz & 31) * 32
+        locations[i] = sector << 8 | sectors
+        timestamps[i] = timestamp
+        body.append(payload.ljust(sectors * 4096, b'\0'))
+        sector += sectors
+    if not osp.isdir(osp.dirname(path)):
+        os.makedirs(osp.dirname(path))
+    with open(path, 'wb') as fd:
+        fd.write(struct.pack('>1024I', *locations))
+        fd.write(struct.pack('>1024I', *timestamps))
+        fd.write(b''.join(body))
+
+
+def write_level(worlddir, *players):
+    """
+    Write a world 'level.dat', and for each of `players`, a (name, Player
+    tag) pair, its 'playerdata' file. The default player is in Dimension 0
+    """
+    player = Compound(('Dimension', Int(0)),
+                      ('Pos', List(DOUBLE, Double(0), Double(64), Double(0))),
+                      ('Inventory', List(COMPOUND)))
+    data = Compound(('LevelName', String('Test')),
+                    ('GameRules', Compound()),
+                    ('Player', player))
+    with gzip.open(osp.join(worlddir, 'level.dat'), 'wb') as fd:
+        fd.write(dumps(Compound(('Data', data))))
+    for name, tag in players:
+        path = osp.join(worlddir, 'playerdata', '%s.dat' % name)
+        if not osp.isdir(osp.dirname(path)):
+            os.makedirs(osp.dirname(path))
+        with gzip.open(path, 'wb') as fd:
+            fd.write(dumps(tag))
+
+
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='pymctoolslib-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def path(self, *parts):
+        return osp.join(self.tempdir, *parts)
+
+
+
+
+class WorldTestCase(TempDirTestCase):
+    """Tests on a synthetic world in `worlddir`, loaded with pymclevel"""
+    def setUp(self):
+        super(WorldTestCase, self).setUp()
+        self.worlddir = self.path('world')
+        os.makedirs(self.worlddir)
+        write_level(self.worlddir)
+
+    def write_chunks(self, chunks, region=(0, 0), dim=0):
+        folder = self.worlddir if dim == 0 else osp.join(self.worlddir, 'DIM%d' % dim)
+        write_region(osp.join(folder, 'region', 'r.%d.%d.mca' % region), chunks)
+
+    def world(self):
+        return mc.World(self.worlddir)
+
+
+
+
+class SyntheticItems(object):
+    """Test case mixin installing a small ItemTypes registry, restored after each test"""
+    def setUp(self):
+        super(SyntheticItems, self).setUp()
+        self.registry = mc.ItemTypes._registry
+        mc.ItemTypes._registry = self.registry._replace(
+            items=collections.OrderedDict(), by_numid={}, all_items=[],
+            armor=[], min_numid=0, resolved={})
+        self.stone = mc.ItemType(1, 'stone', None, 'Stone', is_block=True)
+        self.dirt = mc.ItemType(3, 'dirt', None, 'Dirt', is_block=True)
+        self.emerald = mc.ItemType(388, 'emerald', None, 'Emerald')
+        self.helmet = mc.ItemType(298, 'leather_helmet', None, 'Leather Cap',
+                                  maxdamage=55, stacksize=1)
+        mc.ItemTypes.add_items([self.stone, self.dirt, self.emerald, self.helmet])
+
+    def tearDown(self):
+        mc.ItemTypes._registry = self.registry
+        super(SyntheticItems, self).tearDown()
+
+
+
+
+class PosTestCase(unittest.TestCase):
+    def test_sequence(self):
+        pos = mc.Pos([1.5, 64, -20.25])
+        self.assertIsInstance(pos, collections.Sequence)
+        self.assertEqual(tuple(pos), (1.5, 64, -20.25))
+        self.assertEqual((pos.x, pos.y, pos.z), (1.5, 64, -20.25))
+        self.assertEqual((pos[0], pos[-1], len(pos)), (1.5, -20.25, 3))
+        self.assertEqual(list(reversed(pos)), [-20.25, 64, 1.5])
+        self.assertIn(64, pos)
+        self.assertEqual((pos.index(64), pos.count(1.5)), (1, 1))
+
+        with self.assertRaises(AttributeError):
+            pos.x = 0
+        with self.assertRaises(AttributeError):
+            pos.extra = 0
+
+    def test_lazy_coordinates(self):
+        pos = mc.Pos((-1, 10, 530))
+        self.assertIsNone(pos._chunk)
+        self.assertEqual((pos.cx, pos.cz), (-1, 33))
+        self.assertIs(pos.chunkCoords(), pos._chunk)
+        self.assertEqual(pos.chunkPos(), (15, 2, 10))
+        self.assertEqual(pos.regionCoords(), (-1, 1))
+        self.assertEqual(pos.regionPos(), (31, 1))
+
+    def test_from_tag_and_pickle(self):
+        # Any tag whose value is 3 tags will do, such as a writer Tag
+        pos = mc.Pos.from_tag(Tag(LIST, [Double(1.5), Double(64), Double(-20.25)]))
+        self.assertEqual(tuple(pos), (1.5, 64, -20.25))
+        self.assertEqual(pos.chunkCoords(), (0, -2))
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            clone = pickle.loads(pickle.dumps(pos, protocol))
+            self.assertIs(type(clone), mc.Pos)
+            self.assertEqual(tuple(clone), tuple(pos))
+            self.assertIsNone(clone._chunk)
+            self.assertEqual(clone.chunkCoords(), (0, -2))
+
+
+
+
+@requires_pymclevel
+@requires_numpy
+class NbtCopyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tag = nbt.load(buf=dumps(Compound(
+            ('id', String('minecraft:chest')),
+            ('Data', ByteArray([1, 2, 3])),
+            ('Items', List(COMPOUND, item('minecraft:stone', 2, 0, 1),
+                           item('minecraft:dirt', 3, 0, 2))))))
+
+    def test_copy_is_deep_and_equal(self):
+        copy = mc._nbt_copy(self.tag)
+        self.assertTrue(mc._nbt_equal(self.tag, copy))
+        self.assertIsNot(copy['Items'][0], self.tag['Items'][0])
+
+        copy['Items'][0]['Count'].value = 64
+        copy['Data'].value[0] = 9
+        self.assertEqual(self.tag['Items'][0]['Count'].value, 2)
+        self.assertEqual(self.tag['Data'].value[0], 1)
+        self.assertFalse(mc._nbt_equal(self.tag, copy))
+
+    def test_equal(self):
+        reordered = nbt.load(buf=dumps(Compound(
+            ('Items', List(COMPOUND, item('minecraft:stone', 2, 0, 1),
+                           item('minecraft:dirt', 3, 0, 2))),
+            ('Data', ByteArray([1, 2, 3])),
+            ('id', String('minecraft:chest')))))
+        self.assertTrue(mc._nbt_equal(self.tag, reordered))
+
+        del reordered['id']
+        reordered['ID'] = nbt.TAG_String('minecraft:chest')
+        self.assertFalse(mc._nbt_equal(self.tag, reordered))
+        self.assertFalse(mc._nbt_equal(self.tag['Data'], nbt.TAG_Byte_Array(
+            np.array([1, 2], dtype=np.uint8))))
+        self.assertFalse(mc._nbt_equal(nbt.TAG_Int(1), nbt.TAG_Short(1)))
+
+    def test_deep_nesting(self):
+        root = tag = nbt.TAG_List(list_type=mc.NbtTag.LIST)
+        for _ in range(5000):
+            child = nbt.TAG_List(list_type=mc.NbtTag.LIST)
+            tag.append(child)
+            tag = child
+        self.assertTrue(mc._nbt_equal(root, mc._nbt_copy(root)))
+
+    def test_wrappers(self):
+        obj = mc.NbtObject(self.tag)
+        clone = obj.clone()
+        self.assertIsNot(clone.get_nbt(), self.tag)
+        self.assertTrue(obj.nbt_equal(clone))
+        self.assertTrue(obj.nbt_equal(self.tag))
+        self.assertTrue(mc._nbt_equal(obj.copy(), obj.fast_copy()))
+
+
+
+
+@requires_pymclevel
+class NbtObjectTestCase(unittest.TestCase):
+    class Stack(mc.NbtObject):
+        __slots__ = ()
+        _tags = ('id', 'Count', 'tag', 'Inventory')
+
+    class Stacks(mc.NbtListObject):
+        __slots__ = ()
+
+    def setUp(self):
+        self.Stacks.ElementClass = self.Stack
+        self.obj = self.Stack(nbt.load(buf=dumps(Compound(
+            ('id', String('minecraft:chest')), ('Count', Byte(1)),
+            ('tag', Compound(('display', Compound()))),
+            ('Inventory', List(COMPOUND, item('minecraft:stone', 2),
+                               item('minecraft:dirt', 3)))))))
+
+    def test_collection_abcs(self):
+        self.assertIsInstance(self.obj, collections.Mapping)
+        self.assertEqual(sorted(self.obj.keys()), ['Count', 'Inventory', 'id', 'tag'])
+        self.assertEqual(self.obj.get('Count'), 1)
+        self.assertIsNone(self.obj.get('Damage'))
+
+        stacks = self.Stacks(self.obj.get_nbt()['Inventory'])
+        self.assertIsInstance(stacks, collections.MutableSequence)
+        stone, dirt = stacks
+        stacks.reverse()
+        self.assertEqual([_.id for _ in stacks], ['minecraft:dirt', 'minecraft:stone'])
+        self.assertEqual([_['id'].value for _ in self.obj.get_nbt()['Inventory']],
+                         ['minecraft:dirt', 'minecraft:stone'])
+        self.assertIs(stacks.pop(), stone)
+        stacks.append(stone)
+        self.assertEqual(stacks.index(stone), 1)
+        self.assertEqual(len(self.obj.get_nbt()['Inventory']), 2)
+        self.assertEqual(self.obj, self.Stack(self.obj.get_nbt()))
+
+    def test_declared_tags(self):
+        self.assertEqual((self.obj.id, self.obj.count), ('minecraft:chest', 1))
+        self.assertIs(self.obj.tag, self.obj.tag)
+        self.assertEqual([_.id for _ in self.obj.inventory],
+                         ['minecraft:stone', 'minecraft:dirt'])
+
+        self.obj.count = 5
+        self.assertEqual(self.obj['Count'], 5)
+        self.assertRaises(AttributeError, setattr, self.obj, 'inventory', [])
+
+        # Tags replaced or removed through the NBT are rebound
+        self.obj.get_nbt()['id'] = nbt.TAG_String('minecraft:barrel')
+        self.assertEqual(self.obj.id, 'minecraft:barrel')
+        del self.obj.get_nbt()['tag']
+        self.assertIsNone(self.obj.tag)
+
+    def test_tag_clashes(self):
+        def declare(*tags):
+            return mc._NbtSchemaMeta('Clash', (mc.NbtObject,),
+                                     {'__slots__': (), '_tags': tags})
+        self.assertRaises(TypeError, declare, 'Items')  # Mapping.items()
+        self.assertRaises(TypeError, declare, 'get_nbt')
+        declare('id', 'Slot')
+
+    def test_set_absent_tag(self):
+        del self.obj.get_nbt()['Count']
+        self.assertRaises(AttributeError, setattr, self.obj, 'count', 1)
+        self.obj.add_tag('Count', 1, nbt.TAG_Byte)
+        self.obj.count = 2
+        self.assertEqual(self.obj['Count'], 2)
+
+
+
+
+@requires_pymclevel
+@requires_numpy
+class DiffTestCase(WorldTestCase):
+    def setUp(self):
+        super(DiffTestCase, self).setUp()
+        self.newdir = self.path('new')
+        os.makedirs(self.newdir)
+        write_level(self.newdir)
+
+    def mob(self, uuid, x, *tags):
+        return entity('minecraft:cow', x, 64, 0,
+                      ('UUIDMost', Long(0)), ('UUIDLeast', Long(uuid)), *tags)
+
+    def write_new(self, chunks, region=(0, 0)):
+        write_region(osp.join(self.newdir, 'region', 'r.%d.%d.mca' % region), chunks)
+
+    def test_diff(self):
+        chest = tile('minecraft:chest', 16, 64, 0, ('Items', List(COMPOUND)))
+        self.write_chunks({
+            (0, 0): (chunk(0, 0), 100),
+            (1, 0): (chunk(1, 0, entities=[self.mob(1, 16), self.mob(2, 17)], tiles=[chest]), 100),
+            (2, 0): (chunk(2, 0), 100),
+            (3, 0): (chunk(3, 0), 100),
+            (5, 0): (chunk(5, 0), 100),
+        })
+        furnace = tile('minecraft:furnace', 17, 64, 0)
+        self.write_new({
+            (0, 0): (chunk(0, 0), 100),
+            (1, 0): (chunk(1, 0, entities=[self.mob(1, 20), self.mob(3, 18)],
+                           tiles=[chest, furnace]), 200),
+            (3, 0): (chunk(3, 0), 200),  # Saved again, but unchanged
+            (4, 0): (chunk(4, 0), 200),
+            (5, 0): (chunk(5, 0), 100),
+        })
+        self.write_new({(32, 0): (chunk(32, 0), 200)}, region=(1, 0))
+
+        # Same chunk, stored uncompressed
+        region = mc.RegionFile(osp.join(self.newdir, 'region', 'r.0.0.mca'))
+        region.save({(5, 0): (mc.RegionFile.COMPRESSION_NONE, dumps(chunk(5, 0)))}, 200)
+
+        old, new = self.world(), mc.World(self.newdir)
+        diffs = sorted(old.diff(new, 0, progress=False))
+        self.assertEqual([_[:3] for _ in diffs], [(1, 0, 'changed'), (2, 0, 'removed'),
+                                                  (4, 0, 'added'), (32, 0, 'added')])
+        self.assertIsNone(diffs[1].new)
+        self.assertIsNone(diffs[2].old)
+
+        uuid = '00000000-0000-0000-0000-00000000000%d'
+        self.assertEqual([(_.key, _.status) for _ in diffs[0].entities()],
+                         [(uuid % 1, 'changed'), (uuid % 2, 'removed'), (uuid % 3, 'added')])
+        moved = diffs[0].entities()[0]
+        self.assertEqual((moved.old['Pos'][0].value, moved.new['Pos'][0].value), (16, 20))
+        self.assertEqual([(_.key, _.status) for _ in diffs[0].tile_entities()],
+                         [((17, 64, 0), 'added')])
+        self.assertEqual(sorted(_[0] for _ in diffs[0].changes()),
+                         ['/Level/Entities/0/Pos/0', '/Level/Entities/1/Pos/0',
+                          '/Level/Entities/1/UUIDLeast', '/Level/TileEntities'])
+
+        selection = mc.ChunkSelection.chunks([(1, 0), (2, 0), (3, 0)])
+        self.assertEqual([_[:3] for _ in sorted(old.diff(new, 0, selection, progress=False))],
+                         [(1, 0, 'changed'), (2, 0, 'removed')])
+        self.assertEqual(list(new.diff(new, 0, progress=False)), [])
+
+    def test_nbt_diff(self):
+        old = nbt.load(buf=dumps(Compound(
+            ('a', Int(1)), ('b', List(INT, Int(1), Int(2))), ('c', String('x')),
+            ('e', List(INT, Int(1))), ('f', Short(1)))))
+        new = nbt.load(buf=dumps(Compound(
+            ('a', Int(2)), ('b', List(INT, Int(1), Int(3))), ('d', Byte(1)),
+            ('e', List(INT, Int(1), Int(2))), ('f', Int(1)))))
+        diffs = dict((path, (_ and _.value, other and other.value))
+                     for path, _, other in mc._nbt_diff(old, new))
+        self.assertEqual(sorted(diffs), ['/a', '/b/1', '/c', '/d', '/e', '/f'])
+        self.assertEqual(diffs['/a'], (1, 2))
+        self.assertEqual(diffs['/b/1'], (2, 3))
+        self.assertEqual(diffs['/c'], ('x', None))
+        self.assertEqual(diffs['/d'], (None, 1))
+        self.assertEqual(list(mc._nbt_diff(old, old)), [])
+
+
+
+
+class ChunkMapTestCase(TempDirTestCase):
+    def setUp(self):
+        super(ChunkMapTestCase, self).setUp()
+        self.regiondir = self.path('region')
+        write_region(osp.join(self.regiondir, 'r.0.0.mca'),
+                     {(0, 0): (chunk(0, 0), 1), (31, 5): (chunk(31, 5), 1)})
+        write_region(osp.join(self.regiondir, 'r.-1.0.mca'),
+                     {(-1, 2): (chunk(-1, 2), 1)})
+
+    def test_presence_and_bounds(self):
+        chunks = mc.ChunkMap(self.regiondir)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sorted(chunks), [(-1, 2), (0, 0), (31, 5)])
+        self.assertIn((31, 5), chunks)
+        self.assertNotIn((1, 1), chunks)
+        self.assertNotIn((0, 0), mc.ChunkMap(self.path('missing')))
+        self.assertEqual(chunks.bounds, ((-1, 31), (0, 5)))
+
+    def test_only_anvil_regions(self):
+        write_region(osp.join(self.regiondir, 'r.5.5.mcr'), {(160, 160): (chunk(160, 160), 1)})
+        self.assertNotIn((160, 160), mc.ChunkMap(self.regiondir))
+
+    def test_sidecar_cache(self):
+        cache = self.path('cache', 'chunkmap')
+        self.assertEqual(len(mc.ChunkMap(self.regiondir)), 3)
+        self.assertFalse(osp.exists(cache))
+
+        chunks = mc.ChunkMap(self.regiondir, cache)
+        self.assertTrue(osp.isfile(cache))
+        self.assertFalse(mc.ChunkMap(self.regiondir, cache).refresh())
+
+        # A changed region is read again, a removed one is dropped
+        write_region(osp.join(self.regiondir, 'r.0.0.mca'),
+                     {(1, 1): (chunk(1, 1), 1), (2, 2): (chunk(2, 2), 1)})
+        os.remove(osp.join(self.regiondir, 'r.-1.0.mca'))
+        self.assertTrue(chunks.refresh())
+        self.assertEqual(sorted(mc.ChunkMap(self.regiondir, cache)), [(1, 1), (2, 2)])
+
+    def test_region_path_as_listed(self):
+        os.rename(osp.join(self.regiondir, 'r.0.0.mca'), osp.join(self.regiondir, 'r.00.0.mca'))
+        chunks = mc.ChunkMap(self.regiondir)
+        self.assertIn((31, 5), chunks)
+        self.assertEqual(chunks.region_path(0, 0), osp.join(self.regiondir, 'r.00.0.mca'))
+        self.assertEqual(chunks.region_path(-1, 0), osp.join(self.regiondir, 'r.-1.0.mca'))
+
+
+
+
+class ChunkSelectionTestCase(TempDirTestCase):
+    def assertSelection(self, selection, positions):
+        positions = set(positions)
+        self.assertEqual(set(selection), positions)
+        self.assertEqual(len(selection), len(positions))
+        self.assertTrue(all(_ in selection for _ in positions))
+        self.assertNotIn(0, selection.regions.values())
+
+    def test_algebra(self):
+        a = set([(0, 0), (1, 0), (40, 0), (-1, -1)])
+        b = set([(1, 0), (-1, -1), (5, 33)])
+        sa, sb = mc.ChunkSelection.chunks(a), mc.ChunkSelection.chunks(b)
+        self.assertSelection(sa | sb, a | b)
+        self.assertSelection(sa & sb, a & b)
+        self.assertSelection(sa - sb, a - b)
+        self.assertSelection(sb - sa, b - a)
+        self.assertSelection(sa ^ sb, a ^ b)
+        self.assertSelection(sa.union(sb), a | b)
+        self.assertEqual(sa.intersection(sb), sb.intersection(sa))
+        self.assertEqual(sa.difference(sb), sa - sb)
+
+        self.assertEqual(sa, mc.ChunkSelection.chunks(reversed(sorted(a))))
+        self.assertNotEqual(sa, sb)
+        self.assertFalse(sa - sa)
+        self.assertEqual((sa - sa).regions, {})
+        self.assertTrue(sa)
+
+    def test_iteration_order(self):
+        selection = mc.ChunkSelection.chunks([(33, 0), (1, 1), (0, 1), (-1, 0)])
+        self.assertEqual(list(selection), [(-1, 0), (0, 1), (1, 1), (33, 0)])
+        self.assertEqual(list(selection.region_positions(0, 0)), [(0, 1), (1, 1)])
+        self.assertEqual(list(selection.region_positions(5, 5)), [])
+        self.assertEqual(selection.bounds, ((-1, 33), (0, 1)))
+        self.assertIsNone(mc.ChunkSelection().bounds)
+
+    def test_box(self):
+        self.assertSelection(mc.ChunkSelection.box(0, 0, 16),
+                             [(-1, -1), (-1, 0), (0, -1), (0, 0)])
+        self.assertSelection(mc.ChunkSelection.box(100, -200, 600),
+                             [(cx, cz) for cx in range((100 - 600) >> 4, ((100 + 599) >> 4) + 1)
+                              for cz in range((-200 - 600) >> 4, ((-200 + 599) >> 4) + 1)])
+        self.assertEqual(mc.ChunkSelection.boxes([(0, 0, 16), (500, 0, 16)]),
+                         mc.ChunkSelection.box(0, 0, 16) | mc.ChunkSelection.box(500, 0, 16))
+
+    def test_circle(self):
+        x, z, radius = 100.5, -37.25, 70
+
+        def touches(cx, cz):
+            dx = max(cx * 16 - x, x - (cx * 16 + 16), 0)
+            dz = max(cz * 16 - z, z - (cz * 16 + 16), 0)
+            return dx ** 2 + dz ** 2 <= radius ** 2
+
+        self.assertSelection(mc.ChunkSelection.circle(x, z, radius),
+                             [(cx, cz) for cx in range(-10, 20) for cz in range(-20, 10)
+                              if touches(cx, cz)])
+        self.assertSelection(mc.ChunkSelection.circle(8, 8, 1), [(0, 0)])
+        self.assertEqual(len(mc.ChunkSelection.circles([(0, 0, 1), (0, 0, 1)])), 4)
+
+    def test_polygon(self):
+        square = [(0, 0), (64, 0), (64, 64), (0, 64)]
+        self.assertSelection(mc.ChunkSelection.polygon(square),
+                             [(cx, cz) for cx in range(4) for cz in range(4)])
+
+        # Concave L shape, and a self-intersecting bow tie, whose middle
+        # chunks are outside both of its triangles
+        l_shape = [(0, 0), (48, 0), (48, 16), (16, 16), (16, 48), (0, 48)]
+        self.assertSelection(mc.ChunkSelection.polygon(l_shape),
+                             [(0, 0), (1, 0), (2, 0), (0, 1), (0, 2)])
+        bow_tie = [(0, 0), (64, 32), (64, 0), (0, 32)]
+        self.assertSelection(mc.ChunkSelection.polygon(bow_tie),
+                             [(0, 0), (3, 0), (0, 1), (3, 1)])
+        self.assertRaises(ValueError, mc.ChunkSelection.polygon, [(0, 0), (16, 16)])
+
+    def test_regions_and_chunk_maps(self):
+        regiondir = self.path('region')
+        write_region(osp.join(regiondir, 'r.0.0.mca'),
+                     {(0, 0): (chunk(0, 0), 1), (31, 5): (chunk(31, 5), 1)})
+        write_region(osp.join(regiondir, 'r.-1.0.mca'), {(-1, 2): (chunk(-1, 2), 1)})
+        chunks = mc.ChunkMap(regiondir)
+
+        full = mc.ChunkSelection.from_regions([(0, 0), [-1, 0]])
+        self.assertEqual(len(full), 2048)
+        self.assertIn((31, 31), full)
+        self.assertNotIn((32, 0), full)
+        self.assertSelection(full & chunks, [(0, 0), (31, 5), (-1, 2)])
+        self.assertSelection(mc.ChunkSelection.box(0, 0, 48) & chunks, [(0, 0), (-1, 2)])
+        self.assertSelection(mc.ChunkSelection.present(chunks) - mc.ChunkSelection.box(0, 0, 48),
+                             [(31, 5)])
+
+        region = mc.RegionFile(osp.join(regiondir, 'r.0.0.mca'))
+        self.assertEqual(list(mc._region_positions(region, selection=full)), [(0, 0), (31, 5)])
+        self.assertEqual(list(mc._region_positions(region, selection=mc.ChunkSelection.chunks(
+            [(31, 5), (1, 1)]))), [(31, 5)])
+
+
+
+
+def chunk_position(cx, cz, tag):
+    """map_chunks() function returning the chunk position"""
+    return cx, cz
+
+
+
+
+@requires_pymclevel
+class SelectionScanTestCase(WorldTestCase):
+    def test_scans_read_selected_chunks_once(self):
+        self.write_chunks(dict(((_, 0), (chunk(_, 0), 1)) for _ in range(4)))
+        self.write_chunks({(32, 0): (chunk(32, 0), 1)}, region=(1, 0))
+        world = self.world()
+        selection = (mc.ChunkSelection.box(0, 0, 16) | mc.ChunkSelection.circle(8, 8, 20) |
+                     mc.ChunkSelection.chunks([(32, 0), (33, 0)]))
+        expected = [(0, 0), (1, 0), (32, 0)]
+
+        self.assertEqual(sorted((_[0], _[1]) for _ in world.iter_chunk_tags(
+            0, progress=False, selection=selection)), expected)
+        for workers in (None, 2):
+            self.assertEqual(sorted(world.map_chunks(chunk_position, 0, workers=workers,
+                                                     progress=False, selection=selection)),
+                             [_ + (_,) for _ in expected])
+
+
+
+
+@requires_pymclevel
+class WorldChunkMapTestCase(WorldTestCase):
+    def test_sidecar_cache_is_opt_in(self):
+        self.write_chunks({(0, 0): (chunk(0, 0), 1)})
+        world = self.world()
+        sidecar = osp.join(self.worlddir, '.pymctoolslib')
+
+        self.assertEqual(list(world.chunk_map(0)), [(0, 0)])
+        self.assertEqual([_[:2] for _ in world.iter_chunk_tags(0, progress=False)],
+                         [(0, 0)])
+        self.assertFalse(osp.exists(sidecar))
+
+        self.assertEqual(list(world.chunk_map(0, cache=True)), [(0, 0)])
+        self.assertTrue(osp.isfile(osp.join(sidecar, 'chunkmap.DIM0')))
+        self.assertIsNotNone(world.chunk_map(0).cache)
+
+
+    def test_iter_chunks_since(self):
+        self.write_chunks({(0, 0): (chunk(0, 0), 100), (1, 0): (chunk(1, 0), 200)})
+        world = self.world()
+
+        def positions(**kwargs):
+            return sorted(_.chunkPosition for _ in world.iter_chunks(0, progress=False, **kwargs))
+
+        self.assertEqual(positions(), [(0, 0), (1, 0)])
+        self.assertEqual(positions(since=150), [(1, 0)])
+        self.assertEqual(positions(since=200), [])
+
+    def test_iter_chunks_dims_single_progress(self):
+        self.write_chunks({(0, 0): (chunk(0, 0), 1), (1, 0): (chunk(1, 0), 1)})
+        self.write_chunks({(0, 0): (chunk(0, 0), 1)}, dim=-1)
+        starts = []
+
+        class Recorder(mc.Progress):
+            def start(self, maxval):
+                starts.append(maxval)
+                return super(Recorder, self).start(maxval)
+
+        world = self.world()
+        progress = Recorder()
+        found = [(dim, _.chunkPosition) for dim, _ in
+                 world.iter_chunks(dims=[0, -1], progress=progress)]
+        self.assertEqual(sorted(found), [(-1, (0, 0)), (0, (0, 0)), (0, (1, 0))])
+        self.assertEqual(starts, [3])
+        self.assertEqual(progress.count, 3)
+
+
+
+
+class ProgressTestCase(TempDirTestCase):
+    def test_parser_option_is_opt_in(self):
+        parser = mc.basic_parser()
+        parser.add_argument('-P', dest='port')  # no conflict downstream
+        self.assertFalse(hasattr(parser.parse_args([]), 'progress'))
+
+        parser = mc.basic_parser(progress=True)
+        self.assertEqual(parser.parse_args([]).progress, 'console')
+        self.assertEqual(parser.parse_args(['-P', 'log:5']).progress, 'log:5')
+
+    def test_sink_names(self):
+        progress = mc.Progress()
+        self.assertIs(mc._progress(progress), progress)
+        self.assertIs(type(mc._progress(False)), mc.Progress)
+        self.assertIs(type(mc._progress('none')), mc.Progress)
+        self.assertEqual(mc._progress('log:2.5').interval, 2.5)
+        self.assertEqual(mc._progress('file:/tmp/x.prom').path, '/tmp/x.prom')
+        for name in ('file', 'bogus', 'log:fast'):
+            self.assertRaises(mc.MCError, mc._progress, name)
+
+    def test_reports_are_throttled(self):
+        reports = []
+
+        class Recorder(mc.Progress):
+            def report(self, final=False):
+                reports.append((self.count, final))
+
+        progress = Recorder(interval=3600).start(10)
+        for _ in range(10):
+            progress.update()
+        progress.finish()
+        self.assertEqual(reports, [(0, False), (10, True)])
+
+    def test_file_metrics(self):
+        path = self.path('scan.prom')
+        progress = mc.FileProgress(path, job='test').start(4)
+        progress.update(3)
+        progress.finish()
+        with open(path) as fp:
+            metrics = dict(_.split() for _ in fp if not _.startswith('#'))
+        self.assertEqual(metrics['pymctoolslib_chunks_processed{job="test"}'], '4')
+        self.assertEqual(metrics['pymctoolslib_chunks_total{job="test"}'], '4')
+        self.assertEqual(metrics['pymctoolslib_scan_done{job="test"}'], '1')
+
+
+
+
+class RegionFileTestCase(TempDirTestCase):
+    def setUp(self):
+        super(RegionFileTestCase, self).setUp()
+        self.regionpath = self.path('region', 'r.0.-1.mca')
+        write_region(self.regionpath, {(0, -32): (chunk(0, -32), 100),
+                                       (1, -32): (chunk(1, -32), 200)})
+
+    def test_headers(self):
+        region = mc.RegionFile(self.regionpath)
+        self.assertEqual((region.rx, region.rz), (0, -1))
+        self.assertEqual(sorted(region), [(0, -32), (1, -32)])
+        self.assertEqual(len(region), 2)
+        self.assertEqual(region.timestamp(1, -32), 200)
+        self.assertEqual(region.bitmap, 0b11)
+        self.assertRaises(mc.MCError, mc.RegionFile.coords, 'level.dat')
+
+    def test_save(self):
+        region = mc.RegionFile(self.regionpath)
+        data = zlib.compress(dumps(chunk(5, -30)))
+        region.save({(1, -32): None, (5, -30): (mc.RegionFile.COMPRESSION_ZLIB, data)}, 300)
+        region = mc.RegionFile(self.regionpath)
+        self.assertEqual(sorted(region), [(0, -32), (5, -30)])
+        self.assertEqual([region.timestamp(*_) for _ in ((0, -32), (1, -32), (5, -30))],
+                         [100, 0, 300])
+        self.assertEqual(list(region.iter_raw([(5, -30)])),
+                         [(5, -30, mc.RegionFile.COMPRESSION_ZLIB, data)])
+
+    def test_external_chunks(self):
+        region = mc.RegionFile(self.regionpath)
+        external = region.external_path(1, -32)
+        data = os.urandom(300 * mc.RegionFile.SECTOR_BYTES)
+        region.save({(1, -32): (mc.RegionFile.COMPRESSION_NONE, data)})
+        self.assertTrue(osp.isfile(external))
+        self.assertEqual(list(mc.RegionFile(self.regionpath).iter_raw([(1, -32)])),
+                         [(1, -32, mc.RegionFile.COMPRESSION_NONE, data)])
+
+        region.save({(1, -32): None})
+        self.assertFalse(osp.exists(external))
+        self.assertEqual(list(region), [(0, -32)])
+
+
+
+
+@requires_pymclevel
+class BackupStoreTestCase(WorldTestCase):
+    def setUp(self):
+        super(BackupStoreTestCase, self).setUp()
+        self.store = mc.BackupStore(self.path('backups'))
+        self.regionpath = osp.join(self.worlddir, 'region', 'r.0.0.mca')
+        self.write_chunks({(0, 0): (chunk(0, 0), 100), (1, 0): (chunk(1, 0), 100)})
+
+    def raw(self, path=None):
+        region = mc.RegionFile(path or self.regionpath)
+        return dict(((cx, cz), (region.timestamp(cx, cz), data))
+                    for cx, cz, _, data in region.iter_raw())
+
+    def objects(self):
+        return sum(len(_[2]) for _ in os.walk(self.path('backups', 'objects')))
+
+    def test_backup_restore_round_trip(self):
+        original = self.raw()
+        self.store.backup(self.world(), 'one', progress=False)
+        objects = self.objects()
+
+        # Unchanged chunks are not stored again
+        self.store.backup(self.world(), 'two', progress=False)
+        self.assertEqual(self.objects(), objects)
+
+        region = mc.RegionFile(self.regionpath)
+        region.save({(0, 0): None, (2, 2): mc.RegionFile.compress(nbt.load(buf=dumps(
+            chunk(2, 2))))}, 500)
+        write_region(osp.join(self.worlddir, 'region', 'r.1.0.mca'),
+                     {(32, 0): (chunk(32, 0), 1)})
+
+        self.store.restore('one', self.worlddir)
+        self.assertEqual(self.raw(), original)
+        self.assertFalse(osp.exists(osp.join(self.worlddir, 'region', 'r.1.0.mca')))
+
+    def test_restore_selection(self):
+        self.store.backup(self.world(), 'one', progress=False)
+        mc.RegionFile(self.regionpath).save({(0, 0): None, (1, 0): None})
+
+        self.store.restore('one', self.worlddir, dim=0,
+                           selection=mc.ChunkSelection.chunks([(1, 0)]))
+        self.assertEqual(sorted(mc.RegionFile(self.regionpath)), [(1, 0)])
+
+    def test_restore_removes_external_chunks(self):
+        self.store.backup(self.world(), 'one', progress=False)
+        write_region(osp.join(self.worlddir, 'region', 'r.1.1.mca'), {})
+        big = mc.RegionFile(osp.join(self.worlddir, 'region', 'r.1.1.mca'))
+        big.save({(33, 33): (mc.RegionFile.COMPRESSION_NONE,
+                             os.urandom(300 * mc.RegionFile.SECTOR_BYTES))})
+        self.assertTrue(osp.isfile(big.external_path(33, 33)))
+
+        self.store.restore('one', self.worlddir)
+        self.assertFalse(osp.exists(big.path))
+        self.assertFalse(osp.exists(big.external_path(33, 33)))
+
+    def test_snapshots_oldest_first(self):
+        world = self.world()
+        for name, mtime in (('b', 2000), ('a', 3000), ('c', 1000)):
+            self.store.backup(world, name, progress=False)
+            os.utime(self.store._manifest_path(name), (mtime, mtime))
+        self.assertEqual(self.store.snapshots(), ['c', 'b', 'a'])
+        self.assertRaises(mc.MCError, self.store.backup, world, 'a', progress=False)
+
+        self.store.remove('b')
+        self.store.remove('a')
+        self.assertEqual(self.store.snapshots(), ['c'])
+        self.assertEqual(self.store.gc(), 0)
+        self.store.remove('c')
+        self.assertGreater(self.store.gc(), 0)
+        self.assertEqual(self.objects(), 0)
+
+
+
+
+class ExportTestCase(TempDirTestCase):
+    columns = (('name', 's'), ('count', 'i'), ('x', 'f'), ('a', 's'))
+    rows = [(u'caf\xe9', 2, 1.5, u'z'), (u'none', None, None, None)]
+
+    def write(self, fmt):
+        writer = mc._EXPORT_WRITERS[fmt](self.path('rows'), self.columns)
+        writer.write(self.rows)
+        writer.close()
+        return writer
+
+    def test_ndjson_keeps_column_order(self):
+        writer = self.write('ndjson')
+        with open(writer.path) as fp:
+            lines = [json.loads(_, object_pairs_hook=collections.OrderedDict) for _ in fp]
+        self.assertEqual([list(_) for _ in lines], [['name', 'count', 'x', 'a']] * 2)
+        self.assertEqual([tuple(_.values()) for _ in lines], self.rows)
+
+    def test_csv(self):
+        writer = self.write('csv')
+        with open(writer.path, 'rb') as fp:
+            lines = list(csv.reader(fp))
+        self.assertEqual(lines, [['name', 'count', 'x', 'a'],
+                                 [u'caf\xe9'.encode('utf-8'), '2', '1.5', 'z'],
+                                 ['none', '', '', '']])
+
+    @requires_numpy
+    def test_npz_fills_missing_values(self):
+        self.write('npz')
+        data = np.load(self.path('rows.00000.npz'))
+        self.assertEqual(data['name'].tolist(), [u'caf\xe9', u'none'])
+        self.assertEqual(data['count'].tolist(), [2, -1])
+        self.assertTrue(np.isnan(data['x'][1]))
+        self.assertEqual(data['a'].tolist(), [u'z', u''])
+
+    @requires_pymclevel
+    def test_player_rows_without_dimension(self):
+        player = nbt.load(buf=dumps(Compound(
+            ('Pos', List(DOUBLE, Double(1), Double(2), Double(3))),
+            ('Inventory', List(COMPOUND, item('minecraft:stone', 5, 0, 3))))))
+        self.assertEqual(mc._player_export_rows('Alex', player),
+                         [('Alex', 0, 1, 2, 3, 'Inventory', 3, 'minecraft:stone', 0, 5, 0)])
+
+    @requires_pymclevel
+    @requires_numpy
+    def test_chunk_rows(self):
+        tag = nbt.load(buf=dumps(chunk(
+            1, 2, entities=[entity('minecraft:cow', 20.5, 64, 40.5)],
+            tiles=[tile('minecraft:chest', 17, 60, 33,
+                        ('Items', List(COMPOUND, item('minecraft:dirt', 1, 0, 0))))])))
+        rows = mc._chunk_export_rows(1, 2, tag, dim=-1)
+        self.assertEqual(rows['entities'],
+                         [(-1, 1, 2, 'minecraft:cow', None, 20.5, 64, 40.5, None, None)])
+        self.assertEqual(rows['items'], [(-1, 1, 2, 'minecraft:chest', 17, 60, 33,
+                                          0, 'minecraft:dirt', 0, 1, 0)])
+        self.assertNotIn('offers', rows)
+
+
+
+
+@requires_pymclevel
+class TradeIndexTestCase(SyntheticItems, WorldTestCase):
+    def setUp(self):
+        super(TradeIndexTestCase, self).setUp()
+        self.write_trades(100)
+
+    def write_trades(self, timestamp, *villagers):
+        villagers = villagers or (
+            villager(1.5, 64, 2.5, (item('minecraft:dirt', 4), item('minecraft:emerald', 1)),
+                     (item('minecraft:stone', 8), item('minecraft:emerald', 2),
+                      item('minecraft:dirt', 1))),)
+        self.write_chunks({(0, 0): (chunk(0, 0, entities=villagers), timestamp),
+                           (1, 0): (chunk(1, 0), 100)})
+        # Region file modification times may not tell writes apart
+        path = osp.join(self.worlddir, 'region', 'r.0.0.mca')
+        os.utime(path, (timestamp, timestamp))
+
+    def test_queries(self):
+        index = self.world().trade_index(0)
+        self.assertEqual(len(index), 2)
+
+        trade, = index.sold('dirt')
+        self.assertEqual((trade.sell, trade.count, trade.uses, trade.maxuses),
+                         (self.dirt, 4, 0, 7))
+        self.assertEqual(trade.price, ((self.emerald, 1),))
+        self.assertEqual(tuple(trade.pos), (1.5, 64, 2.5))
+
+        self.assertEqual(sorted(_.sell.strid for _ in index.bought(self.emerald)),
+                         ['dirt', 'stone'])
+        self.assertEqual([_.sell for _ in index.bought('dirt')], [self.stone])
+        self.assertEqual(index.sold('minecraft:no_such_item'), [])
+
+    def test_incremental_refresh(self):
+        index = self.world().trade_index(0)
+        self.assertEqual(index.refresh(), 0)  # Nothing changed
+
+        # Only the changed chunk is read again
+        self.write_trades(200, villager(1.5, 64, 2.5, (item('minecraft:stone', 1),
+                                                       item('minecraft:dirt', 9))))
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual([_.sell for _ in index], [self.stone])
+        self.assertEqual(index.sold('dirt'), [])
+        self.assertEqual(index.bought('emerald'), [])
+
+        os.remove(osp.join(self.worlddir, 'region', 'r.0.0.mca'))
+        self.assertEqual(index.refresh(), 0)
+        self.assertEqual(len(index), 0)
+
+
+
+
+@requires_pymclevel
+class ContainersTestCase(SyntheticItems, WorldTestCase):
+    def setUp(self):
+        super(ContainersTestCase, self).setUp()
+        self.write_chunks({(0, 0): (chunk(0, 0, tiles=[
+            tile('minecraft:chest', 1, 64, 1, ('Items', List(
+                COMPOUND, item('minecraft:stone', 10, 0, 0), item('minecraft:dirt', 5, 0, 1)))),
+            tile('minecraft:furnace', 2, 64, 1),
+        ]), 1)})
+        self.write_chunks({(40, 0): (chunk(40, 0, tiles=[
+            tile('minecraft:hopper', 640, 64, 1, ('Items', List(
+                COMPOUND, item('minecraft:stone', 3, 0, 0)))),
+        ]), 1)}, region=(1, 0))
+
+    def test_iter_containers(self):
+        world = self.world()
+        containers = list(world.iter_containers(0, progress=False))
+        self.assertEqual(sorted(_.name for _ in containers), ['Chest', 'Hopper'])
+
+        chest, = world.iter_containers(0, ids=['dirt'], progress=False)
+        self.assertEqual(tuple(chest.pos), (1, 64, 1))
+        self.assertEqual(len(chest.inventory), 2)
+        hopper, = world.iter_containers(0, containers=['HOPPER'], progress=False)
+        self.assertEqual(hopper.name, 'Hopper')
+
+    def test_count_items(self):
+        world = self.world()
+        self.assertEqual(world.count_items(0, progress=False),
+                         {self.stone: 13, self.dirt: 5})
+        self.assertEqual(world.count_items(0, per='region', progress=False),
+                         {(0, 0): {self.stone: 10, self.dirt: 5}, (1, 0): {self.stone: 3}})
+        self.assertEqual(world.count_items(0, per=lambda cx, cz: 'spawn' if cx < 32 else None,
+                                           progress=False),
+                         {'spawn': {self.stone: 10, self.dirt: 5}})
+        self.assertEqual(world.count_items(0, ids=[self.dirt], progress=False),
+                         {self.dirt: 5})
+        self.assertEqual(world.count_items(0, containers=['hopper'], workers=2,
+                                           progress=False),
+                         {self.stone: 3})
+        self.assertRaises(ValueError, world.count_items, 0, per='world')
+
+
+
+
+@requires_pymclevel
+@requires_numpy
+class SurfaceTestCase(WorldTestCase):
+    def test_numeric_sections(self):
+        # Glass over stone at x=0 z=0, stone alone at x=3 z=2
+        blocks = {block_index(0, 10, 0): 20, block_index(0, 5, 0): 1,
+                  block_index(3, 5, 2): 1, block_index(3, 2, 2): 3}
+        heightmap = [0] * 256
+        heightmap[0] = heightmap[2 * 16 + 3] = 6  # Top light-blocking block + 1
+        self.write_chunks({(1, 0): (chunk(1, 0, [section(0, blocks)], (), (),
+                                          ('HeightMap', IntArray(heightmap)),
+                                          ('LightPopulated', Byte(1))), 1)})
+        world = self.world()
+
+        for heightmap, height, block in ((True, 5, 1), (False, 10, 20)):
+            surface = world.surface(0, heightmap=heightmap, progress=False)[(0, 0)]
+            self.assertEqual((surface.heights[0, 16], surface.blocks[0, 16]), (height, block))
+            self.assertEqual((surface.heights[2, 19], surface.blocks[2, 19]), (5, 1))
+            self.assertEqual(surface.heights[1, 16], mc.Surface.EMPTY)
+            self.assertEqual(surface.heights[0, 0], mc.Surface.EMPTY)  # No chunk
+            self.assertEqual(surface.names, [])
+
+    def test_palette_sections(self):
+        # 1.18 chunk, stone at Y=-1 and grass at Y=3, in 4 bits per block
+        def palette_section(y, name, index):
+            data = [0] * 256
+            data[index // 16] = 1 << (index % 16 * 4)
+            return Compound(('Y', Byte(y)), ('block_states', Compound(
+                ('palette', List(COMPOUND, Compound(('Name', String('minecraft:air'))),
+                                 Compound(('Name', String(name))))),
+                ('data', LongArray(data)))))
+
+        tag = Compound(('xPos', Int(0)), ('zPos', Int(0)), ('sections', List(
+            COMPOUND,
+            palette_section(-1, 'minecraft:stone', block_index(1, 15, 0)),
+            palette_section(0, 'minecraft:grass_block', block_index(2, 3, 0)))))
+        self.write_chunks({(0, 0): (tag, 1)})
+
+        surface = self.world().surface(0, progress=False)[(0, 0)]
+        self.assertEqual(surface.heights[0, 1], -1)
+        self.assertEqual(surface.heights[0, 2], 3)
+        self.assertEqual(surface.names[surface.blocks[0, 1] - 4096], 'minecraft:stone')
+        self.assertEqual(surface.names[surface.blocks[0, 2] - 4096], 'minecraft:grass_block')
+        self.assertEqual(surface.heights[0, 0], mc.Surface.EMPTY)
+
+
+
+
+def mark_even_chunks(cx, cz, tag):
+    """transform_chunks() function marking chunks with an even X"""
+    if cx % 2:
+        return False
+    tag['Level']['Marked'] = nbt.TAG_Byte(1)
+    return True
+
+
+def mark_or_fail(cx, cz, tag):
+    """transform_chunks() function failing on chunk X 33, after changing others"""
+    if cx == 33:
+        raise ValueError("Chunk 33")
+    return mark_even_chunks(cx, cz, tag)
+
+
+
+
+def book(title, *pages):
+    return item('minecraft:written_book', slot=0, tag=Compound(
+        ('title', String(title)), ('author', String('Alex')),
+        ('pages', List(STRING, *[String(_) for _ in pages]))))
+
+
+def named(itemid, name, slot=None):
+    return item(itemid, slot=slot, tag=Compound(('display', Compound(('Name', String(name))))))
+
+
+
+
+@requires_pymclevel
+class TextIndexTestCase(WorldTestCase):
+    def setUp(self):
+        super(TextIndexTestCase, self).setUp()
+        chest = tile('minecraft:chest', 5, 64, 6, ('Items', List(COMPOUND, book(
+            'Diary', 'The secret treasure', '{"text":"is under the ", "extra":["tree"]}'))))
+        frame = entity('minecraft:item_frame', 8.5, 70, 2.5,
+                       ('Item', named('minecraft:diamond_sword', '{"text":"Excalibur"}')))
+        self.write_chunks({(0, 0): (chunk(0, 0, tiles=[chest], entities=[frame]), 100),
+                           (1, 0): (chunk(1, 0), 100)})
+        self.write_player(named('minecraft:stick', 'Secret Stick', slot=3))
+
+    def write_player(self, *items):
+        player = Compound(('Dimension', Int(-1)),
+                          ('Pos', List(DOUBLE, Double(1), Double(2), Double(3))),
+                          ('Inventory', List(COMPOUND, *items)))
+        # Files get a later mtime even if rewritten in the same second
+        paths = [osp.join(self.worlddir, 'level.dat'),
+                 osp.join(self.worlddir, 'playerdata', 'steve.dat')]
+        mtimes = [os.stat(_).st_mtime if osp.exists(_) else 0 for _ in paths]
+        write_level(self.worlddir, ('steve', player))
+        for path, mtime in zip(paths, mtimes):
+            os.utime(path, (mtime + 10, mtime + 10))
+
+    def test_search(self):
+        index = self.world().text_index(progress=False)
+        hit, = index.search('secret treasure')
+        self.assertEqual(hit._replace(pos=tuple(hit.pos)),
+                         mc.TextHit('pages', 'The secret treasure\n\nis under the tree',
+                                    'minecraft:written_book', None, 0, (5, 64, 6),
+                                    'minecraft:chest', 0))
+        self.assertEqual(index.search('TREASURE Secret'), [])
+        self.assertEqual(len(index.search('treasure secret', phrase=False)), 1)
+        self.assertEqual(index.search('under tree'), [])
+        self.assertEqual(len(index.search('under the tree')), 1)
+
+        hit, = index.search('excalibur')
+        self.assertEqual((hit.field, hit.text, hit.container, tuple(hit.pos)),
+                         ('name', 'Excalibur', 'minecraft:item_frame', (8.5, 70, 2.5)))
+        self.assertEqual([_.field for _ in index.search('diary')], ['title'])
+
+        hits = index.search('secret', phrase=False)
+        self.assertEqual(sorted((_.field, _.owner) for _ in hits),
+                         [('name', 'steve'), ('pages', None)])
+        player, = index.search('secret', fields=['name'])
+        self.assertEqual((player.owner, player.dim, player.container, player.slot),
+                         ('steve', -1, 'Inventory', 3))
+        self.assertEqual(index.search('  '), [])
+        index.close()
+
+    def test_incremental_update(self):
+        index = self.world().text_index(progress=False)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.update(self.world(), progress=False), 0)
+
+        # Chunk rewritten with a new timestamp, and new level.dat and player files
+        self.write_chunks({(0, 0): (chunk(0, 0), 200), (1, 0): (chunk(1, 0), 100)})
+        self.write_player()
+        self.assertEqual(index.update(self.world(), progress=False), 1 + 2)
+        self.assertEqual(index.search('secret', phrase=False), [])
+        self.assertEqual(len(index), 0)
+
+        # Removed chunks are dropped from the index
+        self.write_chunks({(0, 0): (chunk(0, 0, tiles=[tile('minecraft:chest', 1, 2, 3,
+            ('Items', List(COMPOUND, named('minecraft:stone', 'Rock', 1))))]), 300)})
+        self.assertEqual(index.update(self.world(), progress=False), 1)
+        self.assertEqual([_.text for _ in index.search('rock')], ['Rock'])
+        self.assertEqual(index._stamps('0/'), {'0/0/0': 300})
+        index.close()
+
+
+
+
+@requires_pymclevel
+class TransformChunksTestCase(WorldTestCase):
+    def setUp(self):
+        super(TransformChunksTestCase, self).setUp()
+        self.write_chunks({(0, 0): (chunk(0, 0), 100), (1, 0): (chunk(1, 0), 100)})
+        self.write_chunks({(32, 0): (chunk(32, 0), 100), (33, 0): (chunk(33, 0), 100)},
+                          region=(1, 0))
+        self.regiondir = osp.join(self.worlddir, 'region')
+
+    def read(self, filename):
+        with open(osp.join(self.regiondir, filename), 'rb') as fp:
+            return fp.read()
+
+    def marked(self, filename):
+        region = mc.RegionFile(osp.join(self.regiondir, filename))
+        return sorted((cx, cz) for cx, cz, tag in region.iter_nbt()
+                      if 'Marked' in tag['Level'])
+
+    def test_transform(self):
+        unchanged = list(mc.RegionFile(osp.join(self.regiondir, 'r.0.0.mca')).iter_raw([(1, 0)]))
+        results = self.world().transform_chunks(mark_even_chunks, 0, progress=False)
+        self.assertEqual(results, {(0, 0): mc.TransformResult(2, 1, None),
+                                   (1, 0): mc.TransformResult(2, 1, None)})
+        self.assertEqual(self.marked('r.0.0.mca'), [(0, 0)])
+        self.assertEqual(self.marked('r.1.0.mca'), [(32, 0)])
+
+        region = mc.RegionFile(osp.join(self.regiondir, 'r.0.0.mca'))
+        self.assertEqual(list(region.iter_raw([(1, 0)])), unchanged)
+        self.assertEqual(region.timestamp(1, 0), 100)
+        self.assertGreater(region.timestamp(0, 0), 100)
+
+    def test_failed_region_is_untouched(self):
+        original = self.read('r.1.0.mca')
+        results = self.world().transform_chunks(mark_or_fail, 0, workers=2, progress=False)
+        self.assertEqual(results[(0, 0)], mc.TransformResult(2, 1, None))
+        self.assertEqual(results[(1, 0)][:2], (2, 0))
+        self.assertIn("Chunk 33", results[(1, 0)].error)
+
+        self.assertEqual(self.read('r.1.0.mca'), original)
+        self.assertEqual(self.marked('r.0.0.mca'), [(0, 0)])
+        self.assertEqual(sorted(os.listdir(self.regiondir)), ['r.0.0.mca', 'r.1.0.mca'])
+
+
+
+
+def send_to_nether(player):
+    """edit_players() function moving a player to the Nether, returning its old Dimension"""
+    dim = player.dimension
+    player.dimension = -1
+    return dim
+
+
+def not_in_end(player):
+    return player.dimension != 1
+
+
+
+
+@requires_pymclevel
+class EditPlayersTestCase(WorldTestCase):
+    def setUp(self):
+        super(EditPlayersTestCase, self).setUp()
+
+        def player(dim):
+            return Compound(('Dimension', Int(dim)),
+                            ('Pos', List(DOUBLE, Double(0), Double(64), Double(0))),
+                            ('Inventory', List(COMPOUND)))
+        write_level(self.worlddir, ('alex', player(0)), ('steve', player(-1)),
+                    ('notch', player(1)))
+        self.playerdir = osp.join(self.worlddir, 'playerdata')
+        with open(osp.join(self.playerdir, 'broken.dat'), 'wb') as fp:
+            fp.write(b'Not NBT')
+
+    def read(self, name):
+        with open(osp.join(self.playerdir, '%s.dat' % name), 'rb') as fp:
+            return fp.read()
+
+    def test_edit_players(self):
+        for workers in (None, 2):
+            before = dict((_, self.read(_)) for _ in ('steve', 'notch', 'broken'))
+            results = self.world().edit_players(send_to_nether, workers=workers,
+                                                filter=not_in_end, progress=False)
+            self.assertEqual(sorted(results), ['alex', 'broken', 'notch', 'steve'])
+            self.assertEqual(results['steve'], mc.PlayerEdit('unchanged', -1, None))
+            self.assertEqual(results['notch'], mc.PlayerEdit('skipped', None, None))
+            self.assertEqual(results['broken'][:2], ('failed', None))
+            self.assertTrue(results['broken'].error)
+            for name in before:
+                self.assertEqual(self.read(name), before[name])
+
+            if workers is None:
+                self.assertEqual(results['alex'], mc.PlayerEdit('changed', 0, None))
+            else:  # Already edited by the first run
+                self.assertEqual(results['alex'], mc.PlayerEdit('unchanged', -1, None))
+            self.assertEqual(nbt.load(osp.join(self.playerdir, 'alex.dat'))['Dimension'].value,
+                             -1)
+
+        # The world default player is not edited
+        self.assertEqual(self.world().player.dimension, 0)
+        self.assertEqual(sorted(os.listdir(self.playerdir)),
+                         ['alex.dat', 'broken.dat', 'notch.dat', 'steve.dat'])
+
+
+
+
+@requires_pymclevel
+@requires_numpy
+class EntityDensityTestCase(WorldTestCase):
+    def setUp(self):
+        super(EntityDensityTestCase, self).setUp()
+        self.write_chunks({
+            (0, 0): (chunk(0, 0, entities=[entity('minecraft:cow', 1.5, 64, 2.5),
+                                           entity('minecraft:cow', 3.5, 66, 2.5)],
+                           tiles=[tile('minecraft:hopper', 4, 60, 4)]), 1),
+            (1, 0): (chunk(1, 0, tiles=[tile('minecraft:chest', 17, 70, 1)]), 1),
+        })
+
+    def test_hotspots(self):
+        density = self.world().entity_density(0, progress=False)
+        self.assertEqual((density.total, len(density)), (4, 2))
+        self.assertEqual(density.types['minecraft:cow'], 2)
+
+        first, second = density.hotspots()
+        self.assertEqual((first.count, first.cx, first.cz), (3, 0, 0))
+        self.assertEqual(tuple(first.pos), (2.5, 65, 2.5))
+        self.assertEqual(tuple(first.tile_pos), (4, 60, 4))
+        self.assertEqual((second.count, second.pos, tuple(second.tile_pos)),
+                         (1, None, (17, 70, 1)))
+        self.assertEqual(len(density.hotspots(1)), 1)
+
+    def test_ids_filter(self):
+        density = self.world().entity_density(0, ids=['COW'], progress=False)
+        self.assertEqual(dict(density.types), {'minecraft:cow': 2})
+        self.assertEqual(self.world().entity_density(0, tiles=False,
+                                                     progress=False).total, 2)
+
+    def test_separate_entity_regions(self):
+        # From 1.17 on Entities are in 'entities' region files
+        write_region(osp.join(self.worlddir, 'entities', 'r.0.0.mca'), {
+            (0, 0): (Compound(('DataVersion', Int(2724)), ('Entities', List(
+                COMPOUND, entity('minecraft:zombie', 8.5, 64, 8.5)))), 1),
+        })
+        density = self.world().entity_density(0, progress=False)
+        self.assertEqual(density.total, 5)
+        first = density.hotspots(1)[0]
+        self.assertEqual(first.count, 4)
+        self.assertEqual(tuple(first.pos), (4.5, 194.0 / 3, 4.5))
+        self.assertEqual(first.types['minecraft:zombie'], 1)
+
+
+
+
+@requires_pymclevel
+@requires_numpy
+@requires_item_data
+class FindBlocksTestCase(WorldTestCase):
+    def test_find_blocks_multi_data_name(self):
+        # Orange wool (35:1) at x=3 y=5 z=0 and white wool (35:0) at x=4
+        orange, white = block_index(3, 5, 0), block_index(4, 5, 0)
+        self.write_chunks({(0, 0): (chunk(0, 0, [section(0, {orange: 35, white: 35},
+                                                         {orange: 1})]), 1)})
+        world = self.world()
+
+        found = np.concatenate(list(world.find_blocks(['wool'], data=True,
+                                                      progress=False)))
+        self.assertEqual(sorted(map(tuple, found.tolist())),
+                         [(3, 5, 0, 1), (4, 5, 0, 0)])
+
+        found = np.concatenate(list(world.find_blocks([('wool', 1)], data=True,
+                                                      progress=False)))
+        self.assertEqual(found.tolist(), [[3, 5, 0, 1]])
+
+
+
+
+class ListHandler(logging.Handler):
+    """Logging handler keeping the records it handles in `records`"""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+
+
+@requires_pymclevel
+class LazyObjectsTestCase(SyntheticItems, unittest.TestCase):
+    def test_villager_offers(self):
+        tag = villager(1, 64, 2,
+                       (item('minecraft:emerald'), item('minecraft:dirt', 20)),
+                       (item('minecraft:stone', 4), item('minecraft:emerald', 2),
+                        item('minecraft:dirt')))
+        mob = mc.Villager(nbt.load(buf=dumps(Compound(*(tag.value +
+                                                        (('Profession', Int(1)),))))))
+        self.assertEqual(mob.profession, "Librarian")
+        self.assertIsNone(mob._offers)
+
+        offers = mob.offers
+        self.assertIs(mob.offers, offers)
+        self.assertEqual([(_.sell.type, [i.type for i in _.buy]) for _ in offers],
+                         [(self.emerald, [self.dirt]), (self.stone, [self.emerald, self.dirt])])
+        self.assertEqual(offers[0].maxuses, 7)
+        self.assertIsNone(offers[0]._name)
+        self.assertIs(offers[0].name, offers[0].name)
+
+        mob.offers = []
+        self.assertEqual(mob.offers, [])
+        self.assertEqual(mc.Villager(nbt.load(buf=dumps(entity(
+            'minecraft:villager', 0, 0, 0, ('Profession', Int(0)))))).offers, [])
+
+    def test_player_inventory(self):
+        tag = nbt.load(buf=dumps(Compound(
+            ('Dimension', Int(0)),
+            ('Pos', List(DOUBLE, Double(0), Double(64), Double(0))),
+            ('Inventory', List(COMPOUND, item('minecraft:stone', 3, slot=0),
+                               item('minecraft:leather_helmet', slot=103))))))
+        player = mc.Player(tag)
+        self.assertIsNone(player._inventory)
+
+        inventory = player.inventory
+        self.assertIs(player.inventory, inventory)
+        self.assertEqual([_.type for _ in inventory], [self.stone, self.helmet])
+        self.assertEqual(inventory.free_slots, list(range(1, 36)))
+        self.assertEqual(inventory.free_armor, [100, 101, 102])
+
+        player.inventory = None  # Created again from NBT
+        self.assertIsNot(player.inventory, inventory)
+        self.assertEqual(len(player.inventory), 2)
+
+
+
+
+class ItemResolveTestCase(SyntheticItems, unittest.TestCase):
+    def setUp(self):
+        super(ItemResolveTestCase, self).setUp()
+        self.unknown_ids = mc.ItemTypes._unknown_ids
+        mc.ItemTypes._unknown_ids = set()
+        self.handler = ListHandler()
+        mc.log.addHandler(self.handler)
+
+    def tearDown(self):
+        mc.log.removeHandler(self.handler)
+        mc.ItemTypes._unknown_ids = self.unknown_ids
+        super(ItemResolveTestCase, self).tearDown()
+
+    def warnings(self):
+        return [_ for _ in self.handler.records if _.levelno == logging.WARNING]
+
+    def test_resolve_known(self):
+        self.assertIs(mc.ItemTypes.resolve(u'minecraft:stone', 0), self.stone)
+        self.assertIs(mc.ItemTypes.resolve('minecraft:stone', 5), self.stone)
+        self.assertIs(mc.ItemTypes.resolve(3, 0), self.dirt)
+        self.assertIs(mc.ItemTypes.resolve('minecraft:dirt'), self.dirt)
+        self.assertIs(mc.ItemTypes._registry.resolved[('minecraft:stone', 5)], self.stone)
+        self.assertEqual(self.warnings(), [])
+
+    def test_unknown_types_are_cached_and_warned_once(self):
+        gizmo = mc.ItemTypes.resolve('mod:gizmo', 0, count=20)
+        self.assertEqual((gizmo.strid, gizmo.name, gizmo.stacksize), ('mod:gizmo', 'Gizmo', 64))
+        self.assertIs(mc.ItemTypes.resolve('mod:gizmo', 0), gizmo)
+
+        other = mc.ItemTypes.resolve('mod:gizmo', 1)
+        self.assertIsNot(other, gizmo)
+        self.assertIs(mc.ItemTypes.resolve('mod:gizmo', 1), other)
+
+        block = mc.ItemTypes.resolve(200, 0)
+        self.assertEqual((block.numid, block.name, block.is_block),
+                         (200, "Unknown Item 200", True))
+        self.assertEqual(len(self.warnings()), 2)
+
+    def test_resolve_many(self):
+        keys = [('minecraft:dirt', 0), ('mod:gizmo', 0), (1, 0), ('mod:widget', 0),
+                ('mod:gizmo', 0)]
+        result = mc.ItemTypes.resolve_many(keys)
+        self.assertEqual(result[0], self.dirt)
+        self.assertEqual(result[2], self.stone)
+        self.assertIs(result[1], result[4])
+        self.assertEqual(len(mc.ItemTypes._registry.all_items), 4 + 2)
+        self.assertEqual([mc.ItemTypes.resolve(*_) for _ in keys], result)
+        self.assertEqual(mc.ItemTypes.resolve_many([]), [])
+
+    def test_new_types_clear_the_cache(self):
+        self.assertIs(mc.ItemTypes.resolve('minecraft:stone', 1), self.stone)
+        granite = mc.ItemType(1, 'stone', 1, 'Granite', is_block=True)
+        mc.ItemTypes.add_item(granite)
+        self.assertEqual(mc.ItemTypes._registry.resolved, {})
+        self.assertIs(mc.ItemTypes.resolve('minecraft:stone', 1), granite)
+        self.assertIs(mc.ItemTypes.resolve('minecraft:stone', 0), self.stone)
+
+
+
+
+class ItemTypesTestCase(SyntheticItems, unittest.TestCase):
+    def test_collections_from_class_and_instance(self):
+        itemtypes = mc.ItemTypes()
+        self.assertIs(itemtypes.items, mc.ItemTypes.items)
+        self.assertIs(itemtypes.armor, mc.ItemTypes.armor)
+        self.assertEqual(list(mc.ItemTypes.items),
+                         [('minecraft:stone', None), ('minecraft:dirt', None),
+                          ('minecraft:emerald', None), ('minecraft:leather_helmet', None)])
+        self.assertEqual(itemtypes.armor, [self.helmet])
+        with self.assertRaises(AttributeError):
+            itemtypes.items = {}
+
+    def test_resolve_publishes_new_snapshots(self):
+        self.assertIs(mc.ItemTypes.resolve('minecraft:stone', 0), self.stone)
+        published = mc.ItemTypes._registry
+        cached = dict(published.resolved)
+
+        unknown = mc.ItemTypes.resolve_many([('minecraft:stone', 0),
+                                             ('mod:gizmo', 0), ('mod:gizmo', 0)])
+        self.assertIs(unknown[0], self.stone)
+        self.assertIs(unknown[1], unknown[2])
+        self.assertEqual(published.resolved, cached)  # Not changed in place
+        self.assertNotIn(('mod:gizmo', 0), published.items)
+
+        # Unknown types keep other cached keys, and are cached themselves
+        resolved = mc.ItemTypes._registry.resolved
+        self.assertIs(resolved[('minecraft:stone', 0)], self.stone)
+        self.assertIs(resolved[('mod:gizmo', 0)], unknown[1])
+        self.assertIs(mc.ItemTypes.findItem('mod:gizmo', 0), unknown[1])
+
+    def test_concurrent_unknown_types_are_created_once(self):
+        results, errors = [], []
+
+        def resolve():
+            try:
+                results.append([mc.ItemTypes.resolve('mod:gizmo%d' % (_ % 5), 0)
+                                for _ in range(50)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=resolve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(id(_) for row in results for _ in row)), 5)
+        self.assertEqual(len(mc.ItemTypes._registry.all_items), 4 + 5)
+
+
+
+
+class ChunkCacheTestCase(TempDirTestCase):
+    analysis = ('test', 1)
+
+    def setUp(self):
+        super(ChunkCacheTestCase, self).setUp()
+        self.cache = mc.ChunkCache(self.path('cache.sqlite'), max_entries=10)
+
+    def tearDown(self):
+        self.cache.close()
+        super(ChunkCacheTestCase, self).tearDown()
+
+    def test_round_trip(self):
+        self.cache.put_many(0, self.analysis, [(0, 0, 100, {'stone': 3}), (1, 0, 100, None)])
+        self.assertEqual(self.cache.get_many(0, self.analysis, {(0, 0): 100, (1, 0): 100}),
+                         {(0, 0): {'stone': 3}, (1, 0): None})
+        self.assertEqual(self.cache.get_many(0, self.analysis, {}), {})
+        self.assertEqual(len(self.cache), 2)
+
+    def test_invalidation(self):
+        self.cache.put_many(0, self.analysis, [(0, 0, 100, 'a'), (1, 0, 100, 'b')])
+        stamps = {(0, 0): 200, (1, 0): 100}
+        self.assertEqual(self.cache.get_many(0, self.analysis, stamps), {(1, 0): 'b'})
+        self.assertEqual(self.cache.get_many(-1, self.analysis, stamps), {})
+        self.assertEqual(self.cache.get_many(0, ('test', 2), stamps), {})
+        self.assertEqual(self.cache.get_many(0, ('other', 1), stamps), {})
+
+        self.cache.put_many(0, ('other', 1), [(1, 0, 100, 'c')])
+        self.cache.clear('test')
+        self.assertEqual(self.cache.get_many(0, self.analysis, stamps), {})
+        self.assertEqual(self.cache.get_many(0, ('other', 1), stamps), {(1, 0): 'c'})
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_eviction(self):
+        self.cache.put_many(0, self.analysis, [(cx, 0, 1, cx) for cx in range(10)])
+        recent = {(cx, 0): 1 for cx in range(3)}
+        self.assertEqual(len(self.cache.get_many(0, self.analysis, recent)), 3)
+        self.cache.put_many(0, self.analysis, [(cx, 0, 1, cx) for cx in range(10, 12)])
+
+        self.assertEqual(len(self.cache), 9)
+        recent.update({(10, 0): 1, (11, 0): 1})
+        self.assertEqual(len(self.cache.get_many(0, self.analysis, recent)), 5)
+
+    def test_format_change(self):
+        self.cache.put_many(0, self.analysis, [(0, 0, 100, 'a')])
+        self.cache.close()
+        self.cache = mc.ChunkCache(self.path('cache.sqlite'))
+        self.assertEqual(len(self.cache), 1)
+        self.cache.db.execute("PRAGMA user_version = 0")
+        self.cache.close()
+        self.cache = mc.ChunkCache(self.path('cache.sqlite'))
+        self.assertEqual(len(self.cache), 0)
+
+
+
+
+@requires_pymclevel
+class CachedScanTestCase(WorldTestCase):
+    def test_map_chunks_cache(self):
+        self.write_chunks({(0, 0): (chunk(0, 0), 100), (1, 0): (chunk(1, 0), 100)})
+        world = self.world()
+        cache = world.chunk_cache()
+        calls = []
+
+        def scan():
+            def func(cx, cz, tag):
+                calls.append((cx, cz))
+                return cx * 10
+            del calls[:]
+            return sorted(world.map_chunks(func, 0, progress=False,
+                                           cache=cache, analysis=('tens', 1)))
+
+        self.assertEqual(scan(), [(0, 0, 0), (1, 0, 10)])
+        self.assertEqual(sorted(calls), [(0, 0), (1, 0)])
+        self.assertEqual(scan(), [(0, 0, 0), (1, 0, 10)])
+        self.assertEqual(calls, [])
+
+        # Only the rewritten chunk, with a new timestamp, is processed again
+        region = mc.RegionFile(osp.join(self.worlddir, 'region', 'r.0.0.mca'))
+        region.save({(1, 0): region.compress(nbt.load(buf=dumps(chunk(1, 0))))}, 200)
+        self.assertEqual(scan(), [(0, 0, 0), (1, 0, 10)])
+        self.assertEqual(calls, [(1, 0)])
+
+        self.assertRaises(ValueError, list, world.map_chunks(len, 0, cache=cache))
+        cache.close()
+
+
+
+
+@requires_pymclevel
+class CheckpointTestCase(WorldTestCase):
+    def test_checkpoint_rerun_after_complete(self):
+        self.write_chunks({(0, 0): (chunk(0, 0), 1), (1, 0): (chunk(1, 0), 1)})
+        world = self.world()
+
+        def scan(checkpoint):
+            chunks = []
+            for cx, cz, _ in world.map_chunks(lambda cx, cz, nbt: True,
+                                              progress=False,
+                                              checkpoint=checkpoint):
+                chunks.append((cx, cz))
+                checkpoint.state.append((cx, cz))
+            self.assertTrue(checkpoint.complete)
+            self.assertEqual(sorted(chunks), [(0, 0), (1, 0)])
+            self.assertEqual(sorted(checkpoint.state), [(0, 0), (1, 0)])
+
+        checkpoint = world.checkpoint('test', state=[])
+        scan(checkpoint)
+        scan(checkpoint)  # Same object, its initial state was changed in place
+        scan(world.checkpoint('test', state=[]))  # Loaded from file
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()